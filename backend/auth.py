@@ -2,17 +2,20 @@
 认证相关工具函数
 包含JWT令牌生成/验证、密码加密/验证等功能
 """
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime, timedelta
-from typing import Optional
+from typing import Callable, Iterable, Optional
 from jose import JWTError, jwt
 from fastapi import Depends, HTTPException, status, Query
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
-from models.admin import RolePermission, Permission
 from models.admin import User, LoginLog
 from schemas import TokenData
 from config import settings
+from permission_registry import permission_registry
 import ipaddress
 import asyncio
+import time
 import bcrypt
 
 
@@ -20,6 +23,172 @@ import bcrypt
 security = HTTPBearer()
 
 
+class UserContextCache:
+    """
+    已解析用户上下文的缓存（按工号，LRU + TTL）
+    - 缓存用户行快照，每次取出时构造新的User实例，请求之间互不影响
+    - 角色、分组、密码变化以及删除用户的接口显式失效对应条目
+    - TTL兜底其他worker进程的修改
+    """
+
+    def __init__(self, ttl: float = settings.USER_CONTEXT_CACHE_TTL, max_size: int = settings.USER_CONTEXT_CACHE_SIZE):
+        self.ttl = ttl
+        self.max_size = max_size
+        self._entries: "OrderedDict[str, tuple]" = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+
+    def get(self, employee_id: str) -> Optional[User]:
+        entry = self._entries.get(employee_id)
+        if entry is None or entry[0] <= time.monotonic():
+            self._entries.pop(employee_id, None)
+            self.misses += 1
+            return None
+        self._entries.move_to_end(employee_id)
+        self.hits += 1
+        return User._init_from_db(**entry[1])
+
+    def put(self, user: User):
+        row = {column: getattr(user, field) for field, column in User._meta.fields_db_projection.items()}
+        self._entries[user.employee_id] = (time.monotonic() + self.ttl, row)
+        self._entries.move_to_end(user.employee_id)
+        while len(self._entries) > self.max_size:
+            self._entries.popitem(last=False)
+
+    def invalidate(self, employee_id: str):
+        if self._entries.pop(employee_id, None) is not None:
+            self.invalidations += 1
+
+    def invalidate_user_ids(self, user_ids: Iterable[int]):
+        """按用户ID失效（分组成员变化等只拿到用户ID的场景）"""
+        user_ids = set(user_ids)
+        for employee_id, (_, row) in list(self._entries.items()):
+            if row["id"] in user_ids:
+                self.invalidate(employee_id)
+
+    def clear(self):
+        self.invalidations += len(self._entries)
+        self._entries.clear()
+
+    def get_stats(self) -> dict:
+        return {
+            "size": len(self._entries),
+            "max_size": self.max_size,
+            "ttl": self.ttl,
+            "hits": self.hits,
+            "misses": self.misses,
+            "invalidations": self.invalidations,
+        }
+
+
+# 全局用户上下文缓存
+user_context_cache = UserContextCache()
+
+
+class PasswordHasher:
+    """
+    bcrypt计算执行器
+    bcrypt单次计算在百毫秒量级且是同步调用，直接在异步接口中执行会阻塞事件循环，
+    登录高峰时所有请求（包括SSE推送）都会被拖慢。这里把计算放到专用线程池（bcrypt计算期间释放GIL，线程间可并行），
+    执行中与排队中的任务合计达到 线程数+队列长度 时立即返回429，不让积压无限增长。
+    workers为0时在事件循环中同步计算。
+    """
+
+    def __init__(self, workers: int = settings.PASSWORD_HASH_WORKERS, queue_size: int = settings.PASSWORD_HASH_QUEUE_SIZE):
+        self.workers = workers
+        self.max_pending = workers + queue_size
+        self.pending = 0
+        self.completed = 0
+        self.rejected = 0
+        self._executor: Optional[ThreadPoolExecutor] = None
+
+    def _get_executor(self) -> ThreadPoolExecutor:
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="bcrypt")
+        return self._executor
+
+    def _release(self):
+        self.pending -= 1
+        self.completed += 1
+
+    async def run(self, func: Callable, *args):
+        if self.workers <= 0:
+            return func(*args)
+        if self.pending >= self.max_pending:
+            self.rejected += 1
+            raise HTTPException(
+                status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+                detail="服务繁忙，请稍后重试",
+                headers={"Retry-After": "1"}
+            )
+        loop = asyncio.get_running_loop()
+        self.pending += 1
+        # 计数在任务真正结束时释放：请求被取消时，已提交的计算仍会占用线程
+        future = self._get_executor().submit(func, *args)
+        future.add_done_callback(lambda _: loop.call_soon_threadsafe(self._release))
+        return await asyncio.wrap_future(future)
+
+    def shutdown(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+
+    def get_stats(self) -> dict:
+        return {
+            "workers": self.workers,
+            "max_pending": self.max_pending,
+            "pending": self.pending,
+            "completed": self.completed,
+            "rejected": self.rejected,
+        }
+
+
+# 全局密码哈希执行器实例
+password_hasher = PasswordHasher()
+
+
+class LoginAdmission:
+    """
+    登录并发准入（用作路由依赖）
+    同时处理中的登录请求达到上限时直接返回429，让客户端稍后重试，而不是在线程池前排长队。
+    max_concurrent为0时不限制。
+    """
+
+    def __init__(self, max_concurrent: int = settings.LOGIN_MAX_CONCURRENT):
+        self.max_concurrent = max_concurrent
+        self.active = 0
+        self.admitted = 0
+        self.rejected = 0
+
+    async def __call__(self):
+        if self.max_concurrent > 0 and self.active >= self.max_concurrent:
+            self.rejected += 1
+            raise HTTPException(
+                status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+                detail="登录请求过多，请稍后重试",
+                headers={"Retry-After": "1"}
+            )
+        self.active += 1
+        self.admitted += 1
+        try:
+            yield
+        finally:
+            self.active -= 1
+
+    def get_stats(self) -> dict:
+        return {
+            "max_concurrent": self.max_concurrent,
+            "active": self.active,
+            "admitted": self.admitted,
+            "rejected": self.rejected,
+        }
+
+
+# 全局登录准入实例
+login_admission = LoginAdmission()
+
+
 class AuthManager:
     """认证管理器"""
 
@@ -39,6 +208,16 @@ class AuthManager:
         # 这里虽然是返回给数据库存储, 但是它貌似只能存str, 不能存bytes, 因此先decode
         return hashPassword.decode('utf-8')
 
+    @staticmethod
+    async def verify_password_async(plain_password: str, hashed_password: str) -> bool:
+        """在密码哈希线程池中验证密码，不阻塞事件循环"""
+        return await password_hasher.run(AuthManager.verify_password, plain_password, hashed_password)
+
+    @staticmethod
+    async def get_password_hash_async(password: str) -> str:
+        """在密码哈希线程池中生成密码哈希，不阻塞事件循环"""
+        return await password_hasher.run(AuthManager.get_password_hash, password)
+
     @staticmethod
     def create_access_token(data: dict, expires_delta: Optional[timedelta] = None) -> str:
         """创建访问令牌"""
@@ -76,7 +255,7 @@ class AuthManager:
             return None
 
         # 验证密码
-        if not AuthManager.verify_password(password, user.hashed_password):
+        if not await AuthManager.verify_password_async(password, user.hashed_password):
             return None
 
         return user
@@ -84,6 +263,16 @@ class AuthManager:
         #     return None
         # return user
 
+    @staticmethod
+    async def get_user_by_employee_id(employee_id: str) -> Optional[User]:
+        """按工号获取用户，优先读取用户上下文缓存"""
+        user = user_context_cache.get(employee_id)
+        if user is None:
+            user = await User.filter(employee_id=employee_id).first()
+            if user is not None:
+                user_context_cache.put(user)
+        return user
+
     @staticmethod
     async def get_current_user(credentials: HTTPAuthorizationCredentials = Depends(security)) -> User:
         """获取当前用户"""
@@ -96,7 +285,7 @@ class AuthManager:
         token_data = AuthManager.verify_token(credentials.credentials)
         if token_data is None:
             raise credentials_exception
-        user = await User.filter(employee_id=token_data.employee_id).first()
+        user = await AuthManager.get_user_by_employee_id(token_data.employee_id)
         if user is None:
             raise credentials_exception
 
@@ -113,7 +302,7 @@ class AuthManager:
         token_data = AuthManager.verify_token(token)
         if token_data is None:
             raise credentials_exception
-        user = await User.filter(employee_id=token_data.employee_id).first()
+        user = await AuthManager.get_user_by_employee_id(token_data.employee_id)
         if user is None:
             raise credentials_exception
 
@@ -140,15 +329,13 @@ class PermissionChecker:
         self.required_permission = required_permission
 
     async def __call__(self, current_user: User = Depends(AuthManager.get_current_user)) -> bool:
-        """检查用户是否有指定权限"""
+        """检查用户是否有指定权限（按角色权限位图判断）"""
         # 超级用户拥有所有权限
         if current_user.is_superuser:
             return True
 
-        # 查询用户权限
-        user_permissions = await self._get_user_permissions(current_user.id)
-
-        if self.required_permission not in user_permissions:
+        await permission_registry.ensure_fresh()
+        if not permission_registry.has_permission(current_user.role_id, self.required_permission):
             raise HTTPException(
                 status_code=status.HTTP_403_FORBIDDEN,
                 detail=f"Permission denied: {self.required_permission}"
@@ -156,21 +343,6 @@ class PermissionChecker:
 
         return True
 
-    async def _get_user_permissions(self, user_id: int) -> list:
-        """获取用户权限列表"""
-
-        # 获取用户信息
-        user = await User.filter(id=user_id).prefetch_related('role').first()
-        if not user or not user.role:
-            return []
-
-        # 通过用户角色获取权限
-        permissions = await Permission.filter(
-            permission_roles__role_id=user.role.id
-        ).values_list('code', flat=True)
-
-        return list(permissions)
-
 
 class LoginManager:
     """登录管理器"""
@@ -25,6 +25,56 @@ class Settings(BaseSettings):
     # 跨域配置
     CORS_ORIGINS: list = ["http://localhost:3000", "http://localhost:5173"]
 
+    # 连通性检测配置
+    # 探测后端：icmp（共享套接字的ICMP引擎，不可用时自动回退）/ subprocess（ping子进程）
+    CONNECTIVITY_PROBE_BACKEND: str = "icmp"
+    # 探测全局并发上限
+    CONNECTIVITY_MAX_CONCURRENCY: int = 200
+    # 每个VPN配置的探测并发上限（同一VPN下的设备共用隧道），0表示不限制
+    CONNECTIVITY_PER_VPN_CONCURRENCY: int = 0
+    # 自适应检测间隔（秒）：状态变化/抖动设备按最小间隔检测，稳定设备逐步退避至最大间隔
+    CONNECTIVITY_MIN_PROBE_INTERVAL: int = 5
+    CONNECTIVITY_MAX_PROBE_INTERVAL: int = 120
+    # 默认探测方式：icmp / tcp（TCP连接管理端口）/ any（ICMP不通时再尝试TCP），可按设备或VPN配置单独指定
+    CONNECTIVITY_DEFAULT_PROBE_METHOD: str = "icmp"
+    # TCP探测的默认端口（SSH/Telnet/NETCONF）与单次建连超时（秒）
+    CONNECTIVITY_TCP_PROBE_PORTS: list = [22, 23, 830]
+    CONNECTIVITY_TCP_PROBE_TIMEOUT: float = 1.0
+    # 探测历史保留时长（秒），也是支持的最长统计窗口；每个设备环形缓冲的容量按 保留时长/最小检测间隔 计算，
+    # 缓冲按实际样本增长，退避后的稳定设备占用远小于容量
+    CONNECTIVITY_HISTORY_RETENTION: int = 86400
+    # 多worker共享模式：通过文件锁选出唯一的检测进程，其余worker登记关注设备并读取共享结果
+    CONNECTIVITY_SHARED_MODE: bool = False
+    CONNECTIVITY_LOCK_FILE: str = "connectivity.lock"
+    # 无效IP清理：登录IP采集器（"模块:类名"，实现connectivity_manager.LoginIPCollector），为空时不执行清理
+    INVALID_IP_COLLECTOR: str = ""
+    # 同时采集的设备数上限，以及始终允许登录的IP（如运维跳板机）
+    INVALID_IP_CLEANUP_CONCURRENCY: int = 20
+    INVALID_IP_WHITELIST: list = []
+
+    # 设备目录缓存：本进程内的修改即时生效，每隔该秒数比对一次数据库中的版本号，发现其他worker的修改
+    CATALOG_CHECK_INTERVAL: float = 1.0
+    # 设备可见性索引：每隔该秒数比对一次数据库中的版本号，发现其他worker对分组关联/成员的修改
+    VISIBILITY_CHECK_INTERVAL: float = 1.0
+    # 设备列表按分组权限过滤时，对用户隐藏的设备不超过该数量则直接以NOT IN排除，否则改用子查询
+    VISIBILITY_INLINE_ID_LIMIT: int = 500
+
+    # 用户上下文缓存：认证时按工号缓存用户信息的有效期（秒，兜底其他worker的修改）与最大条目数
+    USER_CONTEXT_CACHE_TTL: int = 60
+    USER_CONTEXT_CACHE_SIZE: int = 1024
+    # 权限注册表：每隔该秒数比对一次数据库中的版本号，发现其他worker对角色权限的修改
+    PERMISSION_CHECK_INTERVAL: float = 1.0
+
+    # 密码哈希：bcrypt在专用线程池中计算的线程数（0表示在事件循环中同步计算），
+    # 执行中与排队中的任务合计超过 线程数+队列长度 时返回429
+    PASSWORD_HASH_WORKERS: int = 4
+    PASSWORD_HASH_QUEUE_SIZE: int = 64
+    # 登录准入：同时处理中的登录请求上限，超过时立即返回429（0表示不限制）
+    LOGIN_MAX_CONCURRENT: int = 32
+
+    # 快速JSON响应：开启后用预构建的TypeAdapter按文档结构校验直接返回的dict数据（开发期核对用，有额外开销）
+    FAST_JSON_VALIDATE: bool = False
+
     class Config:
         env_file = ".env"
 
@@ -3,15 +3,992 @@
 负责管理设备的ping检测、缓存结果、跟踪访问时间
 """
 import asyncio
+import bisect
+import importlib
+from abc import ABC, abstractmethod
+import math
+import random
 import subprocess
 import time
+from array import array
+from collections import defaultdict, deque
 from datetime import datetime, timedelta
-from typing import Dict, Set, Optional
+from itertools import compress, repeat
+from operator import sub
+from typing import Awaitable, Callable, Deque, Dict, List, Set, Optional, Tuple
 import logging
-from models.deviceModel import Device, DeviceAccessIP
+import os
+from tortoise.transactions import in_transaction
+from config import settings
+from models.deviceModel import Device, DeviceAccessIP, DeviceConnectivityInterest
+from utils.icmp_probe import icmp_engine, ping_host_rtt
+from utils.tcp_probe import tcp_probe_host
+from utils.etag import RESOURCE_DEVICES, bump_resource_version
+
+try:
+    import fcntl
+except ImportError:  # Windows下没有fcntl，共享模式退化为每个进程各自检测
+    fcntl = None
 
 logger = logging.getLogger(__name__)
 
+# 探测任务 (device_id, ip, vpn_config_id)
+ProbeJob = Tuple[int, str, Optional[int]]
+
+# 探测方式
+PROBE_METHOD_ICMP = "icmp"
+PROBE_METHOD_TCP = "tcp"
+PROBE_METHOD_ANY = "any"  # ICMP不通时再尝试TCP连接
+
+# 时延分档 {名称: (下限ms, 上限ms)}，上限为None表示不封顶；没有时延数据的设备归为unknown
+LATENCY_BANDS = {
+    "good": (0, 50),
+    "fair": (50, 150),
+    "poor": (150, None),
+}
+LATENCY_BAND_UNKNOWN = "unknown"
+
+
+def get_latency_band(rtt: Optional[float]) -> str:
+    """根据往返时延返回所属分档"""
+    if rtt is None:
+        return LATENCY_BAND_UNKNOWN
+    for name, (low, high) in LATENCY_BANDS.items():
+        if rtt >= low and (high is None or rtt < high):
+            return name
+    return LATENCY_BAND_UNKNOWN
+
+
+# 查询设备时一并取出的探测配置字段（设备级优先，其次VPN配置）
+PROBE_TARGET_FIELDS = ("probe_method", "probe_ports", "vpn_config__probe_method", "vpn_config__probe_ports")
+
+
+class ConnectivityProbe(ABC):
+    """连通性探测接口，按探测方式名称注册到ConnectivityManager；子类未实现probe时无法实例化"""
+
+    name = ""
+
+    @abstractmethod
+    async def probe(self, ip: str, ports: Optional[List[int]] = None) -> Optional[float]:
+        """
+        探测设备是否可达
+
+        Args:
+            ip: 设备IP地址
+            ports: 设备或VPN配置指定的端口，不需要端口的探测方式忽略该参数
+
+        Returns:
+            往返时延（毫秒），不可达时返回None
+        """
+
+
+class ICMPProbe(ConnectivityProbe):
+    """ICMP回显探测（共享套接字引擎，不可用时回退到ping子进程）"""
+
+    name = PROBE_METHOD_ICMP
+
+    def __init__(self, backend: str, timeout: int):
+        self.backend = backend
+        self.timeout = timeout
+
+    async def probe(self, ip: str, ports: Optional[List[int]] = None) -> Optional[float]:
+        return await ping_host_rtt(ip, self.timeout, self.backend)
+
+
+class TCPConnectProbe(ConnectivityProbe):
+    """TCP连接探测：任一管理端口建连成功即认为可达，适用于过滤ICMP的网段"""
+
+    name = PROBE_METHOD_TCP
+
+    def __init__(self, ports: List[int], timeout: float):
+        self.ports = ports
+        self.timeout = timeout
+
+    async def probe(self, ip: str, ports: Optional[List[int]] = None) -> Optional[float]:
+        return await tcp_probe_host(ip, ports or self.ports, self.timeout)
+
+
+class FallbackProbe(ConnectivityProbe):
+    """依次尝试多个探测方式，任一成功即认为可达"""
+
+    name = PROBE_METHOD_ANY
+
+    def __init__(self, probes: List[ConnectivityProbe]):
+        self.probes = probes
+
+    async def probe(self, ip: str, ports: Optional[List[int]] = None) -> Optional[float]:
+        for probe in self.probes:
+            rtt = await probe.probe(ip, ports)
+            if rtt is not None:
+                return rtt
+        return None
+
+
+class ProbeScheduler:
+    """
+    探测调度器
+    - 全局并发上限，避免一轮检测同时发起成千上万个探测
+    - 可选的按VPN配置并发上限（同一VPN下的设备共用一条隧道）
+    - 将一轮探测均匀分散到检测间隔内，并叠加随机抖动
+    """
+
+    def __init__(self, max_concurrency: int = 200, per_vpn_concurrency: int = 0,
+                 spread_ratio: float = 0.8, jitter_ratio: float = 0.5):
+        self.max_concurrency = max_concurrency  # 全局并发上限
+        self.per_vpn_concurrency = per_vpn_concurrency  # 每个VPN配置的并发上限，0表示不限制
+        self.vpn_concurrency_overrides: Dict[int, int] = {}  # 指定VPN配置的并发上限 {vpn_config_id: limit}
+        self.spread_ratio = spread_ratio  # 一轮探测占用检测间隔的比例
+        self.jitter_ratio = jitter_ratio  # 抖动幅度（相对单个探测时间槽）
+
+        self._global_semaphore: Optional[asyncio.Semaphore] = None
+        self._vpn_semaphores: Dict[int, asyncio.Semaphore] = {}
+
+        # 运行统计
+        self.backlog = 0  # 已到计划时间、等待并发名额的探测数
+        self.in_flight = 0  # 正在执行的探测数
+        self.pending = 0  # 本轮尚未到计划时间的探测数
+        self.last_round_size = 0
+        self.last_round_duration = 0.0
+        self.last_round_max_lag = 0.0  # 本轮探测实际开始时间相对计划时间的最大延迟（秒）
+        self.last_round_avg_lag = 0.0
+        self.rounds = 0
+
+    def _get_global_semaphore(self) -> asyncio.Semaphore:
+        if self._global_semaphore is None:
+            self._global_semaphore = asyncio.Semaphore(self.max_concurrency)
+        return self._global_semaphore
+
+    def _get_vpn_semaphore(self, vpn_config_id: Optional[int]) -> Optional[asyncio.Semaphore]:
+        if vpn_config_id is None:
+            return None
+        limit = self.vpn_concurrency_overrides.get(vpn_config_id, self.per_vpn_concurrency)
+        if not limit or limit <= 0:
+            return None
+        semaphore = self._vpn_semaphores.get(vpn_config_id)
+        if semaphore is None:
+            semaphore = asyncio.Semaphore(limit)
+            self._vpn_semaphores[vpn_config_id] = semaphore
+        return semaphore
+
+    async def run_one(self, job: ProbeJob, probe: Callable[[int, str], Awaitable]) -> float:
+        """
+        在并发限制下执行单个探测
+
+        Returns:
+            等待并发名额的时间（秒）
+        """
+        device_id, ip, vpn_config_id = job
+        vpn_semaphore = self._get_vpn_semaphore(vpn_config_id)
+        global_semaphore = self._get_global_semaphore()
+
+        wait_start = time.monotonic()
+        self.backlog += 1
+        try:
+            # 先占VPN名额再占全局名额，避免被某条隧道阻塞的探测占住全局名额
+            if vpn_semaphore is not None:
+                await vpn_semaphore.acquire()
+            try:
+                await global_semaphore.acquire()
+            except BaseException:
+                if vpn_semaphore is not None:
+                    vpn_semaphore.release()
+                raise
+        finally:
+            self.backlog -= 1
+        waited = time.monotonic() - wait_start
+
+        self.in_flight += 1
+        try:
+            await probe(device_id, ip)
+        finally:
+            self.in_flight -= 1
+            global_semaphore.release()
+            if vpn_semaphore is not None:
+                vpn_semaphore.release()
+        return waited
+
+    async def run_round(self, jobs: List[ProbeJob], probe: Callable[[int, str], Awaitable], interval: float):
+        """将一轮探测均匀分散到 interval * spread_ratio 秒内执行"""
+        if not jobs:
+            return
+
+        round_start = time.monotonic()
+        window = max(interval * self.spread_ratio, 0)
+        slot = window / len(jobs)
+        lags: List[float] = []
+
+        async def _run(offset: float, job: ProbeJob):
+            delay = round_start + offset - time.monotonic()
+            if delay > 0:
+                await asyncio.sleep(delay)
+            self.pending -= 1
+            planned = round_start + offset
+            started = time.monotonic()
+            waited = await self.run_one(job, probe)
+            lags.append(max(started - planned, 0) + waited)
+
+        tasks = []
+        self.pending = len(jobs)
+        for index, job in enumerate(jobs):
+            jitter = random.uniform(-slot, slot) * self.jitter_ratio / 2 if slot > 0 else 0
+            offset = min(max(index * slot + jitter, 0), window)
+            tasks.append(asyncio.create_task(_run(offset, job)))
+
+        try:
+            await asyncio.gather(*tasks, return_exceptions=True)
+        finally:
+            for task in tasks:
+                if not task.done():
+                    task.cancel()
+            self.pending = 0
+
+        self.rounds += 1
+        self.last_round_size = len(jobs)
+        self.last_round_duration = time.monotonic() - round_start
+        self.last_round_max_lag = max(lags) if lags else 0.0
+        self.last_round_avg_lag = sum(lags) / len(lags) if lags else 0.0
+
+    def get_stats(self) -> Dict:
+        """获取调度统计信息"""
+        return {
+            "max_concurrency": self.max_concurrency,
+            "per_vpn_concurrency": self.per_vpn_concurrency,
+            "backlog": self.backlog,
+            "in_flight": self.in_flight,
+            "pending": self.pending,
+            "rounds": self.rounds,
+            "last_round_size": self.last_round_size,
+            "last_round_duration": round(self.last_round_duration, 3),
+            "last_round_max_lag": round(self.last_round_max_lag, 3),
+            "last_round_avg_lag": round(self.last_round_avg_lag, 3),
+        }
+
+
+class ConnectivityWriteBuffer:
+    """
+    连通性结果写回缓冲（write-behind）
+    探测结果先写入内存，每轮检测结束后合并为一次批量UPDATE：
+    - 连通状态只在与数据库中的值不同时写入
+    - 检测时间戳和往返时延按较慢的节奏（timestamp_flush_interval）批量刷新
+    """
+
+    def __init__(self, timestamp_flush_interval: int = 60, batch_size: int = 500):
+        self.timestamp_flush_interval = timestamp_flush_interval  # 时间戳刷新间隔（秒）
+        self.batch_size = batch_size  # 单条UPDATE语句包含的最大设备数
+
+        # 待写入的最新结果 {device_id: (status, check_time, rtt)}
+        self._pending: Dict[int, Tuple[bool, datetime, Optional[float]]] = {}
+        # 已知的数据库中的连通状态 {device_id: status}
+        self._persisted_status: Dict[int, bool] = {}
+        self._last_timestamp_flush = time.monotonic()
+        self._lock = asyncio.Lock()
+
+        # 运行统计
+        self.flush_count = 0
+        self.last_flush_rows = 0
+
+    def seed_persisted_status(self, device_id: int, status: bool):
+        """记录数据库中已有的连通状态（仅在未知时），避免首次检测时整表重写"""
+        self._persisted_status.setdefault(device_id, bool(status))
+
+    def record(self, device_id: int, status: bool, check_time: datetime, rtt: Optional[float] = None):
+        """记录一次探测结果"""
+        self._pending[device_id] = (status, check_time, rtt)
+
+    @property
+    def pending_count(self) -> int:
+        return len(self._pending)
+
+    async def flush(self, force: bool = False) -> int:
+        """
+        将缓冲结果写入数据库
+
+        Args:
+            force: 是否强制写入全部时间戳（关闭服务时使用）
+
+        Returns:
+            写入的设备数
+        """
+        async with self._lock:
+            if not self._pending:
+                return 0
+
+            now = time.monotonic()
+            flush_timestamps = force or (now - self._last_timestamp_flush) >= self.timestamp_flush_interval
+            if flush_timestamps:
+                rows = dict(self._pending)
+            else:
+                # 只写状态发生变化的设备，其余结果继续留在缓冲中等待时间戳刷新
+                rows = {
+                    device_id: result for device_id, result in self._pending.items()
+                    if self._persisted_status.get(device_id) != result[0]
+                }
+            if not rows:
+                return 0
+
+            devices = [
+                Device(id=device_id, connectivity_status=status,
+                       last_ping_time=check_time, last_connectivity_check=check_time, last_rtt=rtt)
+                for device_id, (status, check_time, rtt) in rows.items()
+            ]
+            status_changed = any(
+                self._persisted_status.get(device_id) != status for device_id, (status, _, _) in rows.items())
+            async with in_transaction():
+                await Device.bulk_update(
+                    devices,
+                    fields=["connectivity_status", "last_ping_time", "last_connectivity_check", "last_rtt"],
+                    batch_size=self.batch_size
+                )
+                # 连通状态变化时使设备列表的ETag失效；仅时间戳/时延变化不递增，避免每次刷新都打破缓存
+                if status_changed:
+                    await bump_resource_version(RESOURCE_DEVICES)
+
+            for device_id, (status, _, _) in rows.items():
+                self._persisted_status[device_id] = status
+                # 写入期间可能有新结果进入缓冲，只移除已写入的那一次
+                if self._pending.get(device_id) == rows[device_id]:
+                    del self._pending[device_id]
+            if flush_timestamps:
+                self._last_timestamp_flush = now
+
+            self.flush_count += 1
+            self.last_flush_rows = len(rows)
+            return len(rows)
+
+    def get_stats(self) -> Dict:
+        """获取写回缓冲统计信息"""
+        return {
+            "pending": len(self._pending),
+            "flush_count": self.flush_count,
+            "last_flush_rows": self.last_flush_rows,
+            "timestamp_flush_interval": self.timestamp_flush_interval,
+        }
+
+
+class DeviceProbeState:
+    """单个设备的自适应检测状态"""
+
+    __slots__ = ("status", "interval", "next_due", "history", "pending_flips", "last_change")
+
+    def __init__(self, status: bool, interval: float, history_size: int):
+        self.status = status  # 经过滞回确认后的状态
+        self.interval = interval  # 当前检测间隔（秒）
+        self.next_due = 0.0  # 下次检测时间（monotonic）
+        self.history: Deque[bool] = deque(maxlen=history_size)  # 最近的原始检测结果
+        self.pending_flips = 0  # 与确认状态相反的连续检测次数
+        self.last_change: Optional[float] = None  # 最近一次状态翻转时间（monotonic）
+
+
+class AdaptiveProbePolicy:
+    """
+    自适应检测间隔策略
+    - 状态稳定的设备逐步退避，检测间隔按倍数增长直至上限
+    - 状态刚发生变化或待确认的设备使用最短间隔
+    - 记录最近的原始结果判断是否抖动，状态翻转需连续多次确认（滞回），抖动设备需要更多次确认
+    """
+
+    def __init__(self, base_interval: float = 10, min_interval: float = 5, max_interval: float = 120,
+                 backoff_factor: float = 1.5, history_size: int = 10, flap_threshold: int = 4,
+                 confirmations: int = 2, flap_confirmations: int = 3):
+        self.base_interval = base_interval  # 新设备的初始检测间隔（秒）
+        self.min_interval = min_interval  # 状态变化/抖动设备的检测间隔（秒）
+        self.max_interval = max_interval  # 稳定设备退避的间隔上限（秒）
+        self.backoff_factor = backoff_factor  # 每次结果与确认状态一致时的间隔增长倍数
+        self.history_size = history_size  # 保留的原始结果条数
+        self.flap_threshold = flap_threshold  # 历史中状态切换次数达到该值视为抖动
+        self.confirmations = confirmations  # 状态翻转所需的连续相反结果次数
+        self.flap_confirmations = flap_confirmations  # 抖动设备状态翻转所需的连续相反结果次数
+
+        self._states: Dict[int, DeviceProbeState] = {}
+
+        # 统计
+        self.last_due = 0
+        self.last_skipped = 0
+        self.suppressed_flips = 0  # 被滞回抑制的状态翻转次数
+
+    def _is_flapping(self, state: DeviceProbeState) -> bool:
+        history = state.history
+        transitions = sum(1 for i in range(1, len(history)) if history[i] != history[i - 1])
+        return transitions >= self.flap_threshold
+
+    def observe(self, device_id: int, raw_status: bool, now: Optional[float] = None) -> bool:
+        """
+        记录一次原始检测结果，更新检测间隔
+
+        Returns:
+            经过滞回确认后的设备状态
+        """
+        now = time.monotonic() if now is None else now
+        state = self._states.get(device_id)
+        if state is None:
+            # 首次检测直接采用结果
+            state = DeviceProbeState(raw_status, self.base_interval, self.history_size)
+            state.history.append(raw_status)
+            state.next_due = now + state.interval
+            self._states[device_id] = state
+            return raw_status
+
+        state.history.append(raw_status)
+        flapping = self._is_flapping(state)
+
+        if raw_status == state.status:
+            state.pending_flips = 0
+            if flapping:
+                state.interval = self.min_interval
+            else:
+                state.interval = min(max(state.interval, self.min_interval) * self.backoff_factor,
+                                     self.max_interval)
+        else:
+            state.pending_flips += 1
+            required = self.flap_confirmations if flapping else self.confirmations
+            if state.pending_flips >= required:
+                state.status = raw_status
+                state.pending_flips = 0
+                state.last_change = now
+            else:
+                self.suppressed_flips += 1
+            # 刚翻转或待确认，尽快复查
+            state.interval = self.min_interval
+
+        state.next_due = now + state.interval
+        return state.status
+
+    def due(self, device_ids, now: Optional[float] = None) -> List[int]:
+        """筛选已到检测时间的设备（未检测过的设备总是到期）"""
+        now = time.monotonic() if now is None else now
+        due = []
+        for device_id in device_ids:
+            state = self._states.get(device_id)
+            if state is None or state.next_due <= now:
+                due.append(device_id)
+        self.last_due = len(due)
+        self.last_skipped = len(device_ids) - len(due)
+        return due
+
+    def get_interval(self, device_id: int) -> Optional[float]:
+        """设备当前的检测间隔，未检测过时返回None"""
+        state = self._states.get(device_id)
+        return state.interval if state else None
+
+    def forget(self, device_id: int):
+        self._states.pop(device_id, None)
+
+    def get_stats(self) -> Dict:
+        states = list(self._states.values())
+        return {
+            "tracked": len(states),
+            "flapping": sum(1 for state in states if self._is_flapping(state)),
+            "pending_flips": sum(1 for state in states if state.pending_flips),
+            "avg_interval": round(sum(state.interval for state in states) / len(states), 2) if states else 0,
+            "last_due": self.last_due,
+            "last_skipped": self.last_skipped,
+            "suppressed_flips": self.suppressed_flips
+        }
+
+
+class DeviceProbeHistory:
+    """
+    单个设备的探测历史环形缓冲
+    时间戳、成功标志、往返时延分别存放在紧凑的array中（每条样本9字节），写满后覆盖最旧的样本
+    """
+
+    __slots__ = ("capacity", "timestamps", "success", "rtts", "head")
+
+    def __init__(self, capacity: int):
+        self.capacity = capacity
+        self.timestamps = array("I")  # 探测时间（Unix秒）
+        self.success = array("B")  # 原始探测结果 1/0
+        self.rtts = array("f")  # 往返时延（毫秒），失败时为0
+        self.head = 0  # 写满后下一个覆盖的位置，即最旧样本的位置
+
+    def append(self, timestamp: int, success: bool, rtt: Optional[float]):
+        if len(self.timestamps) < self.capacity:
+            self.timestamps.append(timestamp)
+            self.success.append(1 if success else 0)
+            self.rtts.append(rtt or 0.0)
+            return
+        head = self.head
+        self.timestamps[head] = timestamp
+        self.success[head] = 1 if success else 0
+        self.rtts[head] = rtt or 0.0
+        self.head = (head + 1) % self.capacity
+
+    def oldest(self) -> Optional[int]:
+        """最旧的保留样本的时间戳"""
+        if not self.timestamps:
+            return None
+        return self.timestamps[self.head if len(self.timestamps) == self.capacity else 0]
+
+    def window(self, since: int) -> Tuple[array, array, array]:
+        """按时间顺序返回since之后的样本（各列分别为array切片）"""
+        if len(self.timestamps) < self.capacity or self.head == 0:
+            segments = [(0, len(self.timestamps))]
+        else:
+            segments = [(self.head, self.capacity), (0, self.head)]
+        timestamps, success, rtts = array("I"), array("B"), array("f")
+        for lo, hi in segments:
+            # 每个分段内时间戳有序，二分定位窗口起点
+            start = bisect.bisect_left(self.timestamps, since, lo, hi)
+            timestamps += self.timestamps[start:hi]
+            success += self.success[start:hi]
+            rtts += self.rtts[start:hi]
+        return timestamps, success, rtts
+
+
+def _percentile(sorted_values: List[float], q: float) -> Optional[float]:
+    """最近秩法计算分位数"""
+    if not sorted_values:
+        return None
+    index = min(len(sorted_values) - 1, max(0, math.ceil(q * len(sorted_values)) - 1))
+    return sorted_values[index]
+
+
+class ConnectivityHistory:
+    """
+    全部设备的探测历史
+    统计时对窗口内的列做整体切片，用map/compress在C层完成差分、筛选和求和，不逐条构造字典
+    """
+
+    def __init__(self, capacity: int = 17281, max_gap: float = 300):
+        self.capacity = capacity  # 每个设备保留的样本数
+        self.max_gap = max_gap  # 计算在线时长时单个样本最多代表的秒数，避免检测停止期间被计入
+        self._devices: Dict[int, DeviceProbeHistory] = {}
+
+    def record(self, device_id: int, success: bool, rtt: Optional[float] = None,
+               timestamp: Optional[float] = None):
+        history = self._devices.get(device_id)
+        if history is None:
+            history = self._devices[device_id] = DeviceProbeHistory(self.capacity)
+        history.append(int(time.time() if timestamp is None else timestamp), success, rtt)
+
+    def summarize(self, device_id: int, window: int, now: Optional[float] = None,
+                  buckets: int = 0) -> Dict:
+        """
+        统计设备在最近window秒内的连通情况
+
+        Args:
+            device_id: 设备ID
+            window: 统计窗口（秒）
+            now: 当前时间（Unix秒），默认取当前时间
+            buckets: 将窗口等分的段数，大于0时返回每段的在线率用于趋势展示
+
+        Returns:
+            {"samples", "coverage", "truncated", "uptime", "loss_rate", "rtt_p50", "rtt_p95", "rtt_avg", "trend"}
+            uptime为按时长加权的在线百分比，loss_rate为失败探测占比；
+            coverage为统计实际覆盖的秒数（窗口内最早样本至今），truncated表示缓冲已覆盖掉窗口内较早的样本
+        """
+        now = int(time.time() if now is None else now)
+        since = now - window
+        history = self._devices.get(device_id)
+        timestamps, success, rtts = history.window(since) if history else (array("I"), array("B"), array("f"))
+        samples = len(timestamps)
+        summary = {
+            "samples": samples,
+            "coverage": 0,
+            "truncated": False,
+            "uptime": None,
+            "loss_rate": None,
+            "rtt_p50": None,
+            "rtt_p95": None,
+            "rtt_avg": None
+        }
+        if buckets > 0:
+            summary["trend"] = [None] * buckets
+        if not samples:
+            return summary
+
+        # 每个样本代表到下一个样本（最后一个到当前时间）为止的时长
+        durations = list(map(min, map(sub, timestamps[1:], timestamps), repeat(self.max_gap)))
+        durations.append(min(max(now - timestamps[-1], 0), self.max_gap))
+        total_time = sum(durations)
+        up_time = sum(compress(durations, success))
+        success_count = sum(success)
+        ok_rtts = sorted(compress(rtts, success))
+
+        summary["coverage"] = now - timestamps[0]
+        # 缓冲写满且最旧的保留样本晚于窗口起点：窗口前段的样本已被覆盖，统计只代表coverage这段时间
+        summary["truncated"] = len(history.timestamps) == history.capacity and history.oldest() > since
+        summary["uptime"] = round(up_time / total_time * 100, 2) if total_time else round(
+            success_count / samples * 100, 2)
+        summary["loss_rate"] = round(1 - success_count / samples, 4)
+        if ok_rtts:
+            summary["rtt_p50"] = round(_percentile(ok_rtts, 0.5), 2)
+            summary["rtt_p95"] = round(_percentile(ok_rtts, 0.95), 2)
+            summary["rtt_avg"] = round(sum(ok_rtts) / len(ok_rtts), 2)
+
+        if buckets > 0:
+            bucket_size = window / buckets
+            totals = [0] * buckets
+            ups = [0] * buckets
+            for timestamp, ok in zip(timestamps, success):
+                index = min(int((timestamp - since) / bucket_size), buckets - 1)
+                totals[index] += 1
+                ups[index] += ok
+            summary["trend"] = [round(up / total * 100, 2) if total else None for up, total in zip(ups, totals)]
+        return summary
+
+    def forget(self, device_id: int):
+        self._devices.pop(device_id, None)
+
+    def get_stats(self) -> Dict:
+        samples = sum(len(history.timestamps) for history in self._devices.values())
+        return {
+            "devices": len(self._devices),
+            "samples": samples,
+            "capacity": self.capacity,
+            # 时间戳4字节 + 成功标志1字节 + 时延4字节
+            "approx_bytes": samples * 9
+        }
+
+
+def _age_seconds(value: Optional[datetime]) -> Optional[float]:
+    """距当前时间的秒数，兼容数据库返回的带时区时间"""
+    if value is None:
+        return None
+    return (datetime.now(value.tzinfo) - value).total_seconds()
+
+
+class SharedConnectivityStore:
+    """
+    多worker共享的连通性状态
+    - 通过文件锁选出唯一持有检测权的进程（owner），进程退出后锁自动释放，由其他worker接管
+    - 其余worker不检测，把被访问的设备登记到关注表，由owner合并进活跃检测列表
+    - 其余worker从devices表读取owner批量写回的检测结果，带短期本地缓存
+    """
+
+    def __init__(self, lock_path: str, read_ttl: float = 2.0, interest_flush_interval: float = 2.0):
+        self.lock_path = lock_path
+        self.read_ttl = read_ttl  # 本地读缓存有效期（秒）
+        self.interest_flush_interval = interest_flush_interval  # 关注登记写入间隔（秒）
+        self.is_owner = False
+        self._lock_fd: Optional[int] = None
+        # 待写入的关注登记 {device_id: last_access}
+        self._interest: Dict[int, datetime] = {}
+        # 本地读缓存 {device_id: (读取时间monotonic, 状态)}
+        self._read_cache: Dict[int, Tuple[float, Dict]] = {}
+
+        # 统计
+        self.interest_flushes = 0
+        self.shared_reads = 0
+
+    def try_acquire(self) -> bool:
+        """尝试获取检测权（非阻塞）"""
+        if self.is_owner:
+            return True
+        if fcntl is None:
+            logger.warning("当前平台不支持文件锁，连通性共享模式不可用，本进程直接执行检测")
+            self.is_owner = True
+            return True
+        fd = os.open(self.lock_path, os.O_RDWR | os.O_CREAT, 0o644)
+        try:
+            fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            os.close(fd)
+            return False
+        os.ftruncate(fd, 0)
+        os.write(fd, str(os.getpid()).encode())
+        self._lock_fd = fd
+        self.is_owner = True
+        self._read_cache.clear()
+        return True
+
+    def release(self):
+        if self._lock_fd is not None:
+            try:
+                fcntl.flock(self._lock_fd, fcntl.LOCK_UN)
+            finally:
+                os.close(self._lock_fd)
+            self._lock_fd = None
+        self.is_owner = False
+
+    def register_interest(self, device_ids: List[int]):
+        now = datetime.now()
+        for device_id in device_ids:
+            self._interest[device_id] = now
+
+    async def flush_interest(self) -> int:
+        """将本进程的关注登记批量写入关注表"""
+        if not self._interest:
+            return 0
+        pending, self._interest = self._interest, {}
+        try:
+            await DeviceConnectivityInterest.bulk_create(
+                [DeviceConnectivityInterest(device_id=device_id, last_access=last_access)
+                 for device_id, last_access in pending.items()],
+                on_conflict=["device_id"],
+                update_fields=["last_access"]
+            )
+        except Exception:
+            # 写入失败时保留登记，下次重试（期间的新登记优先）
+            for device_id, last_access in pending.items():
+                self._interest.setdefault(device_id, last_access)
+            raise
+        self.interest_flushes += 1
+        return len(pending)
+
+    async def load_interest(self, since: datetime) -> List[Dict]:
+        """读取since之后被其他worker访问过的设备"""
+        return await DeviceConnectivityInterest.filter(last_access__gte=since).values("device_id", "last_access")
+
+    async def purge_interest(self, before: datetime):
+        await DeviceConnectivityInterest.filter(last_access__lt=before).delete()
+
+    async def read_status(self, device_ids: List[int], stale_after: float) -> Dict[int, Dict]:
+        """
+        读取owner写回的检测结果
+
+        Returns:
+            {device_id: {"status", "last_check", "last_ping", "stale"}}，不存在的设备不出现在结果中
+        """
+        now = time.monotonic()
+        results = {}
+        missing = []
+        for device_id in device_ids:
+            cached = self._read_cache.get(device_id)
+            if cached and now - cached[0] < self.read_ttl:
+                results[device_id] = cached[1]
+            else:
+                missing.append(device_id)
+
+        if missing:
+            rows = await Device.filter(id__in=missing).values(
+                "id", "connectivity_status", "last_connectivity_check", "last_ping_time", "last_rtt")
+            self.shared_reads += 1
+            for row in rows:
+                age = _age_seconds(row["last_connectivity_check"])
+                status = {
+                    "status": row["connectivity_status"],
+                    "last_check": row["last_connectivity_check"],
+                    "last_ping": row["last_ping_time"],
+                    "rtt": row["last_rtt"],
+                    "stale": age is None or age > stale_after
+                }
+                self._read_cache[row["id"]] = (now, status)
+                results[row["id"]] = status
+        return results
+
+    def get_stats(self) -> Dict:
+        return {
+            "is_owner": self.is_owner,
+            "pid": os.getpid(),
+            "pending_interest": len(self._interest),
+            "interest_flushes": self.interest_flushes,
+            "read_cache": len(self._read_cache),
+            "shared_reads": self.shared_reads
+        }
+
+
+class LoginIPCollector(ABC):
+    """
+    设备登录IP采集接口
+    实现方通过下发命令等方式获取设备当前的登录来源IP，并踢除无效IP的会话。
+    通过配置INVALID_IP_COLLECTOR（"模块:类名"）或set_ip_collector接入，未接入时无效IP清理不执行。
+    """
+
+    @abstractmethod
+    async def collect(self, device: Dict) -> Optional[Set[str]]:
+        """
+        采集设备当前登录IP
+
+        Args:
+            device: {"id", "ip", "admin_username", "admin_password"}
+
+        Returns:
+            登录IP集合，返回None表示该设备不支持采集，本轮跳过
+        """
+
+    @abstractmethod
+    async def remove(self, targets: List[Tuple[Dict, Set[str]]]) -> Dict[int, int]:
+        """
+        批量清理无效登录会话，每轮只调用一次
+
+        Args:
+            targets: [(设备, 该设备上需要清理的登录IP集合)]
+
+        Returns:
+            {设备ID: 实际清理数量}
+        """
+
+
+def load_ip_collector(path: str) -> Optional[LoginIPCollector]:
+    """按 "模块:类名" 加载登录IP采集器，为空时返回None"""
+    if not path:
+        return None
+    module_name, _, class_name = path.partition(":")
+    collector_class = getattr(importlib.import_module(module_name), class_name)
+    return collector_class()
+
+
+class InvalidIPReconciler:
+    """
+    无效访问IP清理
+    - 两次查询取出全部连通设备及其访问IP记录
+    - 在并发上限内调用采集器获取各设备的登录IP
+    - 登录IP减去访问IP记录和白名单即为无效IP，汇总后一次性批量清理
+    - 记录每轮的扫描设备数、无效IP数和耗时
+    未配置采集器时不扫描，只在首次运行时记录一条日志说明清理未启用。
+    """
+
+    def __init__(self, collector: Optional[LoginIPCollector] = None, concurrency: int = 20,
+                 timeout: float = 30, whitelist: Optional[List[str]] = None, history_size: int = 20):
+        self.collector = collector
+        self.concurrency = concurrency  # 同时采集的设备数上限
+        self.timeout = timeout  # 单个设备采集的超时时间，以及批量清理的超时时间（秒）
+        self.whitelist = set(whitelist or [])  # 始终允许登录的IP
+        self.runs: Deque[Dict] = deque(maxlen=history_size)  # 最近几轮的统计
+        self._disabled_logged = False
+
+    @property
+    def enabled(self) -> bool:
+        return self.collector is not None
+
+    async def run(self) -> Optional[Dict]:
+        """执行一轮清理，未配置采集器时返回None"""
+        if not self.enabled:
+            if not self._disabled_logged:
+                logger.info("无效IP清理未启用：未配置登录IP采集器（INVALID_IP_COLLECTOR）")
+                self._disabled_logged = True
+            return None
+
+        start = time.monotonic()
+        stats = {
+            "started_at": datetime.now(),
+            "devices_scanned": 0,
+            "devices_collected": 0,
+            "devices_skipped": 0,
+            "collect_failures": 0,
+            "stale_ips_found": 0,
+            "stale_ips_removed": 0,
+            "remove_failed": False,
+            "duration": 0.0
+        }
+
+        devices = await Device.filter(connectivity_status=True).values(
+            "id", "ip", "admin_username", "admin_password")
+        stats["devices_scanned"] = len(devices)
+        targets: List[Tuple[Dict, Set[str]]] = []
+        if devices:
+            allowed: Dict[int, Set[str]] = defaultdict(set)
+            rows = await DeviceAccessIP.filter(device__connectivity_status=True).values("device_id", "vpn_ip")
+            for row in rows:
+                if row["vpn_ip"]:
+                    allowed[row["device_id"]].add(row["vpn_ip"])
+
+            semaphore = asyncio.Semaphore(self.concurrency)
+            results = await asyncio.gather(*(self._collect_stale(device, allowed[device["id"]], semaphore, stats)
+                                             for device in devices))
+            targets = [(device, stale) for device, stale in zip(devices, results) if stale]
+
+        if targets:
+            stats["stale_ips_found"] = sum(len(stale) for _, stale in targets)
+            try:
+                removed = await asyncio.wait_for(self.collector.remove(targets), timeout=self.timeout)
+                stats["stale_ips_removed"] = sum(removed.values())
+            except Exception as e:
+                stats["remove_failed"] = True
+                logger.warning(f"批量清理 {len(targets)} 台设备的无效IP失败: {e!r}")
+
+        stats["duration"] = round(time.monotonic() - start, 3)
+        self.runs.append(stats)
+        if stats["stale_ips_found"]:
+            logger.info(f"无效IP清理完成: 扫描 {stats['devices_scanned']} 台设备，"
+                        f"发现 {stats['stale_ips_found']} 个无效IP，清理 {stats['stale_ips_removed']} 个，"
+                        f"耗时 {stats['duration']}s")
+        return stats
+
+    async def _collect_stale(self, device: Dict, allowed: Set[str], semaphore: asyncio.Semaphore,
+                             stats: Dict) -> Set[str]:
+        """采集设备登录IP，返回其中的无效IP"""
+        async with semaphore:
+            try:
+                logged_in = await asyncio.wait_for(self.collector.collect(device), timeout=self.timeout)
+            except Exception as e:
+                stats["collect_failures"] += 1
+                logger.warning(f"采集设备 {device['id']} ({device['ip']}) 登录IP失败: {e!r}")
+                return set()
+        if logged_in is None:
+            stats["devices_skipped"] += 1
+            return set()
+        stats["devices_collected"] += 1
+        return set(logged_in) - allowed - self.whitelist
+
+    def get_stats(self) -> Dict:
+        return {
+            "enabled": self.enabled,
+            "collector": type(self.collector).__name__ if self.collector else None,
+            "last_run": self.runs[-1] if self.runs else None,
+            "runs": len(self.runs)
+        }
+
+
+class ConnectivitySubscriber:
+    """单个推送客户端：订阅的设备集合和有界事件队列"""
+
+    __slots__ = ("device_ids", "queue", "dropped")
+
+    def __init__(self, device_ids: Set[int], max_queue: int):
+        self.device_ids = device_ids
+        self.queue: asyncio.Queue = asyncio.Queue(maxsize=max_queue)
+        self.dropped = 0  # 队列满时丢弃的旧事件数
+
+    def offer(self, event: Dict):
+        """放入事件，队列满时丢弃最旧的事件，保证慢客户端不会拖累检测循环"""
+        if self.queue.full():
+            try:
+                self.queue.get_nowait()
+                self.dropped += 1
+            except asyncio.QueueEmpty:
+                pass
+        self.queue.put_nowait(event)
+
+
+class ConnectivityBroadcaster:
+    """
+    连通性状态变化推送
+    按设备建立订阅索引，状态翻转时只投递给订阅了该设备的客户端
+    """
+
+    def __init__(self, max_queue: int = 100):
+        self.max_queue = max_queue  # 每个客户端的事件队列长度
+        self._subscribers: Set[ConnectivitySubscriber] = set()
+        self._by_device: Dict[int, Set[ConnectivitySubscriber]] = defaultdict(set)
+        self.published = 0
+
+    def subscribe(self, device_ids: List[int]) -> ConnectivitySubscriber:
+        subscriber = ConnectivitySubscriber(set(device_ids), self.max_queue)
+        self._subscribers.add(subscriber)
+        for device_id in subscriber.device_ids:
+            self._by_device[device_id].add(subscriber)
+        return subscriber
+
+    def unsubscribe(self, subscriber: ConnectivitySubscriber):
+        self._subscribers.discard(subscriber)
+        for device_id in subscriber.device_ids:
+            subscribers = self._by_device.get(device_id)
+            if subscribers is not None:
+                subscribers.discard(subscriber)
+                if not subscribers:
+                    del self._by_device[device_id]
+
+    def subscribed_device_ids(self) -> List[int]:
+        return list(self._by_device)
+
+    def publish(self, device_id: int, event: Dict):
+        subscribers = self._by_device.get(device_id)
+        if not subscribers:
+            return
+        for subscriber in subscribers:
+            subscriber.offer(event)
+        self.published += 1
+
+    def get_stats(self) -> Dict:
+        return {
+            "subscribers": len(self._subscribers),
+            "subscribed_devices": len(self._by_device),
+            "published": self.published,
+            "dropped": sum(subscriber.dropped for subscriber in self._subscribers)
+        }
+
 
 class ConnectivityManager:
     """设备连通性检测管理器"""
@@ -32,13 +1009,149 @@ class ConnectivityManager:
         # 检测任务
         self.check_task: Optional[asyncio.Task] = None
 
+        # 进行中的单设备检测 {device_id: Task}，用于合并并发的缓存未命中
+        self.inflight_probes: Dict[int, asyncio.Task] = {}
+        self._batch_semaphore: Optional[asyncio.Semaphore] = None
+
         # 配置参数
-        self.ping_interval = 10  # ping检测间隔（秒）
+        self.ping_interval = 10  # ping检测间隔（秒），新设备的初始间隔
+        self.min_probe_interval = settings.CONNECTIVITY_MIN_PROBE_INTERVAL  # 状态变化设备的检测间隔，也是检测循环的节拍
+        self.max_probe_interval = settings.CONNECTIVITY_MAX_PROBE_INTERVAL  # 稳定设备退避的检测间隔上限
         self.access_timeout = 20  # 访问超时时间（秒）
         self.ping_timeout = 3  # ping超时时间（秒）
         self.cache_expire = 15  # 缓存过期时间（秒）
+        self.stale_while_revalidate = True  # 缓存过期时先返回旧值并在后台刷新
+        self.stale_max_age = 300  # 允许直接返回的旧值最大年龄（秒），超过后同步检测
+        self.batch_probe_concurrency = 50  # 批量获取状态时未命中设备的检测并发上限
         self.invalid_ip_cleanup_interval = 60  # 无效IP清理间隔（秒）
         self._last_invalid_ip_cleanup: Optional[datetime] = None
+        # 无效IP清理：采集器可通过set_ip_collector替换
+        self.ip_reconciler = InvalidIPReconciler(
+            collector=load_ip_collector(settings.INVALID_IP_COLLECTOR),
+            concurrency=settings.INVALID_IP_CLEANUP_CONCURRENCY,
+            whitelist=settings.INVALID_IP_WHITELIST
+        )
+        self.probe_backend = settings.CONNECTIVITY_PROBE_BACKEND  # 探测后端 icmp/subprocess
+
+        # 探测调度器：限制并发并将探测分散到检测间隔内
+        self.probe_scheduler = ProbeScheduler(
+            max_concurrency=settings.CONNECTIVITY_MAX_CONCURRENCY,
+            per_vpn_concurrency=settings.CONNECTIVITY_PER_VPN_CONCURRENCY
+        )
+
+        # 检测结果写回缓冲：每轮检测合并为一次批量写入
+        self.write_buffer = ConnectivityWriteBuffer()
+
+        # 探测方式 {name: ConnectivityProbe}，可通过register_probe扩展
+        icmp_probe = ICMPProbe(self.probe_backend, self.ping_timeout)
+        tcp_probe = TCPConnectProbe(list(settings.CONNECTIVITY_TCP_PROBE_PORTS),
+                                    settings.CONNECTIVITY_TCP_PROBE_TIMEOUT)
+        self.probes: Dict[str, ConnectivityProbe] = {}
+        for probe in (icmp_probe, tcp_probe, FallbackProbe([icmp_probe, tcp_probe])):
+            self.register_probe(probe)
+        self.default_probe_method = settings.CONNECTIVITY_DEFAULT_PROBE_METHOD
+        # 设备的探测配置 {device_id: (method, ports)}，随设备查询刷新
+        self.probe_targets: Dict[int, Tuple[str, Optional[List[int]]]] = {}
+
+        # 探测历史：每个设备一个环形缓冲，用于在线率、丢包率和时延分位数统计
+        # 容量按最长统计窗口内以最小间隔检测的样本数计算，抖动设备也能覆盖完整窗口
+        self.history_retention = settings.CONNECTIVITY_HISTORY_RETENTION
+        self.history = ConnectivityHistory(
+            capacity=math.ceil(self.history_retention / self.min_probe_interval) + 1,
+            max_gap=self.max_probe_interval + self.ping_timeout
+        )
+
+        # 自适应检测间隔：稳定设备退避，状态变化的设备加快检测，状态翻转带滞回
+        self.probe_policy = AdaptiveProbePolicy(
+            base_interval=self.ping_interval,
+            min_interval=self.min_probe_interval,
+            max_interval=self.max_probe_interval
+        )
+
+        # 多worker共享模式：只有持有检测权的进程检测，其余进程登记关注并读取共享结果
+        self.shared_mode = settings.CONNECTIVITY_SHARED_MODE
+        self.shared_store = SharedConnectivityStore(settings.CONNECTIVITY_LOCK_FILE)
+        self.interest_purge_interval = 600  # 清理过期关注登记的间隔（秒）
+        self._last_interest_purge: Optional[datetime] = None
+
+        # 状态变化推送：订阅的设备持续保持在活跃检测列表中
+        self.broadcaster = ConnectivityBroadcaster()
+        # 非owner进程上次读取到的订阅设备状态 {device_id: status}，用于发现状态变化
+        self._shared_seen_status: Dict[int, bool] = {}
+
+    @property
+    def is_owner(self) -> bool:
+        """本进程是否负责检测（非共享模式下总是负责）"""
+        return not self.shared_mode or self.shared_store.is_owner
+
+    def _shared_stale_after(self) -> float:
+        """非owner读取共享结果时，超过该秒数未刷新的结果标记为旧值"""
+        return self.write_buffer.timestamp_flush_interval + self.max_probe_interval + self.min_probe_interval
+
+    def register_probe(self, probe: ConnectivityProbe):
+        """注册探测方式，同名时覆盖"""
+        self.probes[probe.name] = probe
+
+    def _remember_probe_target(self, row: Dict):
+        """根据设备查询结果记录探测配置：设备级配置优先，其次VPN配置，最后全局默认"""
+        method = row.get("probe_method") or row.get("vpn_config__probe_method") or self.default_probe_method
+        ports = row.get("probe_ports") or row.get("vpn_config__probe_ports")
+        self.probe_targets[row["id"]] = (method, ports)
+
+    def invalidate_probe_target(self, device_id: int):
+        """设备或其VPN的探测配置变更后调用：清除缓存的探测配置和自适应状态，下一轮立即按新配置检测"""
+        self.probe_targets.pop(device_id, None)
+        self.probe_policy.forget(device_id)
+
+    def set_ip_collector(self, collector: Optional[LoginIPCollector]):
+        """设置无效IP清理使用的登录IP采集器，传None停用清理"""
+        self.ip_reconciler.collector = collector
+
+    def subscribe(self, device_ids: List[int]) -> ConnectivitySubscriber:
+        """订阅设备的状态变化，订阅期间设备保持在活跃检测列表中"""
+        subscriber = self.broadcaster.subscribe(device_ids)
+        self._touch_subscriptions(device_ids)
+        return subscriber
+
+    def unsubscribe(self, subscriber: ConnectivitySubscriber):
+        self.broadcaster.unsubscribe(subscriber)
+
+    def _touch_subscriptions(self, device_ids: Optional[List[int]] = None):
+        """刷新订阅设备的访问时间（非owner进程登记为关注）"""
+        if device_ids is None:
+            device_ids = self.broadcaster.subscribed_device_ids()
+        if not device_ids:
+            return
+        if not self.is_owner:
+            self.shared_store.register_interest(device_ids)
+            return
+        now = datetime.now()
+        for device_id in device_ids:
+            self.last_access_time[device_id] = now
+            self.active_devices.add(device_id)
+
+    @staticmethod
+    def _build_event(device_id: int, status: Dict) -> Dict:
+        return {
+            "device_id": device_id,
+            "status": status["status"],
+            "last_check": status.get("last_check"),
+            "rtt": status.get("rtt")
+        }
+
+    async def _poll_shared_subscriptions(self):
+        """非owner进程：读取订阅设备的共享结果，状态变化时推送"""
+        device_ids = self.broadcaster.subscribed_device_ids()
+        if not device_ids:
+            self._shared_seen_status.clear()
+            return
+        results = await self.shared_store.read_status(device_ids, self._shared_stale_after())
+        for device_id, status in results.items():
+            if self._shared_seen_status.get(device_id) != status["status"]:
+                self._shared_seen_status[device_id] = status["status"]
+                self.broadcaster.publish(device_id, self._build_event(device_id, status))
+        for device_id in set(self._shared_seen_status) - set(device_ids):
+            del self._shared_seen_status[device_id]
 
     async def start(self):
         """启动连通性检测服务"""
@@ -46,6 +1159,9 @@ class ConnectivityManager:
             return
 
         self.is_running = True
+        if self.shared_mode:
+            self.shared_store.try_acquire()
+            logger.info(f"连通性共享模式，本进程{'负责检测' if self.is_owner else '读取共享结果'}")
         self.check_task = asyncio.create_task(self._check_loop())
         logger.info("连通性检测管理器已启动")
 
@@ -58,6 +1174,17 @@ class ConnectivityManager:
                 await self.check_task
             except asyncio.CancelledError:
                 pass
+        # 关闭前写回缓冲中的全部结果（非owner写回关注登记）
+        try:
+            if self.is_owner:
+                await self.write_buffer.flush(force=True)
+            else:
+                await self.shared_store.flush_interest()
+        except Exception as e:
+            logger.error(f"关闭时写回连通性结果失败: {e}")
+        icmp_engine.close()
+        if self.shared_mode:
+            self.shared_store.release()
         logger.info("连通性检测管理器已停止")
 
     async def get_connectivity_status(self, device_id: int) -> Optional[Dict]:
@@ -68,8 +1195,15 @@ class ConnectivityManager:
             device_id: 设备ID
 
         Returns:
-            {"status": bool, "last_check": datetime} 或 None
+            {"status": bool, "last_check": datetime, "last_ping": datetime, "rtt": float, "stale": bool} 或 None
+            rtt为最近一次探测的往返时延（毫秒），不通时为None
+            stale为True表示返回的是过期缓存，后台正在刷新
         """
+        # 非owner进程不检测，登记关注后读取共享结果
+        if not self.is_owner:
+            self.shared_store.register_interest([device_id])
+            return (await self.shared_store.read_status([device_id], self._shared_stale_after())).get(device_id)
+
         # 更新访问时间
         self.last_access_time[device_id] = datetime.now()
 
@@ -80,50 +1214,181 @@ class ConnectivityManager:
         if device_id in self.connectivity_cache:
             cache_data = self.connectivity_cache[device_id]
             last_check = cache_data.get("last_check")
+            age = (datetime.now() - last_check).total_seconds() if last_check else None
 
             # 检查缓存是否过期
-            if last_check and (datetime.now() - last_check).total_seconds() < self.cache_expire:
-                return {
-                    "status": cache_data["status"],
-                    "last_check": last_check,
-                    "last_ping": cache_data.get("last_ping")
-                }
+            if age is not None and age < self._cache_ttl(device_id):
+                return self._build_status(cache_data, stale=False)
+
+            # 过期但未超过最大容忍时间：先返回旧值，后台刷新
+            if self.stale_while_revalidate and age is not None and age < self.stale_max_age:
+                self._probe_single_flight(device_id)
+                return self._build_status(cache_data, stale=True)
 
-        # 缓存不存在或已过期，触发立即检测
-        await self._ping_device_immediate(device_id)
+        # 缓存不存在或已过期，触发立即检测（同一设备的并发请求共享一次检测）
+        await asyncio.shield(self._probe_single_flight(device_id))
 
         # 返回检测结果
         if device_id in self.connectivity_cache:
-            cache_data = self.connectivity_cache[device_id]
-            return {
-                "status": cache_data["status"],
-                "last_check": cache_data.get("last_check"),
-                "last_ping": cache_data.get("last_ping")
-            }
+            return self._build_status(self.connectivity_cache[device_id], stale=False)
 
         return None
 
-    async def get_multiple_connectivity_status(self, device_ids: list) -> Dict[int, Dict]:
+    def _cache_ttl(self, device_id: int) -> float:
+        """
+        缓存有效期（秒）
+        检测循环按设备的自适应间隔刷新缓存，有效期随间隔放宽，避免访问稳定设备时频繁触发额外检测
+        """
+        interval = self.probe_policy.get_interval(device_id)
+        if interval is None or device_id not in self.active_devices:
+            return self.cache_expire
+        return max(self.cache_expire, interval + self.ping_timeout)
+
+    @staticmethod
+    def _build_status(cache_data: Dict, stale: bool) -> Dict:
+        """由缓存条目构造返回结果"""
+        return {
+            "status": cache_data["status"],
+            "last_check": cache_data.get("last_check"),
+            "last_ping": cache_data.get("last_ping"),
+            "rtt": cache_data.get("rtt"),
+            "stale": stale
+        }
+
+    def _probe_single_flight(self, device_id: int, ip: Optional[str] = None,
+                             limited: bool = False) -> asyncio.Task:
+        """
+        获取设备进行中的检测任务，不存在时创建
+        同一设备同一时刻只有一个检测在执行，并发调用方共享同一个任务
+
+        Args:
+            device_id: 设备ID
+            ip: 设备IP，为空时由任务自行查询
+            limited: 是否受批量检测并发上限约束
+        """
+        task = self.inflight_probes.get(device_id)
+        if task is None:
+            if ip is None:
+                task = asyncio.create_task(self._ping_device_immediate(device_id))
+            elif limited:
+                task = asyncio.create_task(self._ping_device_limited(device_id, ip))
+            else:
+                task = asyncio.create_task(self._ping_device(device_id, ip))
+            self.inflight_probes[device_id] = task
+            task.add_done_callback(lambda t, d=device_id: self._on_probe_done(d, t))
+        return task
+
+    def _on_probe_done(self, device_id: int, task: asyncio.Task):
+        if self.inflight_probes.get(device_id) is task:
+            del self.inflight_probes[device_id]
+        if not task.cancelled() and task.exception():
+            logger.error(f"设备 {device_id} 检测任务出错: {task.exception()}")
+
+    async def _ping_device_limited(self, device_id: int, ip: str):
+        """在批量检测并发上限内执行检测"""
+        if self._batch_semaphore is None:
+            self._batch_semaphore = asyncio.Semaphore(self.batch_probe_concurrency)
+        async with self._batch_semaphore:
+            await self._ping_device(device_id, ip)
+
+    async def _ping_device_coalesced(self, device_id: int, ip: str):
+        """周期检测使用：与用户触发的检测合并"""
+        await asyncio.shield(self._probe_single_flight(device_id, ip))
+
+    async def get_multiple_connectivity_status(self, device_ids: list,
+                                               deadline: Optional[float] = None) -> Dict[int, Dict]:
         """
         批量获取设备连通性状态
+        - 缓存命中直接返回；过期缓存先返回旧值并后台刷新
+        - 未命中的设备一次查询取出IP，在并发上限内同时检测
+        - 所有检测完成或超过deadline后立即返回，未完成的设备不出现在结果中
 
         Args:
             device_ids: 设备ID列表
+            deadline: 最长等待时间（秒），None表示等待全部检测完成
 
         Returns:
-            {device_id: {"status": bool, "last_check": datetime}}
+            {device_id: {"status": bool, "last_check": datetime, "last_ping": datetime, "stale": bool}}
         """
+        # 非owner进程不检测，登记关注后一次查询读取共享结果
+        if not self.is_owner:
+            self.shared_store.register_interest(device_ids)
+            return await self.shared_store.read_status(device_ids, self._shared_stale_after())
+
+        now = datetime.now()
         results = {}
+        misses: List[int] = []
+        refresh: List[int] = []
+
         for device_id in device_ids:
-            status = await self.get_connectivity_status(device_id)
-            if status:
-                results[device_id] = status
+            self.last_access_time[device_id] = now
+            self.active_devices.add(device_id)
+
+            cache_data = self.connectivity_cache.get(device_id)
+            last_check = cache_data.get("last_check") if cache_data else None
+            age = (now - last_check).total_seconds() if last_check else None
+            if age is not None and age < self._cache_ttl(device_id):
+                results[device_id] = self._build_status(cache_data, stale=False)
+            elif self.stale_while_revalidate and age is not None and age < self.stale_max_age:
+                results[device_id] = self._build_status(cache_data, stale=True)
+                refresh.append(device_id)
+            else:
+                misses.append(device_id)
+
+        # 已有进行中检测的设备直接复用，其余设备一次查询取出IP
+        need_ip = [d for d in refresh + misses if d not in self.inflight_probes]
+        ip_map = {}
+        if need_ip:
+            rows = await Device.filter(id__in=need_ip).values("id", "ip", *PROBE_TARGET_FIELDS)
+            for row in rows:
+                self._remember_probe_target(row)
+            ip_map = {row["id"]: row["ip"] for row in rows}
+
+        for device_id in refresh:
+            if device_id in self.inflight_probes or device_id in ip_map:
+                self._probe_single_flight(device_id, ip_map.get(device_id), limited=True)
+
+        miss_tasks = {}
+        for device_id in misses:
+            if device_id in self.inflight_probes or device_id in ip_map:
+                miss_tasks[device_id] = self._probe_single_flight(device_id, ip_map.get(device_id), limited=True)
+
+        if miss_tasks:
+            # asyncio.wait超时不会取消任务，未完成的检测继续在后台执行
+            await asyncio.wait(set(miss_tasks.values()), timeout=deadline)
+            for device_id in miss_tasks:
+                cache_data = self.connectivity_cache.get(device_id)
+                if not cache_data:
+                    continue
+                last_check = cache_data.get("last_check")
+                fresh = bool(last_check and
+                             (datetime.now() - last_check).total_seconds() < self._cache_ttl(device_id))
+                results[device_id] = self._build_status(cache_data, stale=not fresh)
+
         return results
 
     async def _check_loop(self):
         """连通性检测循环"""
         while self.is_running:
             try:
+                cycle_start = time.monotonic()
+
+                # 订阅中的设备保持活跃
+                self._touch_subscriptions()
+
+                # 非owner进程只写回关注登记、推送订阅设备的状态变化，并尝试接管退出的owner
+                if not self.is_owner:
+                    await self._poll_shared_subscriptions()
+                    await self.shared_store.flush_interest()
+                    if not self.shared_store.try_acquire():
+                        await asyncio.sleep(self.shared_store.interest_flush_interval)
+                        continue
+                    logger.info("原检测进程已退出，本进程接管连通性检测")
+
+                # 合并其他worker登记的关注设备
+                if self.shared_mode:
+                    await self._load_shared_interest()
+
                 # 清理长时间未访问的设备
                 await self._cleanup_inactive_devices()
 
@@ -131,15 +1396,19 @@ class ConnectivityManager:
                 if self.active_devices:
                     await self._ping_active_devices()
 
-                # 周期性清理可连通设备的无效IP（占位实现）
+                # 批量写回本轮检测结果
+                await self.write_buffer.flush()
+
+                # 周期性清理可连通设备的无效IP
                 now = datetime.now()
                 if (self._last_invalid_ip_cleanup is None or
                         (now - self._last_invalid_ip_cleanup).total_seconds() >= self.invalid_ip_cleanup_interval):
                     await self._cleanup_invalid_ips()
                     self._last_invalid_ip_cleanup = now
 
-                # 等待下次检测
-                await asyncio.sleep(self.ping_interval)
+                # 等待下一个节拍（探测已分散在节拍内，扣除本轮耗时以保持固定节奏）
+                elapsed = time.monotonic() - cycle_start
+                await asyncio.sleep(max(self.min_probe_interval - elapsed, 1))
 
             except asyncio.CancelledError:
                 break
@@ -147,6 +1416,25 @@ class ConnectivityManager:
                 logger.error(f"连通性检测循环出错: {e}")
                 await asyncio.sleep(1)
 
+    async def _load_shared_interest(self):
+        """将其他worker登记的关注设备合并进活跃检测列表，并定期清理过期登记"""
+        now = datetime.now()
+        rows = await self.shared_store.load_interest(now - timedelta(seconds=self.access_timeout))
+        for row in rows:
+            device_id = row["device_id"]
+            last_access = row["last_access"]
+            if last_access.tzinfo is not None:
+                last_access = last_access.astimezone().replace(tzinfo=None)
+            current = self.last_access_time.get(device_id)
+            if current is None or last_access > current:
+                self.last_access_time[device_id] = last_access
+            self.active_devices.add(device_id)
+
+        if (self._last_interest_purge is None or
+                (now - self._last_interest_purge).total_seconds() >= self.interest_purge_interval):
+            await self.shared_store.purge_interest(now - timedelta(seconds=self.interest_purge_interval))
+            self._last_interest_purge = now
+
     async def _cleanup_inactive_devices(self):
         """清理长时间未访问的设备"""
         current_time = datetime.now()
@@ -160,28 +1448,35 @@ class ConnectivityManager:
         for device_id in inactive_devices:
             self.active_devices.discard(device_id)
             self.last_access_time.pop(device_id, None)
+            self.probe_policy.forget(device_id)
+            self.probe_targets.pop(device_id, None)
             # 保留缓存一段时间，但不再主动检测
             logger.info(f"设备 {device_id} 长时间未访问，已从活跃检测列表中移除")
 
     async def _ping_active_devices(self):
-        """对活跃设备进行ping检测"""
-        # 获取需要检测的设备信息
-        devices = await Device.filter(id__in=list(self.active_devices))
+        """对活跃设备中已到检测时间的设备进行ping检测"""
+        due_ids = self.probe_policy.due(list(self.active_devices))
+        if not due_ids:
+            return
 
-        # 并发执行ping检测
-        tasks = []
+        # 获取需要检测的设备信息
+        devices = await Device.filter(id__in=due_ids).order_by("id").values(
+            "id", "ip", "vpn_config_id", "connectivity_status", *PROBE_TARGET_FIELDS)
         for device in devices:
-            task = asyncio.create_task(self._ping_device(device.id, device.ip))
-            tasks.append(task)
+            self.write_buffer.seed_persisted_status(device["id"], device["connectivity_status"])
+            self._remember_probe_target(device)
 
-        if tasks:
-            await asyncio.gather(*tasks, return_exceptions=True)
+        # 由调度器限流并均匀分散执行ping检测
+        jobs = [(device["id"], device["ip"], device["vpn_config_id"]) for device in devices]
+        await self.probe_scheduler.run_round(jobs, self._ping_device_coalesced, self.min_probe_interval)
 
     async def _ping_device_immediate(self, device_id: int):
         """立即对指定设备进行ping检测"""
-        device = await Device.filter(id=device_id).first()
+        device = await Device.filter(id=device_id).values("id", "ip", *PROBE_TARGET_FIELDS)
         if device:
-            await self._ping_device(device_id, device.ip)
+            self._remember_probe_target(device[0])
+            # 不占用调度器名额：周期检测可能在持有名额时等待该任务完成
+            await self._ping_device(device_id, device[0]["ip"])
 
     async def _ping_device(self, device_id: int, ip: str):
         """
@@ -191,74 +1486,54 @@ class ConnectivityManager:
             device_id: 设备ID
             ip: 设备IP地址
         """
+        method, ports = self.probe_targets.get(device_id, (self.default_probe_method, None))
+        probe = self.probes.get(method)
+        if probe is None:
+            logger.warning(f"设备 {device_id} 的探测方式 {method} 未注册，使用默认方式")
+            probe = self.probes[self.default_probe_method]
         try:
-            # 执行ping命令
-            process = await asyncio.create_subprocess_exec(
-                'ping', '-c', '1', '-W', str(self.ping_timeout), ip,
-                stdout=asyncio.subprocess.PIPE,
-                stderr=asyncio.subprocess.PIPE
-            )
-
-            # 等待ping完成
-            await asyncio.wait_for(process.wait(), timeout=self.ping_timeout + 2)
-
-            # 判断ping结果
-            is_connected = process.returncode == 0
-            current_time = datetime.now()
-
-            # 更新缓存
-            self.connectivity_cache[device_id] = {
-                "status": is_connected,
-                "last_check": current_time,
-                "last_ping": current_time
-            }
-
-            # 更新数据库中的连通性状态
-            await Device.filter(id=device_id).update(
-                connectivity_status=is_connected,
-                last_ping_time=current_time,
-                last_connectivity_check=current_time
-            )
+            # 按设备/VPN配置的探测方式检测
+            rtt = await probe.probe(ip, ports)
+            is_connected = rtt is not None
+            self._record_result(device_id, is_connected, rtt)
 
             logger.debug(
-                f"设备 {device_id} ({ip}) ping检测完成: {'连通' if is_connected else '不连通'}")
+                f"设备 {device_id} ({ip}) {probe.name}检测完成: {'连通' if is_connected else '不连通'}")
 
         except asyncio.TimeoutError:
             # ping超时，认为不连通
-            current_time = datetime.now()
-            self.connectivity_cache[device_id] = {
-                "status": False,
-                "last_check": current_time,
-                "last_ping": current_time
-            }
+            self._record_result(device_id, False)
             logger.warning(f"设备 {device_id} ({ip}) ping超时")
 
         except Exception as e:
             # ping出错，认为不连通
-            current_time = datetime.now()
-            self.connectivity_cache[device_id] = {
-                "status": False,
-                "last_check": current_time,
-                "last_ping": current_time
-            }
+            self._record_result(device_id, False)
             logger.error(f"设备 {device_id} ({ip}) ping检测出错: {e}")
 
-    async def _cleanup_invalid_ips(self):
+    def _record_result(self, device_id: int, is_connected: bool, rtt: Optional[float] = None):
         """
-        清理可连通设备的无效IP（占位实现）
-        当前仅打印采集动作和现有访问IP列表，未执行真实清理
+        更新缓存，并将结果放入写回缓冲（由检测循环批量写入数据库）
+        原始结果记入探测历史；再经过自适应策略的滞回确认，缓存和数据库中保存的是确认后的状态
         """
+        self.history.record(device_id, is_connected, rtt)
+        is_connected = self.probe_policy.observe(device_id, is_connected)
+        previous = self.connectivity_cache.get(device_id)
+        current_time = datetime.now()
+        self.connectivity_cache[device_id] = {
+            "status": is_connected,
+            "last_check": current_time,
+            "last_ping": current_time,
+            "rtt": round(rtt, 2) if rtt is not None else None
+        }
+        self.write_buffer.record(device_id, is_connected, current_time, self.connectivity_cache[device_id]["rtt"])
+        # 首次结果或状态翻转时推送给订阅者
+        if previous is None or previous["status"] != is_connected:
+            self.broadcaster.publish(device_id, self._build_event(device_id, self.connectivity_cache[device_id]))
+
+    async def _cleanup_invalid_ips(self):
+        """清理可连通设备上不在访问IP记录中的登录IP"""
         try:
-            # 只处理当前连通的设备
-            devices = await Device.filter(connectivity_status=True)
-            for device in devices:
-                # 模拟下发命令采集当前登录IP列表
-                print(f"[IP清理] 采集设备 {device.id} ({device.ip}) 登录IP列表（占位打印）")
-                # 读取持久化的访问IP记录
-                access_ips = await DeviceAccessIP.filter(device=device).values_list('vpn_ip', flat=True)
-                print(f"[IP清理] 设备 {device.id} 当前访问IP记录: {list(access_ips)}")
-                # 占位对比逻辑
-                print(f"[IP清理] 设备 {device.id} 登录IP与访问IP的对比结果（占位，未实际清理）")
+            await self.ip_reconciler.run()
         except Exception as e:
             logger.error(f"无效IP清理任务出错: {e}")
 
@@ -267,7 +1542,37 @@ class ConnectivityManager:
         return {
             "active_devices": list(self.active_devices),
             "cache_count": len(self.connectivity_cache),
-            "last_access_count": len(self.last_access_time)
+            "last_access_count": len(self.last_access_time),
+            "inflight_probes": len(self.inflight_probes),
+            "probe_scheduler": self.probe_scheduler.get_stats(),
+            "write_buffer": self.write_buffer.get_stats(),
+            "probe_policy": self.probe_policy.get_stats(),
+            "history": self.history.get_stats(),
+            "shared": self.shared_store.get_stats() if self.shared_mode else None,
+            "invalid_ip_cleanup": self.ip_reconciler.get_stats(),
+            "broadcaster": self.broadcaster.get_stats()
+        }
+
+    def get_history_summary(self, device_ids: List[int], windows: Dict[str, int],
+                            buckets: int = 0) -> Dict[int, Dict[str, Dict]]:
+        """
+        批量统计设备的历史连通情况（只读内存中的探测历史，不触发检测）
+
+        Args:
+            device_ids: 设备ID列表
+            windows: 统计窗口 {名称: 秒数}，如 {"1h": 3600, "24h": 86400}
+            buckets: 每个窗口的趋势分段数
+
+        Returns:
+            {device_id: {窗口名称: 统计结果}}
+        """
+        now = time.time()
+        return {
+            device_id: {
+                name: self.history.summarize(device_id, seconds, now=now, buckets=buckets)
+                for name, seconds in windows.items()
+            }
+            for device_id in device_ids
         }
 
 
@@ -3,10 +3,16 @@
 """
 from tortoise import Tortoise
 from tortoise.contrib.fastapi import register_tortoise
+from tortoise.expressions import Subquery
+from tortoise.transactions import in_transaction
 from config import settings
 from auth import AuthManager
 from models.admin import User, Role, Permission, RolePermission, Menu
 from models.groupModel import Group, GroupMember
+from models.deviceModel import Device, DeviceUsage, DeviceInternal
+from utils.etag import RESOURCE_DEVICES, bump_resource_version, ensure_resource_versions
+from device_config_index import device_config_index
+from utils.schema_upgrade import upgrade_schema
 
 
 # Tortoise ORM 配置
@@ -25,6 +31,12 @@ TORTOISE_ORM = {
 
 async def init_database():
     """初始化数据库"""
+    # 已有数据库补齐后续版本新增的列（generate_schemas不会修改已有的表）
+    await upgrade_schema()
+
+    # 条件GET使用的资源版本记录，需先于其他数据写入创建
+    await ensure_resource_versions()
+
     # 创建超级管理员用户（如果不存在）
     admin_user = await User.filter(employee_id="a12345678").first()
     if not admin_user:
@@ -295,9 +307,50 @@ async def init_database():
                 await RolePermission.create(role=super_admin_role, permission=permission)
                 print(f"✅ 为超级管理员角色分配权限: {permission.name}")
 
+    # 补齐缺失的设备伴生记录
+    await backfill_device_companions()
+
+    # 配置值全文索引（不可用时配置值搜索回退到LIKE）
+    await device_config_index.setup()
+
     print("✅ 数据库初始化完成")
 
 
+async def backfill_device_companions() -> dict:
+    """
+    为缺少使用情况/内部信息记录的设备批量补齐伴生记录
+    在一个事务内完成，读路径据此不再逐条检查并按需创建
+
+    Returns:
+        本次补齐的记录数 {"usage": int, "internal": int}
+    """
+    async with in_transaction():
+        missing_usage_ids = await Device.exclude(
+            id__in=Subquery(DeviceUsage.all().values("device_id"))
+        ).values_list("id", flat=True)
+        missing_internal_ids = await Device.exclude(
+            id__in=Subquery(DeviceInternal.all().values("device_id"))
+        ).values_list("id", flat=True)
+
+        if missing_usage_ids:
+            await DeviceUsage.bulk_create(
+                [DeviceUsage(device_id=device_id) for device_id in missing_usage_ids])
+        if missing_internal_ids:
+            internal_infos = []
+            for device_id in missing_internal_ids:
+                internal_info = DeviceInternal(device_id=device_id)
+                internal_info.init_ports()
+                internal_infos.append(internal_info)
+            await DeviceInternal.bulk_create(internal_infos)
+        # bulk_create不触发模型信号，显式递增版本使设备列表的ETag失效
+        if missing_usage_ids:
+            await bump_resource_version(RESOURCE_DEVICES)
+
+    if missing_usage_ids or missing_internal_ids:
+        print(f"✅ 补齐设备伴生记录: 使用情况 {len(missing_usage_ids)} 条, 内部信息 {len(missing_internal_ids)} 条")
+    return {"usage": len(missing_usage_ids), "internal": len(missing_internal_ids)}
+
+
 def setup_database(app):
     """设置数据库连接"""
     register_tortoise(
@@ -0,0 +1,249 @@
+"""
+设备目录缓存
+设备基本信息、VPN配置与设备分组关联一天只变化几次，却在每次列表、详情、连通性请求中反复查询。
+这里在进程内维护一份只读快照，增删改接口按对象增量失效并递增版本号，读路径直接查内存；
+目录内容的修改另行递增数据库中专用的device_catalog版本号，其他worker的修改据此发现。
+"""
+import asyncio
+import logging
+import time
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from tortoise.signals import post_delete, post_save
+
+from config import settings
+from models.deviceModel import Device
+from models.groupModel import Group, DeviceGroup
+from models.vpnModel import VPNConfig
+from utils.etag import RESOURCE_DEVICE_CATALOG, bump_resource_version, get_resource_version
+
+logger = logging.getLogger(__name__)
+
+# 快照中保留的设备字段（不含连通性等频繁变化的字段）
+DEVICE_FIELDS = (
+    "id", "name", "ip", "vpn_config_id", "required_vpn_display", "creator", "ftp_prefix",
+    "support_queue", "max_occupy_minutes", "owner", "admin_username", "admin_password",
+    "device_type", "form_type", "remarks", "probe_method", "probe_ports", "created_at", "updated_at",
+)
+VPN_CONFIG_FIELDS = ("id", "region", "network", "lns", "gw", "ip", "mask", "probe_method", "probe_ports")
+GROUP_FIELDS = ("id", "name", "description", "sort_order")
+# 修改时需要递增目录版本号的模型
+CATALOG_MODELS = (Device, VPNConfig, Group, DeviceGroup)
+
+
+class DeviceSnapshot:
+    """设备基本信息快照，字段与Device模型同名"""
+
+    __slots__ = DEVICE_FIELDS
+
+    def __init__(self, row: dict):
+        for field in self.__slots__:
+            setattr(self, field, row[field])
+
+
+class VPNConfigSnapshot:
+    """VPN配置快照，字段与VPNConfig模型同名"""
+
+    __slots__ = VPN_CONFIG_FIELDS
+
+    def __init__(self, row: dict):
+        for field in self.__slots__:
+            setattr(self, field, row[field])
+
+    @property
+    def display_name(self) -> str:
+        return f"{self.region} - {self.network}"
+
+
+class GroupSnapshot:
+    """分组快照，字段与Group模型同名"""
+
+    __slots__ = GROUP_FIELDS
+
+    def __init__(self, row: dict):
+        for field in self.__slots__:
+            setattr(self, field, row[field])
+
+
+class DeviceCatalog:
+    """
+    进程内设备目录
+    - 首次使用时一次性加载：设备、VPN配置、分组以及每台设备所属的分组ID
+    - 设备/VPN/分组的修改接口调用对应的invalidate_*方法增量刷新，并递增version
+    - 目录模型的保存/删除（及绕过信号的批量修改处显式调用bump_version）递增数据库中的目录版本号，
+      并记录本进程递增的次数
+    - 每隔check_interval秒比对一次版本号，超出本进程递增次数的部分来自其他worker，此时整体重新加载；
+      本进程自己的修改已由invalidate_*增量刷新，不触发重新加载
+    读取前需先await ensure_loaded()，之后的查询方法均为同步的内存查找。
+    """
+
+    def __init__(self, check_interval: float = settings.CATALOG_CHECK_INTERVAL):
+        self.check_interval = check_interval
+        self.devices: Dict[int, DeviceSnapshot] = {}
+        self.vpn_configs: Dict[int, VPNConfigSnapshot] = {}
+        self.groups: Dict[int, GroupSnapshot] = {}
+        self.device_group_ids: Dict[int, Tuple[int, ...]] = {}
+        # 每次内容变化（全量加载或增量失效）递增，可用于外部判断数据是否变化
+        self.version = 0
+        self.loaded_at: Optional[float] = None
+        # 最近一次比对时数据库中的目录版本号、此后本进程递增的次数，以及最近一次比对的时间
+        self.db_version: Optional[int] = None
+        self.local_bumps = 0
+        self.checked_at: Optional[float] = None
+        self._load_lock = asyncio.Lock()
+        self.full_loads = 0
+        self.invalidations = 0
+
+    def _is_fresh(self) -> bool:
+        return self.checked_at is not None and time.monotonic() - self.checked_at < self.check_interval
+
+    async def ensure_loaded(self):
+        """首次使用时加载；超过检查间隔时比对版本号，其他进程修改过时重新加载，并发调用只加载一次"""
+        if self._is_fresh():
+            return
+        async with self._load_lock:
+            if self._is_fresh():
+                return
+            # 先读版本再加载，加载期间其他worker的修改会使版本号与预期不符，下次检查时重新加载
+            # 本进程的递增与读取交错、或所在事务回滚时同样表现为不符，只会多加载一次，不会漏掉修改
+            version = await get_resource_version(RESOURCE_DEVICE_CATALOG)
+            expected = None if self.db_version is None else self.db_version + self.local_bumps
+            self.db_version = version
+            self.local_bumps = 0
+            if self.loaded_at is None or version != expected:
+                await self._load_all()
+            self.checked_at = time.monotonic()
+
+    async def bump_version(self):
+        """递增数据库中的目录版本号，并记为本进程的修改"""
+        self.local_bumps += 1
+        await bump_resource_version(RESOURCE_DEVICE_CATALOG)
+
+    async def _load_all(self):
+        device_rows = await Device.all().values(*DEVICE_FIELDS)
+        vpn_rows = await VPNConfig.all().values(*VPN_CONFIG_FIELDS)
+        group_rows = await Group.all().values(*GROUP_FIELDS)
+        links = await DeviceGroup.all().order_by("id").values_list("device_id", "group_id")
+
+        # 先构建完整的新快照再整体替换，读路径不会看到加载到一半的数据
+        self.devices = {row["id"]: DeviceSnapshot(row) for row in device_rows}
+        self.vpn_configs = {row["id"]: VPNConfigSnapshot(row) for row in vpn_rows}
+        self.groups = {row["id"]: GroupSnapshot(row) for row in group_rows}
+        self.device_group_ids = self._group_links(links)
+        self.loaded_at = time.monotonic()
+        self.version += 1
+        self.full_loads += 1
+        logger.info(f"设备目录已加载: 设备 {len(self.devices)} 台, VPN配置 {len(self.vpn_configs)} 个, "
+                    f"分组 {len(self.groups)} 个, 版本 {self.version}")
+
+    @staticmethod
+    def _group_links(links: Iterable[Tuple[int, int]]) -> Dict[int, Tuple[int, ...]]:
+        grouped: Dict[int, List[int]] = {}
+        for device_id, group_id in links:
+            grouped.setdefault(device_id, []).append(group_id)
+        return {device_id: tuple(group_ids) for device_id, group_ids in grouped.items()}
+
+    def _bump(self):
+        self.version += 1
+        self.invalidations += 1
+
+    # ---- 增量失效 ----
+
+    async def invalidate_device(self, device_id: int):
+        """设备新增/修改/删除或分组关联变化后刷新该设备"""
+        if self.loaded_at is None:
+            return  # 尚未加载，首次读取时自然是最新的
+        row = await Device.filter(id=device_id).values(*DEVICE_FIELDS)
+        if row:
+            self.devices[device_id] = DeviceSnapshot(row[0])
+            group_ids = await DeviceGroup.filter(device_id=device_id).order_by("id").values_list("group_id", flat=True)
+            if group_ids:
+                self.device_group_ids[device_id] = tuple(group_ids)
+            else:
+                self.device_group_ids.pop(device_id, None)
+        else:
+            self.devices.pop(device_id, None)
+            self.device_group_ids.pop(device_id, None)
+        self._bump()
+
+    async def invalidate_vpn_config(self, vpn_config_id: int):
+        """VPN配置新增/修改/删除后刷新该配置及引用它的设备（删除时设备外键被置空）"""
+        if self.loaded_at is None:
+            return
+        row = await VPNConfig.filter(id=vpn_config_id).values(*VPN_CONFIG_FIELDS)
+        if row:
+            self.vpn_configs[vpn_config_id] = VPNConfigSnapshot(row[0])
+        else:
+            self.vpn_configs.pop(vpn_config_id, None)
+            stale_ids = [device.id for device in self.devices.values() if device.vpn_config_id == vpn_config_id]
+            if stale_ids:
+                for device_row in await Device.filter(id__in=stale_ids).values(*DEVICE_FIELDS):
+                    self.devices[device_row["id"]] = DeviceSnapshot(device_row)
+        self._bump()
+
+    async def invalidate_groups(self):
+        """分组新增/修改/删除后刷新分组表与全部设备分组关联（两张小表）"""
+        if self.loaded_at is None:
+            return
+        group_rows = await Group.all().values(*GROUP_FIELDS)
+        links = await DeviceGroup.all().order_by("id").values_list("device_id", "group_id")
+        self.groups = {row["id"]: GroupSnapshot(row) for row in group_rows}
+        self.device_group_ids = self._group_links(links)
+        self._bump()
+
+    def invalidate_all(self):
+        """标记为过期，下次读取时全量重新加载"""
+        self.loaded_at = None
+        self.checked_at = None
+
+    # ---- 读取（调用前需ensure_loaded） ----
+
+    def get_device(self, device_id: int) -> Optional[DeviceSnapshot]:
+        return self.devices.get(device_id)
+
+    def get_vpn_config(self, vpn_config_id: Optional[int]) -> Optional[VPNConfigSnapshot]:
+        if vpn_config_id is None:
+            return None
+        return self.vpn_configs.get(vpn_config_id)
+
+    def get_group_ids(self, device_id: int) -> Tuple[int, ...]:
+        """设备所属分组ID，未绑定分组时为空"""
+        return self.device_group_ids.get(device_id, ())
+
+    def get_groups(self, device_id: int) -> List[GroupSnapshot]:
+        return [self.groups[group_id] for group_id in self.get_group_ids(device_id) if group_id in self.groups]
+
+    def list_vpn_configs(self) -> List[VPNConfigSnapshot]:
+        """按地域、网段排序的全部VPN配置"""
+        return sorted(self.vpn_configs.values(), key=lambda config: (config.region, config.network))
+
+    def get_stats(self) -> dict:
+        return {
+            "version": self.version,
+            "devices": len(self.devices),
+            "vpn_configs": len(self.vpn_configs),
+            "groups": len(self.groups),
+            "loaded_age": round(time.monotonic() - self.loaded_at, 1) if self.loaded_at is not None else None,
+            "db_version": self.db_version,
+            "local_bumps": self.local_bumps,
+            "check_interval": self.check_interval,
+            "full_loads": self.full_loads,
+            "invalidations": self.invalidations,
+        }
+
+
+# 全局设备目录实例
+device_catalog = DeviceCatalog()
+
+
+@post_save(*CATALOG_MODELS)
+async def _bump_on_save(sender, instance, created, using_db, update_fields):
+    # 只更新快照外字段（如连通状态）的保存不影响目录
+    if sender is Device and update_fields and not set(update_fields) & set(DEVICE_FIELDS):
+        return
+    await device_catalog.bump_version()
+
+
+@post_delete(*CATALOG_MODELS)
+async def _bump_on_delete(sender, instance, using_db):
+    await device_catalog.bump_version()
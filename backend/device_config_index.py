@@ -0,0 +1,139 @@
+"""
+设备配置值全文索引
+按配置值搜索设备时，对device_configs.config_value做LIKE '%值%'需要扫描整张表（每台设备最多8×40条配置）。
+这里在SQLite中维护一张FTS5（trigram分词）影子表，由配置的增删改接口同步更新，搜索时按短语匹配走索引。
+FTS5/trigram不可用（非SQLite数据库或SQLite版本过低）、索引维护出错或关键字不足3个字符时，回退到原来的LIKE查询。
+"""
+import logging
+from typing import Optional
+
+from tortoise import connections
+from tortoise.exceptions import BaseORMException
+from tortoise.expressions import RawSQL
+
+from models.deviceModel import DeviceConfig
+
+logger = logging.getLogger(__name__)
+
+FTS_TABLE = "device_configs_fts"
+# trigram分词至少需要3个字符才能构成一个词元
+MIN_QUERY_LENGTH = 3
+
+
+class DeviceConfigIndex:
+    """
+    device_configs.config_value的FTS5影子索引
+    - rowid与device_configs.id一致，device_id不参与分词，仅用于返回匹配的设备
+    - 启动时setup()建表，行数与配置表不一致时整体重建（兜底索引停用期间或直接改库造成的差异）
+    - 维护出错时停用索引，之后的搜索回退到LIKE，下次启动重建
+    """
+
+    def __init__(self):
+        self.available = False
+        self.rebuilds = 0
+        self.fallback_searches = 0
+        self.index_searches = 0
+
+    @staticmethod
+    def _connection():
+        return connections.get("default")
+
+    async def setup(self):
+        """建立影子表，必要时从配置表重建"""
+        conn = self._connection()
+        if conn.capabilities.dialect != "sqlite":
+            logger.info("配置值全文索引仅支持SQLite，配置值搜索使用LIKE")
+            self.available = False
+            return
+        try:
+            await conn.execute_script(
+                f"CREATE VIRTUAL TABLE IF NOT EXISTS {FTS_TABLE} "
+                f"USING fts5(config_value, device_id UNINDEXED, tokenize='trigram')"
+            )
+            _, rows = await conn.execute_query(f"SELECT COUNT(*) FROM {FTS_TABLE}")
+            indexed = rows[0][0]
+            total = await DeviceConfig.all().count()
+            if indexed != total:
+                await self.rebuild()
+        except BaseORMException as e:
+            logger.warning(f"配置值全文索引不可用，配置值搜索使用LIKE: {e}")
+            self.available = False
+            return
+        self.available = True
+
+    async def rebuild(self):
+        """按配置表整体重建索引"""
+        conn = self._connection()
+        await conn.execute_script(
+            f"DELETE FROM {FTS_TABLE};"
+            f"INSERT INTO {FTS_TABLE}(rowid, config_value, device_id) "
+            f"SELECT id, config_value, device_id FROM {DeviceConfig._meta.db_table};"
+        )
+        self.rebuilds += 1
+        logger.info("配置值全文索引已重建")
+
+    def _disable(self, action: str, error: Exception):
+        logger.error(f"配置值全文索引{action}失败，停用索引并回退到LIKE: {error}")
+        self.available = False
+
+    async def upsert(self, config: DeviceConfig):
+        """配置新增或修改后同步索引"""
+        if not self.available:
+            return
+        try:
+            await self._connection().execute_query(
+                f"INSERT OR REPLACE INTO {FTS_TABLE}(rowid, config_value, device_id) VALUES (?, ?, ?)",
+                [config.id, config.config_value, config.device_id]
+            )
+        except BaseORMException as e:
+            self._disable("更新", e)
+
+    async def remove(self, config_id: int):
+        """配置删除后同步索引"""
+        if not self.available:
+            return
+        try:
+            await self._connection().execute_query(f"DELETE FROM {FTS_TABLE} WHERE rowid = ?", [config_id])
+        except BaseORMException as e:
+            self._disable("删除", e)
+
+    async def remove_device(self, device_id: int):
+        """设备删除后移除其全部配置（配置表随设备级联删除，不经过配置接口）"""
+        if not self.available:
+            return
+        try:
+            await self._connection().execute_query(f"DELETE FROM {FTS_TABLE} WHERE device_id = ?", [device_id])
+        except BaseORMException as e:
+            self._disable("删除", e)
+
+    def device_id_subquery(self, value: str) -> Optional[RawSQL]:
+        """
+        查找配置值包含关键字的设备，返回可用于id__in过滤的子查询
+
+        匹配结果不在Python中物化为ID列表，由数据库在设备查询中直接执行，
+        常见配置值匹配大量设备时也不会生成超长的参数列表。
+
+        Returns:
+            FTS子查询；索引不可用或关键字过短时返回None，由调用方回退到LIKE
+        """
+        if not self.available or len(value) < MIN_QUERY_LENGTH:
+            self.fallback_searches += 1
+            return None
+        # 整个关键字作为一个短语匹配，等价于子串匹配（不区分大小写）
+        # RawSQL不支持绑定参数，短语按SQL字符串字面量转义后内联
+        phrase = '"' + value.replace("\x00", "").replace('"', '""') + '"'
+        literal = "'" + phrase.replace("'", "''") + "'"
+        self.index_searches += 1
+        return RawSQL(f"(SELECT device_id FROM {FTS_TABLE} WHERE {FTS_TABLE} MATCH {literal})")
+
+    def get_stats(self) -> dict:
+        return {
+            "available": self.available,
+            "rebuilds": self.rebuilds,
+            "index_searches": self.index_searches,
+            "fallback_searches": self.fallback_searches,
+        }
+
+
+# 全局配置值索引实例
+device_config_index = DeviceConfigIndex()
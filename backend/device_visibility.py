@@ -0,0 +1,212 @@
+"""
+设备可见性索引
+非超级用户只能看到属于自己任一分组的设备，以及未绑定任何分组的设备。
+原先每次访问检查、设备列表和连通性接口都要关联查询DeviceGroup与GroupMember，
+这里在内存中维护分组关联，并为每个用户物化可见设备集合，访问检查与按ID过滤变成集合查找，
+设备列表的分组权限条件也由内存中的集合生成，不再关联查询group_members。
+"""
+import asyncio
+import logging
+import time
+from typing import Dict, Iterable, List, Optional, Set
+
+from tortoise.expressions import Q, Subquery
+
+from config import settings
+from models.groupModel import DeviceGroup, GroupMember
+from utils.etag import RESOURCE_DEVICE_ACL, get_resource_version
+
+logger = logging.getLogger(__name__)
+
+
+class DeviceVisibilityIndex:
+    """
+    设备可见性索引
+    - 首次使用时加载全部设备分组关联与分组成员关系，按用户惰性物化可见设备集合
+    - 分组关联/成员变化的接口调用对应方法增量更新，本进程内立即生效
+    - 分组关联与成员的修改会递增数据库中的device_acl版本号，每隔check_interval秒比对一次，
+      版本变化（其他worker的修改）时重新加载两张关联表
+    读取前需先await ensure_fresh()，之后的查询方法均为同步的集合查找。
+    """
+
+    def __init__(self, check_interval: float = settings.VISIBILITY_CHECK_INTERVAL,
+                 inline_id_limit: int = settings.VISIBILITY_INLINE_ID_LIMIT):
+        self.check_interval = check_interval
+        self.inline_id_limit = inline_id_limit
+        # 设备 -> 所属分组；分组 -> 设备；用户 -> 所属分组
+        self.device_group_ids: Dict[int, Set[int]] = {}
+        self.group_device_ids: Dict[int, Set[int]] = {}
+        self.user_group_ids: Dict[int, Set[int]] = {}
+        # 用户 -> 可见的已分组设备（惰性物化）；未分组设备对所有人可见，不在其中
+        self.visible_device_ids: Dict[int, Set[int]] = {}
+        self.acl_version: Optional[int] = None
+        self.checked_at: Optional[float] = None
+        self._load_lock = asyncio.Lock()
+        self.full_loads = 0
+        self.incremental_updates = 0
+
+    @property
+    def loaded(self) -> bool:
+        return self.acl_version is not None
+
+    def _is_fresh(self) -> bool:
+        return self.checked_at is not None and time.monotonic() - self.checked_at < self.check_interval
+
+    async def ensure_fresh(self):
+        """首次使用时加载；超过检查间隔时比对版本号，其他进程修改过时重新加载"""
+        if self._is_fresh():
+            return
+        async with self._load_lock:
+            if self._is_fresh():
+                return
+            # 先读版本再加载，加载期间发生的修改会使版本号再次变化，下次检查时重新加载
+            version = await get_resource_version(RESOURCE_DEVICE_ACL)
+            if version != self.acl_version:
+                await self._load_all()
+                self.acl_version = version
+            self.checked_at = time.monotonic()
+
+    async def _load_all(self):
+        links = await DeviceGroup.all().values_list("device_id", "group_id")
+        memberships = await GroupMember.all().values_list("user_id", "group_id")
+
+        device_group_ids: Dict[int, Set[int]] = {}
+        group_device_ids: Dict[int, Set[int]] = {}
+        for device_id, group_id in links:
+            device_group_ids.setdefault(device_id, set()).add(group_id)
+            group_device_ids.setdefault(group_id, set()).add(device_id)
+        user_group_ids: Dict[int, Set[int]] = {}
+        for user_id, group_id in memberships:
+            user_group_ids.setdefault(user_id, set()).add(group_id)
+
+        self.device_group_ids = device_group_ids
+        self.group_device_ids = group_device_ids
+        self.user_group_ids = user_group_ids
+        self.visible_device_ids = {}
+        self.full_loads += 1
+        logger.info(f"设备可见性索引已加载: 分组关联 {len(links)} 条, 成员关系 {len(memberships)} 条")
+
+    # ---- 查询（调用前需ensure_fresh） ----
+
+    def _visible(self, user_id: int) -> Set[int]:
+        visible = self.visible_device_ids.get(user_id)
+        if visible is None:
+            visible = set()
+            for group_id in self.user_group_ids.get(user_id, ()):
+                visible |= self.group_device_ids.get(group_id, set())
+            self.visible_device_ids[user_id] = visible
+        return visible
+
+    def can_view(self, user_id: int, device_id: int) -> bool:
+        """未绑定分组的设备对所有人可见，否则需属于用户任一分组"""
+        return device_id not in self.device_group_ids or device_id in self._visible(user_id)
+
+    def filter_visible(self, user_id: int, device_ids: Iterable[int]) -> List[int]:
+        """过滤出用户可见的设备，保持传入顺序"""
+        visible = self._visible(user_id)
+        grouped = self.device_group_ids
+        return [device_id for device_id in device_ids if device_id not in grouped or device_id in visible]
+
+    def list_filter(self, user_id: int) -> Optional[Q]:
+        """
+        设备列表查询的分组权限过滤条件，无需过滤时返回None
+        - 没有对用户隐藏的设备（常见于用户属于全部分组或没有分组设备）：不加条件
+        - 隐藏的设备不超过inline_id_limit台：按内存中的集合以NOT IN排除
+        - 否则以用户所属分组（取自内存，不再关联group_members）对device_groups做子查询，
+          避免生成超长的参数列表
+        """
+        visible = self._visible(user_id)
+        hidden = self.device_group_ids.keys() - visible
+        if not hidden:
+            return None
+        if len(hidden) <= self.inline_id_limit:
+            return ~Q(id__in=list(hidden))
+        grouped = ~Q(id__in=Subquery(DeviceGroup.all().values("device_id")))
+        group_ids = self.user_group_ids.get(user_id)
+        if not group_ids:
+            return grouped
+        return Q(id__in=Subquery(DeviceGroup.filter(group_id__in=list(group_ids)).values("device_id"))) | grouped
+
+    # ---- 增量更新（尚未加载时忽略，首次使用时自然是最新的） ----
+
+    def _updated(self):
+        self.incremental_updates += 1
+
+    def set_device_groups(self, device_id: int, group_ids: Iterable[int]):
+        """设备的分组关联变化后更新（传空表示设备未绑定分组或已删除）"""
+        if not self.loaded:
+            return
+        new_group_ids = set(group_ids)
+        for group_id in self.device_group_ids.pop(device_id, set()) - new_group_ids:
+            self.group_device_ids.get(group_id, set()).discard(device_id)
+        for group_id in new_group_ids:
+            self.group_device_ids.setdefault(group_id, set()).add(device_id)
+        if new_group_ids:
+            self.device_group_ids[device_id] = new_group_ids
+        for user_id, visible in self.visible_device_ids.items():
+            if new_group_ids & self.user_group_ids.get(user_id, set()):
+                visible.add(device_id)
+            else:
+                visible.discard(device_id)
+        self._updated()
+
+    def add_group_members(self, group_id: int, user_ids: Iterable[int]):
+        """用户加入分组"""
+        if not self.loaded:
+            return
+        group_devices = self.group_device_ids.get(group_id, set())
+        for user_id in user_ids:
+            self.user_group_ids.setdefault(user_id, set()).add(group_id)
+            visible = self.visible_device_ids.get(user_id)
+            if visible is not None:
+                visible |= group_devices
+        self._updated()
+
+    def remove_group_members(self, group_id: int, user_ids: Iterable[int]):
+        """用户移出分组，这些用户的可见集合在下次查询时重新物化"""
+        if not self.loaded:
+            return
+        for user_id in user_ids:
+            self.user_group_ids.get(user_id, set()).discard(group_id)
+            self.visible_device_ids.pop(user_id, None)
+        self._updated()
+
+    def set_user_groups(self, user_id: int, group_ids: Iterable[int]):
+        """用户的分组整体调整"""
+        if not self.loaded:
+            return
+        self.user_group_ids[user_id] = set(group_ids)
+        self.visible_device_ids.pop(user_id, None)
+        self._updated()
+
+    def remove_group(self, group_id: int):
+        """分组删除：其中的设备若不再属于任何分组则对所有人可见"""
+        if not self.loaded:
+            return
+        for device_id in self.group_device_ids.pop(group_id, set()):
+            device_groups = self.device_group_ids.get(device_id)
+            if device_groups is not None:
+                device_groups.discard(group_id)
+                if not device_groups:
+                    del self.device_group_ids[device_id]
+        for user_id, user_groups in self.user_group_ids.items():
+            if group_id in user_groups:
+                user_groups.discard(group_id)
+                self.visible_device_ids.pop(user_id, None)
+        self._updated()
+
+    def get_stats(self) -> dict:
+        return {
+            "grouped_devices": len(self.device_group_ids),
+            "groups": len(self.group_device_ids),
+            "users": len(self.user_group_ids),
+            "materialized_users": len(self.visible_device_ids),
+            "acl_version": self.acl_version,
+            "check_interval": self.check_interval,
+            "full_loads": self.full_loads,
+            "incremental_updates": self.incremental_updates,
+        }
+
+
+# 全局设备可见性索引实例
+device_visibility = DeviceVisibilityIndex()
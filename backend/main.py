@@ -7,6 +7,7 @@ from fastapi import FastAPI, HTTPException
 from fastapi.responses import JSONResponse
 from fastapi.middleware.cors import CORSMiddleware
 from config import settings
+from auth import password_hasher
 from database import init_database, setup_database
 from routers import device, user, system, operationLog, vpn, command, ai_tool
 from scheduler import start_scheduler, stop_scheduler  # type: ignore
@@ -56,6 +57,7 @@ async def on_shutdown():
         print("⏰ 定时任务调度器已停止")
     except Exception as exc:
         print(f"⚠️ 定时任务调度器关闭失败: {exc}")
+    password_hasher.shutdown()
 
 
 # 全局异常处理器
@@ -68,7 +70,8 @@ async def http_exception_handler(request, exc):
             "code": exc.status_code,
             "message": exc.detail,
             "data": None
-        }
+        },
+        headers=getattr(exc, "headers", None)
     )
 
 
@@ -151,7 +151,7 @@ class LoginLog(Model):
     id = fields.IntField(pk=True, description="日志ID")
     user = fields.ForeignKeyField(
         "models.User", related_name="login_logs", description="用户")
-    login_time = fields.DatetimeField(auto_now_add=True, description="登录时间")
+    login_time = fields.DatetimeField(auto_now_add=True, db_index=True, description="登录时间")
     ip_address = fields.CharField(max_length=45, description="IP地址")
     login_result = fields.BooleanField(description="登录结果")
     failure_reason = fields.CharField(
@@ -175,7 +175,7 @@ class OperationLog(Model):
         max_length=100, null=True, description="设备名称")
     description = fields.TextField(null=True, description="操作描述")
     ip_address = fields.CharField(max_length=45, null=True, description="IP地址")
-    created_at = fields.DatetimeField(auto_now_add=True, description="创建时间")
+    created_at = fields.DatetimeField(auto_now_add=True, db_index=True, description="创建时间")
 
     class Meta:
         table = "operation_logs"
@@ -35,7 +35,7 @@ class AIDiagnosisLog(Model):
     error_message = fields.TextField(null=True, description="错误信息")
 
     # 时间戳
-    created_at = fields.DatetimeField(auto_now_add=True, description="创建时间")
+    created_at = fields.DatetimeField(auto_now_add=True, db_index=True, description="创建时间")
     completed_at = fields.DatetimeField(null=True, description="完成时间")
 
     class Meta:
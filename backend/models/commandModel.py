@@ -22,7 +22,7 @@ class Command(Model):
     last_editor = fields.CharField(
         max_length=50, null=True, description="最后编辑人工号")
     created_at = fields.DatetimeField(auto_now_add=True, description="创建时间")
-    updated_at = fields.DatetimeField(auto_now=True, description="更新时间")
+    updated_at = fields.DatetimeField(auto_now=True, db_index=True, description="更新时间")
 
     class Meta:
         table = "commands"
@@ -71,6 +71,12 @@ class Device(Model):
         null=True, description="最后一次ping检测时间")
     last_connectivity_check = fields.DatetimeField(
         null=True, description="最后一次连通性检查时间")
+    last_rtt = fields.FloatField(
+        null=True, description="最近一次探测的往返时延（毫秒），不通时为空")
+    probe_method = fields.CharField(
+        max_length=10, null=True, description="连通性探测方式 icmp/tcp/any，为空时使用VPN配置或全局默认")
+    probe_ports = fields.JSONField(
+        null=True, description="TCP探测端口列表，为空时使用VPN配置或全局默认")
 
     # 关联关系
     usage_info: fields.ReverseRelation["DeviceUsage"]
@@ -257,3 +263,19 @@ class DeviceAccessIP(Model):
 
     def __str__(self):
         return f"{self.device_id} - {self.employee_id} ({self.role}) - {self.vpn_ip}"
+
+
+class DeviceConnectivityInterest(Model):
+    """设备连通性检测关注记录
+    多进程部署时，各worker将被访问的设备登记到该表，由持有检测权的进程统一检测。
+    """
+
+    device_id = fields.IntField(pk=True, generated=False, description="设备ID")
+    last_access = fields.DatetimeField(description="最近一次被访问的时间")
+
+    class Meta:
+        table = "device_connectivity_interest"
+        table_description = "设备连通性检测关注表"
+
+    def __str__(self):
+        return f"{self.device_id} - {self.last_access}"
@@ -20,3 +20,16 @@ class SystemSettings(Model):
 
     def __str__(self):
         return f"SystemSettings(cleanup_time={self.cleanup_time})"
+
+
+class ResourceVersion(Model):
+    """资源版本号：相关数据每次修改递增，用于生成列表接口的ETag（多worker共享）"""
+    name = fields.CharField(max_length=50, pk=True, description="资源族名称")
+    version = fields.BigIntField(default=0, description="版本号")
+
+    class Meta:
+        table = "resource_versions"
+        table_description = "资源版本表"
+
+    def __str__(self):
+        return f"ResourceVersion({self.name}={self.version})"
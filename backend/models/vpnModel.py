@@ -15,6 +15,10 @@ class VPNConfig(Model):
     gw = fields.CharField(max_length=45, description="网关地址")
     ip = fields.CharField(max_length=45, description="VPN IP")
     mask = fields.CharField(max_length=45, description="子网掩码")
+    probe_method = fields.CharField(
+        max_length=10, null=True, description="该VPN下设备的连通性探测方式 icmp/tcp/any，为空时使用全局默认")
+    probe_ports = fields.JSONField(
+        null=True, description="该VPN下设备的TCP探测端口列表，为空时使用全局默认")
 
     class Meta:
         table = "vpn_configs"
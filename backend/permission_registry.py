@@ -0,0 +1,130 @@
+"""
+角色权限位图
+权限检查、当前用户权限列表与菜单过滤原先每次都要关联查询Permission/RolePermission。
+这里一次性加载全部权限与角色权限关联，为每个权限代码分配一个位序号，每个角色保存一个整数位掩码，
+检查权限变成一次按位与，不再访问数据库。
+"""
+import asyncio
+import logging
+import time
+from typing import Dict, List, Optional
+
+from tortoise.signals import post_delete, post_save
+
+from config import settings
+from models.admin import Permission, Role, RolePermission
+from utils.etag import RESOURCE_PERMISSIONS, get_resource_version
+
+logger = logging.getLogger(__name__)
+
+PERMISSION_FIELDS = ("code", "name", "description")
+
+
+class PermissionRegistry:
+    """
+    权限注册表
+    - 首次使用时加载，权限按ID顺序分配位序号
+    - 本进程内Role/Permission/RolePermission的保存与删除通过模型信号立即失效
+    - 每隔check_interval秒比对数据库中的permissions版本号，发现其他worker的修改后重新加载
+    读取前需先await ensure_fresh()，之后的查询方法均为同步计算。
+    """
+
+    def __init__(self, check_interval: float = settings.PERMISSION_CHECK_INTERVAL):
+        self.check_interval = check_interval
+        self.bits: Dict[str, int] = {}
+        self.permissions: List[dict] = []
+        self.role_masks: Dict[int, int] = {}
+        self.role_names: Dict[int, str] = {}
+        self.all_mask = 0
+        self.version: Optional[int] = None
+        self.checked_at: Optional[float] = None
+        self._load_lock = asyncio.Lock()
+        self.full_loads = 0
+
+    def _is_fresh(self) -> bool:
+        return self.checked_at is not None and time.monotonic() - self.checked_at < self.check_interval
+
+    async def ensure_fresh(self):
+        """首次使用、本进程修改过或超过检查间隔时比对版本号，必要时重新加载"""
+        if self._is_fresh():
+            return
+        async with self._load_lock:
+            if self._is_fresh():
+                return
+            # 先读版本再加载，加载期间发生的修改会使版本号再次变化
+            version = await get_resource_version(RESOURCE_PERMISSIONS)
+            if version != self.version:
+                await self._load_all()
+                self.version = version
+            self.checked_at = time.monotonic()
+
+    async def _load_all(self):
+        permission_rows = await Permission.all().order_by("id").values("id", *PERMISSION_FIELDS)
+        links = await RolePermission.all().values_list("role_id", "permission_id")
+        roles = await Role.all().values_list("id", "name")
+
+        bits = {row["code"]: index for index, row in enumerate(permission_rows)}
+        permission_bits = {row["id"]: index for index, row in enumerate(permission_rows)}
+        role_masks = {role_id: 0 for role_id, _ in roles}
+        for role_id, permission_id in links:
+            role_masks[role_id] = role_masks.get(role_id, 0) | (1 << permission_bits[permission_id])
+
+        self.bits = bits
+        self.permissions = [{field: row[field] for field in PERMISSION_FIELDS} for row in permission_rows]
+        self.role_masks = role_masks
+        self.role_names = dict(roles)
+        self.all_mask = (1 << len(permission_rows)) - 1
+        self.full_loads += 1
+        logger.info(f"权限注册表已加载: 权限 {len(permission_rows)} 个, 角色 {len(role_masks)} 个")
+
+    def invalidate(self):
+        """下次使用时重新比对版本号"""
+        self.checked_at = None
+        self.version = None
+
+    # ---- 查询（调用前需ensure_fresh） ----
+
+    def get_role_mask(self, role_id: Optional[int]) -> int:
+        if role_id is None:
+            return 0
+        return self.role_masks.get(role_id, 0)
+
+    def get_role_name(self, role_id: Optional[int]) -> Optional[str]:
+        if role_id is None:
+            return None
+        return self.role_names.get(role_id)
+
+    def has_permission(self, role_id: Optional[int], code: str) -> bool:
+        """角色是否拥有指定权限（未知权限代码视为没有）"""
+        bit = self.bits.get(code)
+        return bit is not None and bool(self.get_role_mask(role_id) & (1 << bit))
+
+    def get_permissions(self, mask: int) -> List[dict]:
+        """位掩码包含的权限（按权限ID顺序）"""
+        return [permission for index, permission in enumerate(self.permissions) if mask >> index & 1]
+
+    def get_codes(self, mask: int) -> List[str]:
+        return [permission["code"] for permission in self.get_permissions(mask)]
+
+    def get_stats(self) -> dict:
+        return {
+            "permissions": len(self.bits),
+            "roles": len(self.role_masks),
+            "version": self.version,
+            "check_interval": self.check_interval,
+            "full_loads": self.full_loads,
+        }
+
+
+# 全局权限注册表实例
+permission_registry = PermissionRegistry()
+
+
+@post_save(Role, Permission, RolePermission)
+async def _invalidate_on_save(sender, instance, created, using_db, update_fields):
+    permission_registry.invalidate()
+
+
+@post_delete(Role, Permission, RolePermission)
+async def _invalidate_on_delete(sender, instance, using_db):
+    permission_registry.invalidate()
@@ -16,10 +16,30 @@ from schemas import (
     AIDiagnosisCreate, AIDiagnosisResponse, AIDiagnosisListItem, BaseResponse
 )
 from auth import AuthManager
+from user_context import UserContext, get_user_context
 from connectivity_manager import connectivity_manager
+from utils.pagination import CursorParams, paginate_by_cursor
 
 router = APIRouter(prefix="/api/ai-tool", tags=["AI工具"])
 
+# 诊断报告中展示的历史统计窗口
+HISTORY_WINDOWS = {"近1小时": 3600, "近24小时": 86400}
+
+
+def format_connectivity_history(device_id: int) -> str:
+    """将设备的探测历史统计格式化为诊断报告中的列表项（只读内存历史，不触发检测）"""
+    summaries = connectivity_manager.get_history_summary([device_id], HISTORY_WINDOWS)[device_id]
+    lines = []
+    for name, summary in summaries.items():
+        if not summary["samples"]:
+            lines.append(f"- {name}: 暂无检测记录")
+            continue
+        rtt = (f"，时延 p50/p95: {summary['rtt_p50']}/{summary['rtt_p95']} ms"
+               if summary["rtt_p50"] is not None else "")
+        lines.append(
+            f"- {name}: 在线率 {summary['uptime']}%，丢包率 {round(summary['loss_rate'] * 100, 2)}%{rtt}")
+    return "\n".join(lines)
+
 
 async def generate_diagnosis_stream(
     device: Device,
@@ -55,6 +75,7 @@ async def generate_diagnosis_stream(
 ## 连通性检测
 ✅ **设备连通正常**
 - 最后检测时间: {last_ping_str}
+{format_connectivity_history(device.id)}
 """
         yield f"data: {json.dumps({'type': 'content', 'content': connectivity_info}, ensure_ascii=False)}\n\n"
         await asyncio.sleep(0.5)
@@ -254,6 +275,7 @@ async def create_diagnosis(
 
 ## 连通性检测
 ❌ **设备当前不可连通**
+{format_connectivity_history(device.id)}
 
 无法建立与设备的网络连接，请检查：
 1. 设备是否在线
@@ -298,6 +320,7 @@ async def create_diagnosis(
 ## 连通性检测
 ✅ **设备连通正常**
 - 最后检测时间: {last_ping_str}
+{format_connectivity_history(device.id)}
 
 ## 问题描述
 {diagnosis_data.problem_description}
@@ -348,9 +371,10 @@ async def get_diagnosis_history(
     page_size: int = Query(20, ge=1, le=100, description="每页数量"),
     device_ip: Optional[str] = Query(None, description="设备IP筛选"),
     status: Optional[str] = Query(None, description="状态筛选"),
+    cursor_params: CursorParams = Depends(),
     current_user: User = Depends(AuthManager.get_current_user)
 ):
-    """获取AI诊断历史列表"""
+    """获取AI诊断历史列表（支持页码分页与游标分页）"""
     try:
         # 构建查询条件
         query = AIDiagnosisLog.all()
@@ -361,12 +385,17 @@ async def get_diagnosis_history(
         if status:
             query = query.filter(status=status)
 
-        # 获取总数
-        total = await query.count()
+        if cursor_params.enabled:
+            logs, page_info = await paginate_by_cursor(
+                query, cursor_params, page_size, sort_field="created_at", descending=True)
+        else:
+            # 获取总数
+            total = await query.count()
 
-        # 分页查询
-        offset = (page - 1) * page_size
-        logs = await query.offset(offset).limit(page_size).order_by('-created_at')
+            # 分页查询
+            offset = (page - 1) * page_size
+            logs = await query.offset(offset).limit(page_size).order_by('-created_at')
+            page_info = {"total": total, "page": page}
 
         # 构建返回数据
         items = []
@@ -387,12 +416,13 @@ async def get_diagnosis_history(
             message="获取诊断历史成功",
             data={
                 "items": items,
-                "total": total,
-                "page": page,
-                "page_size": page_size
+                "page_size": page_size,
+                **page_info
             }
         )
 
+    except HTTPException:
+        raise
     except Exception as e:
         print(f"获取诊断历史失败: {e}")
         raise HTTPException(status_code=500, detail="获取诊断历史失败")
@@ -486,7 +516,8 @@ async def export_diagnosis(
 @router.delete("/history/{diagnosis_id}", response_model=BaseResponse, summary="删除诊断记录")
 async def delete_diagnosis(
     diagnosis_id: int,
-    current_user: User = Depends(AuthManager.get_current_user)
+    current_user: User = Depends(AuthManager.get_current_user),
+    user_context: UserContext = Depends(get_user_context)
 ):
     """删除诊断记录（仅创建人或管理员可删除）"""
     try:
@@ -496,7 +527,7 @@ async def delete_diagnosis(
 
         # 权限检查：只有创建人或管理员可以删除
         is_creator = diagnosis.user_id == current_user.id
-        is_admin = current_user.is_superuser or (await current_user.has_role("管理员"))
+        is_admin = user_context.is_admin
 
         if not (is_creator or is_admin):
             raise HTTPException(
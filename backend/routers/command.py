@@ -14,6 +14,8 @@ from schemas import (
     CommandCreate, CommandUpdate, CommandResponse, CommandListItem, BaseResponse
 )
 from auth import AuthManager
+from user_context import UserContext, get_user_context
+from utils.pagination import CursorParams, paginate_by_cursor
 
 router = APIRouter(prefix="/api/commands", tags=["命令行集"])
 
@@ -36,11 +38,12 @@ async def get_commands(
     command_keyword: Optional[str] = Query(None, description="命令内容搜索关键词"),
     description_keyword: Optional[str] = Query(None, description="描述搜索关键词"),
     remarks_keyword: Optional[str] = Query(None, description="备注搜索关键词"),
+    cursor_params: CursorParams = Depends(),
     current_user: User = Depends(AuthManager.get_current_user)
 ):
     """
     获取命令行列表
-    - 支持分页
+    - 支持页码分页与游标分页（按更新时间倒序）
     - 支持按命令内容和备注内容搜索
     - 如果命令内容为空，则搜索备注
     - 如果备注内容为空，则搜索命令内容
@@ -58,11 +61,16 @@ async def get_commands(
     for token in _split_keywords(remarks_keyword):
         query = query.filter(remarks__icontains=token)
 
-    # 获取总数
-    total = await query.count()
-    # 分页查询
-    offset = (page - 1) * page_size
-    commands = await query.offset(offset).limit(page_size).order_by('-updated_at')
+    if cursor_params.enabled:
+        commands, page_info = await paginate_by_cursor(
+            query, cursor_params, page_size, sort_field="updated_at", descending=True)
+    else:
+        # 获取总数
+        total = await query.count()
+        # 分页查询
+        offset = (page - 1) * page_size
+        commands = await query.offset(offset).limit(page_size).order_by('-updated_at')
+        page_info = {"total": total, "page": page}
 
     # 构建返回数据
     result = []
@@ -81,9 +89,8 @@ async def get_commands(
         message="命令行列表获取成功",
         data={
             "items": result,
-            "total": total,
-            "page": page,
-            "page_size": page_size
+            "page_size": page_size,
+            **page_info
         }
     )
 
@@ -91,12 +98,13 @@ async def get_commands(
 @router.post("/import", response_model=BaseResponse, summary="导入命令行xlsx")
 async def import_commands(
     file: UploadFile = File(...),
-    current_user: User = Depends(AuthManager.get_current_user)
+    current_user: User = Depends(AuthManager.get_current_user),
+    user_context: UserContext = Depends(get_user_context)
 ):
     """上传xlsx文件并导入命令行数据
     预期列：视图(link)、cli(command_text)、描述(description)、注意事项(notice)、参数范围(param_ranges)、备注(remarks)
     """
-    is_admin = current_user.is_superuser or (await current_user.has_role("管理员"))
+    is_admin = user_context.is_admin
     if not is_admin:
         raise HTTPException(status_code=403, detail="权限不足，只有管理员才能导入命令行")
 
@@ -337,7 +345,8 @@ async def update_command(
 @router.delete("/{command_id:int}", response_model=BaseResponse, summary="删除命令行")
 async def delete_command(
     command_id: int,
-    current_user: User = Depends(AuthManager.get_current_user)
+    current_user: User = Depends(AuthManager.get_current_user),
+    user_context: UserContext = Depends(get_user_context)
 ):
     """删除命令行，只有创建人或管理员可以删除"""
     command = await Command.filter(id=command_id).first()
@@ -346,7 +355,7 @@ async def delete_command(
 
     # 权限检查：只有创建人或管理员可以删除
     is_creator = command.creator == current_user.employee_id
-    is_admin = current_user.is_superuser or (await current_user.has_role("管理员"))
+    is_admin = user_context.is_admin
 
     if not (is_creator or is_admin):
         raise HTTPException(
@@ -2,11 +2,17 @@
 设备管理路由
 提供设备的增删改查、使用管理等API接口
 """
-from fastapi import APIRouter, HTTPException, Depends, Query
-from typing import List, Optional
+from fastapi import APIRouter, HTTPException, Depends, Query, Request, Response
+from fastapi.responses import StreamingResponse
+from typing import AsyncGenerator, List, Optional, Set, Tuple
 from datetime import datetime, timezone
+import asyncio
+import json
+import time
 import traceback
 from pydantic import BaseModel
+from tortoise.expressions import Case, Q, Subquery, When
+from tortoise.transactions import in_transaction
 
 from models.deviceModel import (
     Device,
@@ -20,12 +26,14 @@ from models.deviceModel import (
 )
 from models.admin import User, OperationLog
 from models.vpnModel import VPNConfig, UserVPNConfig
-from models.groupModel import Group, GroupMember, DeviceGroup
+from models.groupModel import Group, DeviceGroup
 from schemas import (
     DeviceBase,
     DeviceUpdate,
     DeviceResponse,
     DeviceListItem,
+    DeviceListPage,
+    DeviceListResponse,
     DeviceUsageResponse,
     DeviceUsageUpdate,
     DeviceUseRequest,
@@ -45,8 +53,15 @@ from schemas import (
     MyUsageDeviceSummary
 )
 from schemas import BaseResponse
-from auth import AuthManager
-from connectivity_manager import connectivity_manager
+from auth import AuthManager, login_admission, password_hasher
+from user_context import UserContext, get_user_context
+from connectivity_manager import connectivity_manager, LATENCY_BANDS, LATENCY_BAND_UNKNOWN, get_latency_band
+from utils.pagination import CursorParams, paginate_by_cursor
+from device_catalog import device_catalog
+from device_visibility import device_visibility
+from device_config_index import device_config_index
+from utils.etag import RESOURCE_DEVICE_ACL, RESOURCE_DEVICES, bump_resource_version, conditional_get
+from utils.fast_json import fast_response
 from scheduler.scheduler import device_scheduler
 from utils.notification import send_device_notification
 
@@ -73,33 +88,47 @@ def resolve_request_user(user_input: Optional[str], fallback_user: User) -> str:
     return normalize_employee_id(fallback_user.employee_id) or fallback_user.employee_id
 
 
-async def get_user_group_ids(user: User) -> Optional[set]:
-    """获取用户所属分组ID集合"""
+async def user_has_device_access(device: Device, user: User) -> bool:
+    """判断用户是否可以访问设备（未绑定分组的设备对所有人可见）"""
     if user.is_superuser:
-        return None
-    group_ids = await GroupMember.filter(user_id=user.id).values_list('group_id', flat=True)
-    return set(group_ids)
+        return True
+    await device_visibility.ensure_fresh()
+    return device_visibility.can_view(user.id, device.id)
 
 
-async def user_has_device_access(device: Device, user: User, user_group_ids: Optional[set] = None) -> bool:
-    """判断用户是否可以访问设备"""
-    if user.is_superuser:
-        return True
-    device_group_ids = await DeviceGroup.filter(device=device).values_list('group_id', flat=True)
-    if not device_group_ids:
-        return True  # 未绑定分组的设备对所有人可见
-    if user_group_ids is None:
-        user_group_ids = await get_user_group_ids(user) or set()
-    return bool(user_group_ids and set(device_group_ids) & user_group_ids)
-
-
-async def ensure_device_access(device: Device, user: User, user_group_ids: Optional[set] = None):
-    """确保用户有权限访问设备"""
-    has_access = await user_has_device_access(device, user, user_group_ids)
-    if not has_access:
+def ensure_device_access(device: Device, user_context: UserContext):
+    """确保当前用户有权限访问设备（按请求级用户上下文判断）"""
+    if not user_context.can_view_device(device.id):
         raise HTTPException(status_code=403, detail="您无权访问该设备")
 
 
+async def filter_accessible_device_ids(device_ids: List[int], user: User) -> Tuple[Set[int], List[int]]:
+    """
+    按设备目录过滤出存在且有权访问的设备
+
+    Returns:
+        (存在的设备ID集合, 有权访问的设备ID列表，保持传入顺序)
+    """
+    await device_catalog.ensure_loaded()
+    existing_device_ids = {device_id for device_id in device_ids if device_catalog.get_device(device_id)}
+    accessible_device_ids = [device_id for device_id in device_ids if device_id in existing_device_ids]
+    if not user.is_superuser:
+        await device_visibility.ensure_fresh()
+        accessible_device_ids = device_visibility.filter_visible(user.id, accessible_device_ids)
+    return existing_device_ids, accessible_device_ids
+
+
+def require_usage_info(device: Device) -> DeviceUsage:
+    """
+    取出随设备一并查询（select_related("usage_info")）的使用记录
+    使用记录在创建设备时同一事务内创建，启动时也会补齐，缺失属于数据异常
+    """
+    usage_info = device.usage_info
+    if usage_info is None:
+        raise HTTPException(status_code=500, detail="设备使用记录缺失，请重启服务补齐")
+    return usage_info
+
+
 async def ensure_user_vpn_ip(device: Device, user: User):
     """确保用户已录入设备所需VPN的IP地址"""
     if not device.vpn_config_id:
@@ -128,6 +157,7 @@ async def revoke_shared_access(device: Device, actor: Optional[User] = None, rea
         processed_at=now,
         decision_reason=reason
     )
+    await bump_resource_version(RESOURCE_DEVICES)
     # 清理已审批共用用户的访问IP记录
     approved_users = await DeviceShareRequest.filter(device=device, status="revoked").values_list("requester_employee_id", flat=True)
     for emp in approved_users:
@@ -161,12 +191,13 @@ async def force_share_device(
     device_id: int,
     payload: DeviceForceShareRequest,
     current_user: User = Depends(AuthManager.get_current_user),
+    user_context: UserContext = Depends(get_user_context),
 ):
     """将当前用户强制加入设备共用列表，并记录备注信息"""
     device = await Device.filter(id=device_id).first()
     if not device:
         raise HTTPException(status_code=404, detail="设备不存在")
-    await ensure_device_access(device, current_user)
+    ensure_device_access(device, user_context)
     await ensure_user_vpn_ip(device, current_user)
 
     usage_info = await DeviceUsage.filter(device=device).first()
@@ -305,36 +336,68 @@ def serialize_share_request_record(share_request: DeviceShareRequest) -> dict:
 
 
 def serialize_group_links(device) -> List[dict]:
-    """将设备的分组信息序列化"""
-    groups = []
-    if hasattr(device, "group_links"):
-        group_links = device.group_links
-    else:
-        group_links = []
-    for link in group_links or []:
-        if link.group:
-            groups.append({
-                "id": link.group.id,
-                "name": link.group.name,
-                "description": link.group.description
-            })
-    return groups
+    """将设备的分组信息序列化（读取设备目录，调用前需ensure_loaded）"""
+    return [
+        {
+            "id": group.id,
+            "name": group.name,
+            "description": group.description
+        }
+        for group in device_catalog.get_groups(device.id)
+    ]
+
+
+# 设备列表可选返回字段（顺序与DeviceListItem一致），以及按需计算的字段组
+DEVICE_LIST_FIELDS = tuple(DeviceListItem.model_fields)
+DEVICE_LIST_USAGE_FIELDS = {
+    "current_user", "queue_count", "status", "start_time", "occupied_duration", "is_current_user_in_queue"}
+DEVICE_LIST_VPN_FIELDS = {"vpn_region", "vpn_network", "vpn_display_name"}
+DEVICE_LIST_SHARE_FIELDS = {"is_shared_user", "has_pending_share_request", "share_request_id", "share_status"}
+
+
+def parse_device_list_fields(fields: Optional[str]) -> Optional[Tuple[str, ...]]:
+    """解析fields参数，返回按DeviceListItem顺序排列的字段（始终包含id）；不传时返回None表示全部字段"""
+    if not fields:
+        return None
+    requested = {field.strip() for field in fields.split(",") if field.strip()}
+    invalid_fields = requested - set(DEVICE_LIST_FIELDS)
+    if invalid_fields:
+        raise HTTPException(status_code=400, detail=f"无效的字段: {', '.join(sorted(invalid_fields))}")
+    requested.add("id")
+    return tuple(field for field in DEVICE_LIST_FIELDS if field in requested)
 
 
 async def sync_device_groups(device: Device, group_ids: Optional[List[int]]):
     """同步设备的分组关联"""
     if group_ids is None:
         return
+    linked_group_ids = await _sync_device_group_links(device, group_ids)
+    await apply_device_groups(device.id, linked_group_ids)
+
+
+async def apply_device_groups(device_id: int, linked_group_ids: Set[int]):
+    """
+    分组关联落库后更新内存中的可见性索引并递增版本
+    在事务中同步关联时，需在事务提交后再调用，避免回滚后内存索引与数据库不一致
+    """
+    device_visibility.set_device_groups(device_id, linked_group_ids)
+    # 批量删除不触发模型信号，显式递增版本使设备列表的ETag、其他进程的可见性索引与设备目录失效
+    await bump_resource_version(RESOURCE_DEVICES, RESOURCE_DEVICE_ACL)
+    await device_catalog.bump_version()
+
+
+async def _sync_device_group_links(device: Device, group_ids: List[int]) -> Set[int]:
+    """同步关联并返回设备最终所属的分组ID"""
     group_ids = list(set(group_ids))
     if not group_ids:
         await DeviceGroup.filter(device=device).delete()
-        return
+        return set()
 
     valid_groups = await Group.filter(id__in=group_ids)
     valid_ids = {group.id for group in valid_groups}
     if not valid_ids:
         await DeviceGroup.filter(device=device).delete()
-        return
+        return set()
 
     # 删除不在列表中的关联
     await DeviceGroup.filter(device=device).exclude(group_id__in=valid_ids).delete()
@@ -345,160 +408,231 @@ async def sync_device_groups(device: Device, group_ids: Optional[List[int]]):
         group = next((g for g in valid_groups if g.id == group_id), None)
         if group:
             await DeviceGroup.create(device=device, group=group)
+    return valid_ids
 
 
-@router.get("/", response_model=BaseResponse, summary="获取设备列表")
+@router.get("/", response_model=DeviceListResponse, summary="获取设备列表")
 async def get_devices(
+    request: Request,
+    response: Response,
     page: int = Query(1, ge=1, description="页码"),
     page_size: int = Query(10, ge=1, le=1000, description="每页数量"),
     name: Optional[str] = Query(None, description="环境名称搜索"),
     ip: Optional[str] = Query(None, description="环境IP搜索"),
     status: Optional[str] = Query(None, description="环境状态搜索"),
     config_value: Optional[str] = Query(None, description="配置值搜索"),
+    latency_band: Optional[str] = Query(None, description="时延分档过滤，用逗号分隔：good/fair/poor/unknown"),
+    sort_by: Optional[str] = Query(None, pattern="^(id|latency)$", description="排序字段：id（默认）/ latency"),
+    sort_order: str = Query("asc", pattern="^(asc|desc)$", description="排序方向"),
+    fields: Optional[str] = Query(None, description="返回字段，用逗号分隔（id始终返回）；不传返回全部字段"),
+    cursor_params: CursorParams = Depends(),
     current_user: User = Depends(AuthManager.get_current_user)
 ):
     """
     获取设备列表
     - 支持分页
     - 支持按环境名称、IP、状态搜索
+    - 支持按时延分档过滤、按时延排序；过滤、排序与返回的rtt/latency_band统一使用已写回数据库的时延
+    - 过滤、分组权限与分页均下推到SQL，只加载当前页
+    - 传入cursor时使用游标分页（仅支持按ID排序）
+    - 支持ETag条件请求，数据未变化时返回304
+    - 列表项直接组装为dict并由fast_response编码，不逐行构造Pydantic模型，结构见DeviceListResponse
+    - 传入fields时只返回指定字段，使用状态、VPN、分组与共用状态只在被请求时查询和计算
     """
-    # 构建查询条件，预取分组信息
-    query = Device.all().prefetch_related(
-        "usage_info", "vpn_config", "group_links__group")
+    latency_bands = None
+    if latency_band:
+        latency_bands = {band.strip() for band in latency_band.split(',') if band.strip()}
+        invalid_bands = latency_bands - set(LATENCY_BANDS) - {LATENCY_BAND_UNKNOWN}
+        if invalid_bands:
+            raise HTTPException(status_code=400, detail=f"无效的时延分档: {', '.join(sorted(invalid_bands))}")
+    if cursor_params.enabled and sort_by == "latency":
+        raise HTTPException(status_code=400, detail="按时延排序时不支持游标分页")
+    if status and status not in {item.value for item in DeviceStatusEnum}:
+        raise HTTPException(status_code=400, detail=f"无效的设备状态: {status}")
+    selected_fields = parse_device_list_fields(fields)
+    selected = set(selected_fields or DEVICE_LIST_FIELDS)
+    need_usage = not selected.isdisjoint(DEVICE_LIST_USAGE_FIELDS)
+    need_vpn = not selected.isdisjoint(DEVICE_LIST_VPN_FIELDS)
+    need_share = not selected.isdisjoint(DEVICE_LIST_SHARE_FIELDS)
+    need_groups = "groups" in selected
+
+    # 条件请求：列表内容因人而异（分组权限、排队/共用状态）；占用时长与实时时延按分钟变化，
+    # 可见性键带上当前分钟，内容最多复用一分钟
+    not_modified = await conditional_get(
+        request, response, RESOURCE_DEVICES, f"{current_user.id}:{int(time.time() // 60)}")
+    if not_modified:
+        return not_modified
+
+    # 构建查询条件，过滤、排序与分页全部在数据库完成，只为当前页预取关联数据
+    query = Device.all()
 
     if name:
         query = query.filter(name__icontains=name)
     if ip:
         query = query.filter(ip__icontains=ip)
     if config_value:
-        config_device_ids = await DeviceConfig.filter(
-            config_value__icontains=config_value
-        ).values_list("device_id", flat=True)
-        device_id_set = set(config_device_ids)
-        if not device_id_set:
-            return BaseResponse(
-                code=200,
-                message="设备列表获取成功",
-                data={
-                    "items": [],
-                    "total": 0,
-                    "page": page,
-                    "page_size": page_size
-                }
-            )
-        query = query.filter(id__in=list(device_id_set))
-
-    # 获取所有设备用于过滤
-    all_devices = await query
-
-    user_group_ids = await get_user_group_ids(current_user)
-    filtered_devices = []
+        # 优先走配置值全文索引，不可用时回退到LIKE扫描
+        config_subquery = device_config_index.device_id_subquery(config_value)
+        if config_subquery is None:
+            config_subquery = Subquery(
+                DeviceConfig.filter(config_value__icontains=config_value).values("device_id"))
+        query = query.filter(id__in=config_subquery)
+
+    # 状态过滤：关联device_usage；尚未创建使用记录的设备按可用处理
+    if status:
+        status_filter = Q(usage_info__status=status)
+        if status == DeviceStatusEnum.AVAILABLE.value:
+            status_filter |= ~Q(id__in=Subquery(DeviceUsage.all().values("device_id")))
+        query = query.filter(status_filter)
+
+    # 分组权限过滤：属于用户任一分组，或未绑定任何分组（默认可见），条件由可见性索引生成
+    if not current_user.is_superuser:
+        await device_visibility.ensure_fresh()
+        visibility_filter = device_visibility.list_filter(current_user.id)
+        if visibility_filter is not None:
+            query = query.filter(visibility_filter)
+
+    # 时延分档过滤（按已写回的时延）
+    if latency_bands is not None:
+        band_filter = Q()
+        for band in latency_bands:
+            if band == LATENCY_BAND_UNKNOWN:
+                band_filter |= Q(last_rtt__isnull=True)
+                continue
+            low, high = LATENCY_BANDS[band]
+            condition = Q(last_rtt__gte=low)
+            if high is not None:
+                condition &= Q(last_rtt__lt=high)
+            band_filter |= condition
+        query = query.filter(band_filter)
+
+    # 只在需要使用状态相关字段时预取使用记录
+    prefetch = ["usage_info"] if need_usage else []
+
+    if cursor_params.enabled:
+        page_devices, page_info = await paginate_by_cursor(
+            query.prefetch_related(*prefetch),
+            cursor_params, page_size, descending=sort_order == "desc")
+    else:
+        total = await query.count()
 
-    for device in all_devices:
-        usage_info = getattr(device, 'usage_info', None)
-        if usage_info is None:
-            # 通过查询获取最新的使用信息，避免OneToOne未创建导致的异常
-            usage_info = await DeviceUsage.filter(device=device).first()
-        if usage_info is None:
-            usage_info = await DeviceUsage.create(device=device)
+        # 按时延排序，没有时延数据的设备始终排在最后；同值按ID保证翻页稳定
+        if sort_by == "latency":
+            query = query.annotate(
+                rtt_missing=Case(When(last_rtt__isnull=True, then=1), default=0)
+            ).order_by("rtt_missing", "-last_rtt" if sort_order == "desc" else "last_rtt", "id")
+        else:
+            query = query.order_by("-id" if sort_order == "desc" else "id")
 
-        # 状态过滤
-        if status and usage_info.status != status:
-            continue
+        # 分页
+        offset = (page - 1) * page_size
+        page_devices = await query.offset(offset).limit(page_size).prefetch_related(*prefetch)
+        page_info = {"total": total, "page": page}
 
-        # 分组权限过滤：未绑定分组默认可见
-        device_group_ids = set()
-        for link in getattr(device, "group_links", []) or []:
-            if link.group_id:
-                device_group_ids.add(link.group_id)
+    # VPN配置与分组信息从设备目录读取，不再为当前页预取
+    if need_vpn or need_groups:
+        await device_catalog.ensure_loaded()
 
-        if device_group_ids and user_group_ids is not None and not (device_group_ids & user_group_ids):
-            continue
+    normalized_employee = normalize_employee_id(current_user.employee_id)
+    user_share_status = {}
+    if need_share:
+        user_share_status = await fetch_user_share_status([device.id for device in page_devices], normalized_employee)
 
-        filtered_devices.append((device, usage_info))
+    output_fields = selected_fields or DEVICE_LIST_FIELDS
+    result = []
+    for device in page_devices:
+        # 与时延过滤、排序使用同一数据源（批量写回的时延），避免分档标签与过滤条件不一致
+        rtt = device.last_rtt
+        row = {
+            "id": device.id,
+            "name": device.name,
+            "ip": device.ip,
+            "device_type": device.device_type,
+            "form_type": device.form_type,
+            "connectivity_status": device.connectivity_status,
+            "rtt": rtt,
+            "latency_band": get_latency_band(rtt),
+            "admin_username": device.admin_username,
+            "project_name": device.owner,  # 使用owner作为project_name
+            "support_queue": device.support_queue,
+        }
 
-    # 分页
-    total = len(filtered_devices)
-    offset = (page - 1) * page_size
-    paged_devices = filtered_devices[offset:offset + page_size]
+        if need_usage:
+            # 使用记录由创建设备与启动补齐保证存在，这里不再逐条查询/创建
+            usage_info = device.usage_info or DeviceUsage(device=device)
+
+            # 计算占用时长（精确到秒，但以分钟为单位显示）
+            occupied_duration = 0
+            if usage_info.start_time and usage_info.current_user:
+                # 统一使用naive datetime进行计算
+                current_time = get_current_time()
+                # 如果数据库中的时间是aware的，转换为naive
+                start_time = usage_info.start_time.replace(
+                    tzinfo=None) if usage_info.start_time.tzinfo else usage_info.start_time
+                duration = current_time - start_time
+                # 改为向上取整，确保即使不到1分钟也显示为1分钟
+                occupied_duration = max(
+                    1, int((duration.total_seconds() + 59) / 60))
+
+            # 检查当前用户是否在排队中
+            is_current_user_in_queue = False
+            if usage_info.queue_users:
+                normalized_queue = [normalize_employee_id(
+                    u) for u in usage_info.queue_users]
+                if normalized_employee in normalized_queue:
+                    is_current_user_in_queue = True
+
+            row.update({
+                "current_user": usage_info.current_user,
+                "queue_count": len(usage_info.queue_users) if usage_info.queue_users else 0,
+                "status": usage_info.status,
+                "start_time": usage_info.start_time,
+                "occupied_duration": occupied_duration,
+                "is_current_user_in_queue": is_current_user_in_queue,
+            })
 
-    device_ids = [device.id for device, _ in paged_devices]
-    normalized_employee = normalize_employee_id(current_user.employee_id)
-    user_share_status = await fetch_user_share_status(device_ids, normalized_employee)
+        if need_vpn:
+            # 获取VPN配置信息
+            vpn_region = None
+            vpn_network = None
+            vpn_display_name = None
+            vpn_config = device_catalog.get_vpn_config(device.vpn_config_id)
+            if vpn_config:
+                vpn_region = vpn_config.region
+                vpn_network = vpn_config.network
+                vpn_display_name = vpn_config.display_name
+            elif device.required_vpn_display:
+                vpn_display_name = device.required_vpn_display
+            row.update({
+                "vpn_region": vpn_region,
+                "vpn_network": vpn_network,
+                "vpn_display_name": vpn_display_name,
+            })
 
-    result = []
-    for device, usage_info in paged_devices:
+        if need_groups:
+            row["groups"] = serialize_group_links(device)
 
-        # 计算占用时长（精确到秒，但以分钟为单位显示）
-        occupied_duration = 0
-        if usage_info.start_time and usage_info.current_user:
-            # 统一使用naive datetime进行计算
-            current_time = get_current_time()
-            # 如果数据库中的时间是aware的，转换为naive
-            start_time = usage_info.start_time.replace(
-                tzinfo=None) if usage_info.start_time.tzinfo else usage_info.start_time
-            duration = current_time - start_time
-            # 改为向上取整，确保即使不到1分钟也显示为1分钟
-            occupied_duration = max(
-                1, int((duration.total_seconds() + 59) / 60))
+        if need_share:
+            share_info = user_share_status.get(device.id) or {}
+            row.update({
+                "is_shared_user": share_info.get("status") == "approved",
+                "has_pending_share_request": share_info.get("status") == "pending",
+                "share_request_id": share_info.get("id"),
+                "share_status": share_info.get("status"),
+            })
 
-        # 检查当前用户是否在排队中
-        is_current_user_in_queue = False
-        if usage_info.queue_users:
-            normalized_queue = [normalize_employee_id(
-                u) for u in usage_info.queue_users]
-            if normalized_employee in normalized_queue:
-                is_current_user_in_queue = True
-
-        # 获取VPN配置信息
-        vpn_region = None
-        vpn_network = None
-        vpn_display_name = None
-        if hasattr(device, 'vpn_config') and device.vpn_config:
-            vpn_region = device.vpn_config.region
-            vpn_network = device.vpn_config.network
-            vpn_display_name = f"{vpn_region} - {vpn_network}"
-        elif device.required_vpn_display:
-            vpn_display_name = device.required_vpn_display
-
-        share_info = user_share_status.get(device.id) or {}
-
-        result.append(DeviceListItem(
-            id=device.id,
-            name=device.name,
-            ip=device.ip,
-            device_type=device.device_type,
-            form_type=device.form_type,
-            vpn_region=vpn_region,
-            vpn_network=vpn_network,
-            vpn_display_name=vpn_display_name,
-            current_user=usage_info.current_user,
-            queue_count=len(
-                usage_info.queue_users) if usage_info.queue_users else 0,
-            status=usage_info.status,
-            start_time=usage_info.start_time,
-            occupied_duration=occupied_duration,
-            is_current_user_in_queue=is_current_user_in_queue,
-            connectivity_status=device.connectivity_status,
-            admin_username=device.admin_username,
-            project_name=device.owner,  # 使用owner作为project_name
-            support_queue=device.support_queue,
-            groups=serialize_group_links(device),
-            is_shared_user=share_info.get("status") == "approved",
-            has_pending_share_request=share_info.get("status") == "pending",
-            share_request_id=share_info.get("id"),
-            share_status=share_info.get("status")
-        ))
+        result.append({field: row[field] for field in output_fields})
 
-    return BaseResponse(
-        code=200,
-        message="设备列表获取成功",
-        data={
+    return fast_response(
+        {
             "items": result,
-            "total": total,
-            "page": page,
-            "page_size": page_size
-        }
+            "page_size": page_size,
+            **page_info
+        },
+        message="设备列表获取成功",
+        # 部分字段时不符合完整的列表项结构，不做校验
+        schema=DeviceListPage if selected_fields is None else None,
+        response=response
     )
 
 
@@ -537,31 +671,36 @@ async def create_device(device_data: DeviceBase, current_user: User = Depends(Au
         device_dict.pop('vpn_config_id', None)
         print(f"设备数据: {device_dict}")
 
-        # 创建设备
+        # 创建设备，并在同一事务中创建使用情况与内部信息记录，保证伴生记录始终存在
         print("开始创建设备...")
-        device = await Device.create(
-            vpn_config=vpn_config,
-            required_vpn_display=vpn_display_name,
-            **device_dict
-        )
+        linked_group_ids = None
+        async with in_transaction():
+            device = await Device.create(
+                vpn_config=vpn_config,
+                required_vpn_display=vpn_display_name,
+                **device_dict
+            )
+            await DeviceUsage.create(device=device)
+            internal_info = DeviceInternal(device=device)
+            internal_info.init_ports()
+            await internal_info.save()
+
+            # 同步分组关联（只写数据库）
+            if group_ids is not None:
+                linked_group_ids = await _sync_device_group_links(device, group_ids)
+        # 事务提交后再更新内存中的可见性索引
+        if linked_group_ids is not None:
+            await apply_device_groups(device.id, linked_group_ids)
         print(f"设备创建成功: {device.id}")
-
-        # 同步分组
-        await sync_device_groups(device, group_ids)
-        await device.fetch_related("group_links__group")
     except Exception as e:
         print(f"创建设备时出错: {e}")
         print(f"错误类型: {type(e)}")
         print(f"错误堆栈: {traceback.format_exc()}")
         raise
 
-    # 创建设备使用情况记录
-    await DeviceUsage.create(device=device)
-
-    # 创建设备内部信息记录
-    internal_info = await DeviceInternal.create(device=device)
-    internal_info.init_ports()
-    await internal_info.save()
+    # 刷新设备目录
+    await device_catalog.invalidate_device(device.id)
+    await device_catalog.ensure_loaded()
 
     # 构建响应数据
     device_response = {
@@ -580,6 +719,8 @@ async def create_device(device_data: DeviceBase, current_user: User = Depends(Au
         "device_type": device.device_type,
         "form_type": device.form_type,
         "remarks": device.remarks,
+        "probe_method": device.probe_method,
+        "probe_ports": device.probe_ports,
         "groups": serialize_group_links(device),
         "created_at": device.created_at,
         "updated_at": device.updated_at
@@ -595,11 +736,14 @@ async def create_device(device_data: DeviceBase, current_user: User = Depends(Au
 @router.get("/connectivity-status", response_model=BaseResponse, summary="获取设备连通性状态")
 async def get_devices_connectivity_status(
     device_ids: str = Query(..., description="设备ID列表，用逗号分隔"),
+    deadline: Optional[float] = Query(None, ge=0, le=30, description="等待未命中缓存设备检测结果的最长秒数，超时的设备返回旧状态"),
     current_user: User = Depends(AuthManager.get_current_user)
 ):
     """
     批量获取设备连通性状态
     - device_ids: 设备ID列表，用逗号分隔，如 "1,2,3"
+    - deadline: 未命中缓存的设备最多等待的秒数，不传则等待全部检测完成
+    - stale: 为true表示返回的是缓存中的旧状态，后台正在刷新
     """
     try:
         # 解析设备ID列表
@@ -609,20 +753,16 @@ async def get_devices_connectivity_status(
         if not device_id_list:
             raise HTTPException(status_code=400, detail="设备ID列表不能为空")
 
-        # 验证设备是否存在
-        existing_devices = await Device.filter(id__in=device_id_list).prefetch_related("group_links__group")
-        existing_device_ids = {device.id for device in existing_devices}
-        accessible_device_ids = set()
-        user_group_ids = await get_user_group_ids(current_user)
-        for device in existing_devices:
-            device_group_ids = {link.group_id for link in getattr(
-                device, "group_links", []) or [] if link.group_id}
-            if device_group_ids and user_group_ids is not None and not (device_group_ids & user_group_ids):
-                continue
-            accessible_device_ids.add(device.id)
+        # 验证设备是否存在及访问权限（读取设备目录）
+        existing_device_ids, accessible_list = await filter_accessible_device_ids(device_id_list, current_user)
+        accessible_device_ids = set(accessible_list)
 
         # 获取连通性状态
-        connectivity_results = await connectivity_manager.get_multiple_connectivity_status(device_id_list)
+        # 只检测有权访问的设备，一次查询取齐IP后并发检测
+        connectivity_results = await connectivity_manager.get_multiple_connectivity_status(
+            accessible_list,
+            deadline=deadline
+        )
 
         # 格式化返回结果
         results = {}
@@ -632,6 +772,7 @@ async def get_devices_connectivity_status(
                     "status": False,
                     "last_check": None,
                     "last_ping": None,
+                    "rtt": None,
                     "error": "设备不存在"
                 }
             elif device_id not in accessible_device_ids:
@@ -639,6 +780,7 @@ async def get_devices_connectivity_status(
                     "status": False,
                     "last_check": None,
                     "last_ping": None,
+                    "rtt": None,
                     "error": "无权访问该设备"
                 }
             elif device_id in connectivity_results:
@@ -646,13 +788,18 @@ async def get_devices_connectivity_status(
                 results[device_id] = {
                     "status": connectivity_data["status"],
                     "last_check": connectivity_data["last_check"].isoformat() if connectivity_data.get("last_check") else None,
-                    "last_ping": connectivity_data["last_ping"].isoformat() if connectivity_data.get("last_ping") else None
+                    "last_ping": connectivity_data["last_ping"].isoformat() if connectivity_data.get("last_ping") else None,
+                    "rtt": connectivity_data.get("rtt"),
+                    "stale": connectivity_data.get("stale", False)
                 }
             else:
+                # 截止时间内未完成检测
                 results[device_id] = {
                     "status": False,
                     "last_check": None,
-                    "last_ping": None
+                    "last_ping": None,
+                    "rtt": None,
+                    "stale": True
                 }
 
         return BaseResponse(
@@ -668,16 +815,147 @@ async def get_devices_connectivity_status(
         raise HTTPException(status_code=500, detail="获取连通性状态失败")
 
 
+HISTORY_WINDOW_UNITS = {"m": 60, "h": 3600, "d": 86400}
+
+
+def parse_history_window(value: str) -> int:
+    """解析统计窗口，如 30m / 1h / 24h，返回秒数（不超过探测历史的保留时长）"""
+    value = value.strip().lower()
+    if len(value) < 2 or value[-1] not in HISTORY_WINDOW_UNITS or not value[:-1].isdigit():
+        raise ValueError(f"无效的统计窗口: {value}")
+    seconds = int(value[:-1]) * HISTORY_WINDOW_UNITS[value[-1]]
+    if seconds <= 0:
+        raise ValueError(f"无效的统计窗口: {value}")
+    if seconds > connectivity_manager.history_retention:
+        raise ValueError(f"统计窗口不能超过探测历史的保留时长 {connectivity_manager.history_retention // 3600}h: {value}")
+    return seconds
+
+
+@router.get("/connectivity-history", response_model=BaseResponse, summary="获取设备连通性历史统计")
+async def get_devices_connectivity_history(
+    device_ids: str = Query(..., description="设备ID列表，用逗号分隔"),
+    windows: str = Query("1h,24h", description="统计窗口列表，用逗号分隔，支持m/h/d单位"),
+    buckets: int = Query(0, ge=0, le=96, description="每个窗口的趋势分段数，0表示不返回趋势"),
+    current_user: User = Depends(AuthManager.get_current_user)
+):
+    """
+    批量获取设备的历史连通情况（来自内存中的探测历史，不触发检测）
+    - uptime: 按时长加权的在线百分比
+    - loss_rate: 失败探测占比
+    - rtt_p50 / rtt_p95 / rtt_avg: 成功探测的往返时延（毫秒）
+    - trend: 窗口等分后每段的在线百分比（buckets>0时返回）
+    - coverage: 统计实际覆盖的秒数；truncated为true时窗口前段的样本已被环形缓冲覆盖
+    """
+    try:
+        device_id_list = [int(id.strip()) for id in device_ids.split(',') if id.strip()]
+        window_map = {name.strip(): parse_history_window(name) for name in windows.split(',') if name.strip()}
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    if not device_id_list:
+        raise HTTPException(status_code=400, detail="设备ID列表不能为空")
+    if not window_map:
+        raise HTTPException(status_code=400, detail="统计窗口不能为空")
+
+    # 过滤不存在或无权访问的设备
+    _, accessible_device_ids = await filter_accessible_device_ids(device_id_list, current_user)
+
+    summaries = connectivity_manager.get_history_summary(accessible_device_ids, window_map, buckets=buckets)
+
+    return BaseResponse(
+        code=200,
+        message="连通性历史获取成功",
+        data=summaries
+    )
+
+
+# 连通性推送心跳间隔（秒），保持连接不被代理断开，同时用于检测客户端断开
+CONNECTIVITY_STREAM_HEARTBEAT = 15
+
+
+def serialize_connectivity_event(event: dict) -> dict:
+    """将连通性状态中的时间转换为字符串"""
+    return {
+        key: value.isoformat() if isinstance(value, datetime) else value
+        for key, value in event.items()
+    }
+
+
+async def generate_connectivity_stream(
+    request: Request,
+    device_ids: List[int]
+) -> AsyncGenerator[str, None]:
+    """生成连通性状态推送流：先发送当前状态快照，之后只推送状态变化"""
+    subscriber = connectivity_manager.subscribe(device_ids)
+    try:
+        # 快照只取缓存，未命中的设备在后台检测，结果以状态变化事件推送
+        snapshot = await connectivity_manager.get_multiple_connectivity_status(device_ids, deadline=0)
+        data = {device_id: serialize_connectivity_event(status) for device_id, status in snapshot.items()}
+        yield f"data: {json.dumps({'type': 'snapshot', 'data': data}, ensure_ascii=False)}\n\n"
+
+        while True:
+            if await request.is_disconnected():
+                break
+            try:
+                event = await asyncio.wait_for(subscriber.queue.get(), timeout=CONNECTIVITY_STREAM_HEARTBEAT)
+            except asyncio.TimeoutError:
+                yield f"data: {json.dumps({'type': 'heartbeat'})}\n\n"
+                continue
+            yield f"data: {json.dumps({'type': 'update', 'data': serialize_connectivity_event(event)}, ensure_ascii=False)}\n\n"
+    finally:
+        connectivity_manager.unsubscribe(subscriber)
+
+
+@router.get("/connectivity-stream", summary="订阅设备连通性状态变化（SSE）")
+async def stream_devices_connectivity(
+    request: Request,
+    device_ids: str = Query(..., description="设备ID列表，用逗号分隔"),
+    current_user: User = Depends(AuthManager.get_current_user_from_query)
+):
+    """
+    订阅设备连通性状态变化（SSE 流式输出）- GET方式支持EventSource
+    - 连接建立后推送一次snapshot，之后只在状态翻转时推送update
+    - 定期发送heartbeat
+    - 订阅期间设备保持在活跃检测列表中，替代前端定时轮询
+    """
+    try:
+        device_id_list = [int(id.strip()) for id in device_ids.split(',') if id.strip()]
+    except ValueError:
+        raise HTTPException(status_code=400, detail="设备ID格式错误")
+    if not device_id_list:
+        raise HTTPException(status_code=400, detail="设备ID列表不能为空")
+
+    # 只订阅有权访问的设备，访问权限在建立连接时校验一次
+    _, accessible_device_ids = await filter_accessible_device_ids(device_id_list, current_user)
+
+    return StreamingResponse(
+        generate_connectivity_stream(request, accessible_device_ids),
+        media_type="text/event-stream",
+        headers={
+            "Cache-Control": "no-cache",
+            "Connection": "keep-alive",
+            "X-Accel-Buffering": "no"
+        }
+    )
+
+
 @router.get("/connectivity-cache-info", response_model=BaseResponse, summary="获取连通性缓存信息")
-async def get_connectivity_cache_info(current_user: User = Depends(AuthManager.get_current_user)):
+async def get_connectivity_cache_info(
+    current_user: User = Depends(AuthManager.get_current_user),
+    user_context: UserContext = Depends(get_user_context)
+):
     """获取连通性缓存信息（调试用）"""
     # 检查管理员权限
-    is_admin = (current_user.is_superuser or
-                await current_user.has_role("管理员"))
+    is_admin = user_context.is_admin
     if not is_admin:
         raise HTTPException(status_code=403, detail="权限不足，只有管理员可以查看缓存信息")
 
     cache_info = connectivity_manager.get_cache_info()
+    cache_info["catalog"] = device_catalog.get_stats()
+    cache_info["config_index"] = device_config_index.get_stats()
+    cache_info["visibility"] = device_visibility.get_stats()
+    cache_info["login_admission"] = login_admission.get_stats()
+    cache_info["password_hasher"] = password_hasher.get_stats()
 
     return BaseResponse(
         code=200,
@@ -687,13 +965,18 @@ async def get_connectivity_cache_info(current_user: User = Depends(AuthManager.g
 
 
 @router.get("/{device_id:int}", response_model=BaseResponse, summary="获取设备详情")
-async def get_device(device_id: int, current_user: User = Depends(AuthManager.get_current_user)):
-    """根据ID获取设备详情"""
-    device = await Device.filter(id=device_id).prefetch_related("vpn_config", "group_links__group").first()
+async def get_device(
+    device_id: int,
+    current_user: User = Depends(AuthManager.get_current_user),
+    user_context: UserContext = Depends(get_user_context)
+):
+    """根据ID获取设备详情（读取设备目录）"""
+    await device_catalog.ensure_loaded()
+    device = device_catalog.get_device(device_id)
     if not device:
         raise HTTPException(status_code=404, detail="设备不存在")
 
-    await ensure_device_access(device, current_user)
+    ensure_device_access(device, user_context)
 
     # 获取VPN配置信息
     vpn_config_id = None
@@ -701,11 +984,12 @@ async def get_device(device_id: int, current_user: User = Depends(AuthManager.ge
     vpn_network = None
     vpn_display_name = None
 
-    if device.vpn_config:
-        vpn_config_id = device.vpn_config.id
-        vpn_region = device.vpn_config.region
-        vpn_network = device.vpn_config.network
-        vpn_display_name = f"{vpn_region} - {vpn_network}"
+    vpn_config = device_catalog.get_vpn_config(device.vpn_config_id)
+    if vpn_config:
+        vpn_config_id = vpn_config.id
+        vpn_region = vpn_config.region
+        vpn_network = vpn_config.network
+        vpn_display_name = vpn_config.display_name
     elif device.required_vpn_display:
         vpn_display_name = device.required_vpn_display
 
@@ -727,6 +1011,8 @@ async def get_device(device_id: int, current_user: User = Depends(AuthManager.ge
         "device_type": device.device_type,
         "form_type": device.form_type,
         "remarks": device.remarks,
+        "probe_method": device.probe_method,
+        "probe_ports": device.probe_ports,
         "groups": serialize_group_links(device),
         "created_at": device.created_at,
         "updated_at": device.updated_at
@@ -742,15 +1028,17 @@ async def get_device(device_id: int, current_user: User = Depends(AuthManager.ge
 @router.get("/{device_id:int}/connectivity", response_model=BaseResponse, summary="获取单个设备连通性状态")
 async def get_device_connectivity_status(
     device_id: int,
-    current_user: User = Depends(AuthManager.get_current_user)
+    current_user: User = Depends(AuthManager.get_current_user),
+    user_context: UserContext = Depends(get_user_context)
 ):
     """获取单个设备的连通性状态"""
     try:
-        # 验证设备是否存在
-        device = await Device.filter(id=device_id).first()
+        # 验证设备是否存在（读取设备目录）
+        await device_catalog.ensure_loaded()
+        device = device_catalog.get_device(device_id)
         if not device:
             raise HTTPException(status_code=404, detail="设备不存在")
-        await ensure_device_access(device, current_user)
+        ensure_device_access(device, user_context)
 
         # 获取连通性状态
         connectivity_data = await connectivity_manager.get_connectivity_status(device_id)
@@ -762,7 +1050,8 @@ async def get_device_connectivity_status(
                 "device_ip": device.ip,
                 "status": connectivity_data["status"],
                 "last_check": connectivity_data["last_check"].isoformat() if connectivity_data.get("last_check") else None,
-                "last_ping": connectivity_data["last_ping"].isoformat() if connectivity_data.get("last_ping") else None
+                "last_ping": connectivity_data["last_ping"].isoformat() if connectivity_data.get("last_ping") else None,
+                "rtt": connectivity_data.get("rtt")
             }
         else:
             result = {
@@ -771,7 +1060,8 @@ async def get_device_connectivity_status(
                 "device_ip": device.ip,
                 "status": False,
                 "last_check": None,
-                "last_ping": None
+                "last_ping": None,
+                "rtt": None
             }
 
         return BaseResponse(
@@ -818,9 +1108,16 @@ async def update_device(device_id: int, device_data: DeviceUpdate, current_user:
 
     # 更新设备分组
     await sync_device_groups(device, group_ids)
+    await device_catalog.invalidate_device(device_id)
+
+    # 探测方式或VPN变化后，下一轮按新配置重新检测
+    if ("probe_method" in update_data or "probe_ports" in update_data
+            or old_vpn_config_id != device.vpn_config_id):
+        connectivity_manager.invalidate_probe_target(device_id)
 
     # 重新获取设备信息以包含最新的VPN配置
-    device = await Device.filter(id=device_id).prefetch_related("vpn_config", "group_links__group").first()
+    device = await Device.filter(id=device_id).prefetch_related("vpn_config").first()
+    await device_catalog.ensure_loaded()
 
     # 如果设备VPN发生变化，迁移访问IP记录到新VPN对应的用户IP
     try:
@@ -859,6 +1156,8 @@ async def update_device(device_id: int, device_data: DeviceUpdate, current_user:
         "device_type": device.device_type,
         "form_type": device.form_type,
         "remarks": device.remarks,
+        "probe_method": device.probe_method,
+        "probe_ports": device.probe_ports,
         "groups": serialize_group_links(device),
         "created_at": device.created_at,
         "updated_at": device.updated_at
@@ -1032,6 +1331,9 @@ async def delete_device(device_id: int, current_user: User = Depends(AuthManager
 
     # 删除设备
     await device.delete()
+    await device_catalog.invalidate_device(device_id)
+    device_visibility.set_device_groups(device_id, ())
+    await device_config_index.remove_device(device_id)
 
     return BaseResponse(
         code=200,
@@ -1041,19 +1343,21 @@ async def delete_device(device_id: int, current_user: User = Depends(AuthManager
 
 
 @router.post("/use", summary="使用设备")
-async def use_device(request: DeviceUseRequest, current_user: User = Depends(AuthManager.get_current_user)):
+async def use_device(
+    request: DeviceUseRequest,
+    current_user: User = Depends(AuthManager.get_current_user),
+    user_context: UserContext = Depends(get_user_context)
+):
     """直接使用设备（普通占用）"""
-    device = await Device.filter(id=request.device_id).first()
+    device = await Device.filter(id=request.device_id).select_related("usage_info").first()
     if not device:
         raise HTTPException(status_code=404, detail="设备不存在")
-    await ensure_device_access(device, current_user)
+    ensure_device_access(device, user_context)
     await ensure_user_vpn_ip(device, current_user)
     if not device.support_queue:
         raise HTTPException(status_code=400, detail="该设备未开放使用")
 
-    usage_info = await DeviceUsage.filter(device=device).first()
-    if not usage_info:
-        usage_info = await DeviceUsage.create(device=device)
+    usage_info = require_usage_info(device)
 
     # 检查设备状态
     if usage_info.status != DeviceStatusEnum.AVAILABLE:
@@ -1106,29 +1410,27 @@ async def use_device(request: DeviceUseRequest, current_user: User = Depends(Aut
     )
 
     # 更新访问IP记录（占用人）
-    try:
-        await current_user.fetch_related('role')
-    except Exception:
-        pass
     # 占用人为当前操作人或指定用户
     occupant_user = await User.filter(employee_id__iexact=normalized_request_user).first() or current_user
     await upsert_device_access_ip(device, occupant_user, role="occupant")
 
 
 @router.post("/long-term-use", summary="申请长时间占用设备")
-async def long_term_use_device(request: DeviceLongTermUseRequest, current_user: User = Depends(AuthManager.get_current_user)):
+async def long_term_use_device(
+    request: DeviceLongTermUseRequest,
+    current_user: User = Depends(AuthManager.get_current_user),
+    user_context: UserContext = Depends(get_user_context)
+):
     """申请长时间占用设备"""
-    device = await Device.filter(id=request.device_id).first()
+    device = await Device.filter(id=request.device_id).select_related("usage_info").first()
     if not device:
         raise HTTPException(status_code=404, detail="设备不存在")
-    await ensure_device_access(device, current_user)
+    ensure_device_access(device, user_context)
     await ensure_user_vpn_ip(device, current_user)
     if not device.support_queue:
         raise HTTPException(status_code=400, detail="该设备未开放使用")
 
-    usage_info = await DeviceUsage.filter(device=device).first()
-    if not usage_info:
-        usage_info = await DeviceUsage.create(device=device)
+    usage_info = require_usage_info(device)
 
     # 检查设备状态
     if usage_info.status != DeviceStatusEnum.AVAILABLE:
@@ -1186,17 +1488,19 @@ async def long_term_use_device(request: DeviceLongTermUseRequest, current_user:
 
 
 @router.post("/queue", summary="排队等待设备")
-async def queue_device(request: DeviceUseRequest, current_user: User = Depends(AuthManager.get_current_user)):
+async def queue_device(
+    request: DeviceUseRequest,
+    current_user: User = Depends(AuthManager.get_current_user),
+    user_context: UserContext = Depends(get_user_context)
+):
     """排队等待设备"""
-    device = await Device.filter(id=request.device_id).first()
+    device = await Device.filter(id=request.device_id).select_related("usage_info").first()
     if not device:
         raise HTTPException(status_code=404, detail="设备不存在")
-    await ensure_device_access(device, current_user)
+    ensure_device_access(device, user_context)
     await ensure_user_vpn_ip(device, current_user)
 
-    usage_info = await DeviceUsage.filter(device=device).first()
-    if not usage_info:
-        usage_info = await DeviceUsage.create(device=device)
+    usage_info = require_usage_info(device)
 
     normalized_current_user = normalize_employee_id(current_user.employee_id)
     requested_user = resolve_request_user(request.user, current_user)
@@ -1247,7 +1551,11 @@ async def queue_device(request: DeviceUseRequest, current_user: User = Depends(A
 
 
 @router.post("/release", summary="释放设备")
-async def release_device(request: DeviceReleaseRequest, current_user: User = Depends(AuthManager.get_current_user)):
+async def release_device(
+    request: DeviceReleaseRequest,
+    current_user: User = Depends(AuthManager.get_current_user),
+    user_context: UserContext = Depends(get_user_context)
+):
     """释放设备"""
     device = await Device.filter(id=request.device_id).first()
     if not device:
@@ -1261,8 +1569,7 @@ async def release_device(request: DeviceReleaseRequest, current_user: User = Dep
     # 检查权限：当前使用者、管理员或超级管理员才能释放设备
     is_current_user = normalize_employee_id(
         usage_info.current_user) == current_employee_id
-    is_admin_or_super = (current_user.is_superuser or
-                         await current_user.has_role("管理员"))
+    is_admin_or_super = user_context.is_admin
 
     if not (is_current_user or is_admin_or_super):
         raise HTTPException(status_code=403, detail="只有当前使用者、管理员或超级管理员才能释放设备")
@@ -1443,21 +1750,23 @@ async def cancel_queue(request: DeviceCancelQueueRequest, current_user: User = D
 
 
 @router.get("/{device_id:int}/usage", response_model=BaseResponse, summary="获取设备使用情况")
-async def get_device_usage(device_id: int, current_user: User = Depends(AuthManager.get_current_user)):
+async def get_device_usage(
+    device_id: int,
+    current_user: User = Depends(AuthManager.get_current_user),
+    user_context: UserContext = Depends(get_user_context)
+):
     """获取设备使用情况详情"""
-    device = await Device.filter(id=device_id).first()
+    device = await Device.filter(id=device_id).select_related("usage_info").first()
     if not device:
         raise HTTPException(status_code=404, detail="设备不存在")
-    await ensure_device_access(device, current_user)
+    ensure_device_access(device, user_context)
     # 预取VPN配置，供IP匹配
     try:
         await device.fetch_related("vpn_config")
     except Exception:
         pass
 
-    usage_info = await DeviceUsage.filter(device=device).first()
-    if not usage_info:
-        usage_info = await DeviceUsage.create(device=device)
+    usage_info = require_usage_info(device)
 
     # 计算占用时长（精确到秒，但以分钟为单位显示）
     occupied_duration = 0
@@ -1520,7 +1829,7 @@ async def get_device_usage(device_id: int, current_user: User = Depends(AuthMana
     ]
 
     # 可见性：占用人、共用用户、管理员/超级管理员可见
-    is_admin_or_super = current_user.is_superuser or (await current_user.has_role("管理员"))
+    is_admin_or_super = user_context.is_admin
     is_occupant = usage_info.current_user and normalize_employee_id(
         usage_info.current_user) == normalized_employee
     is_shared = usage_data.get("is_shared_user", False)
@@ -1536,24 +1845,24 @@ async def get_device_usage(device_id: int, current_user: User = Depends(AuthMana
 
 
 @router.post("/preempt", summary="抢占设备")
-async def preempt_device(request: DevicePreemptRequest, current_user: User = Depends(AuthManager.get_current_user)):
+async def preempt_device(
+    request: DevicePreemptRequest,
+    current_user: User = Depends(AuthManager.get_current_user),
+    user_context: UserContext = Depends(get_user_context)
+):
     """高级用户抢占设备"""
     # 检查用户权限 - 只有高级用户、管理员、超级用户才能抢占
-    is_advanced_or_admin = (current_user.is_superuser or
-                            await current_user.has_role("管理员") or
-                            await current_user.has_role("高级用户"))
+    is_advanced_or_admin = user_context.is_advanced
 
     if not is_advanced_or_admin:
         raise HTTPException(status_code=403, detail="只有高级用户、管理员或超级管理员才能抢占设备")
 
-    device = await Device.filter(id=request.device_id).first()
+    device = await Device.filter(id=request.device_id).select_related("usage_info").first()
     if not device:
         raise HTTPException(status_code=404, detail="设备不存在")
     await ensure_user_vpn_ip(device, current_user)
 
-    usage_info = await DeviceUsage.filter(device=device).first()
-    if not usage_info:
-        usage_info = await DeviceUsage.create(device=device)
+    usage_info = require_usage_info(device)
 
     normalized_current_employee = normalize_employee_id(
         current_user.employee_id)
@@ -1663,17 +1972,19 @@ async def preempt_device(request: DevicePreemptRequest, current_user: User = Dep
 
 
 @router.post("/priority-queue", summary="优先排队")
-async def priority_queue(request: DevicePriorityQueueRequest, current_user: User = Depends(AuthManager.get_current_user)):
+async def priority_queue(
+    request: DevicePriorityQueueRequest,
+    current_user: User = Depends(AuthManager.get_current_user),
+    user_context: UserContext = Depends(get_user_context)
+):
     """高级用户优先排队"""
     # 检查用户权限 - 只有高级用户、管理员、超级用户才能优先排队
-    is_advanced_or_admin = (current_user.is_superuser or
-                            await current_user.has_role("管理员") or
-                            await current_user.has_role("高级用户"))
+    is_advanced_or_admin = user_context.is_advanced
 
     if not is_advanced_or_admin:
         raise HTTPException(status_code=403, detail="只有高级用户、管理员或超级管理员才能优先排队")
 
-    device = await Device.filter(id=request.device_id).first()
+    device = await Device.filter(id=request.device_id).select_related("usage_info").first()
     if not device:
         raise HTTPException(status_code=404, detail="设备不存在")
     await ensure_user_vpn_ip(device, current_user)
@@ -1681,9 +1992,7 @@ async def priority_queue(request: DevicePriorityQueueRequest, current_user: User
     if not device.support_queue:
         raise HTTPException(status_code=400, detail="该设备不支持排队等待")
 
-    usage_info = await DeviceUsage.filter(device=device).first()
-    if not usage_info:
-        usage_info = await DeviceUsage.create(device=device)
+    usage_info = require_usage_info(device)
 
     # 检查设备状态
     normalized_request_user = resolve_request_user(request.user, current_user)
@@ -1762,17 +2071,19 @@ async def priority_queue(request: DevicePriorityQueueRequest, current_user: User
 
 
 @router.post("/unified-queue", summary="统一排队")
-async def unified_queue(request: DeviceUnifiedQueueRequest, current_user: User = Depends(AuthManager.get_current_user)):
+async def unified_queue(
+    request: DeviceUnifiedQueueRequest,
+    current_user: User = Depends(AuthManager.get_current_user),
+    user_context: UserContext = Depends(get_user_context)
+):
     """统一排队接口：设备可用时直接使用，否则加入排队"""
-    device = await Device.filter(id=request.device_id).first()
+    device = await Device.filter(id=request.device_id).select_related("usage_info").first()
     if not device:
         raise HTTPException(status_code=404, detail="设备不存在")
     await ensure_user_vpn_ip(device, current_user)
-    await ensure_device_access(device, current_user)
+    ensure_device_access(device, user_context)
 
-    usage_info = await DeviceUsage.filter(device=device).first()
-    if not usage_info:
-        usage_info = await DeviceUsage.create(device=device)
+    usage_info = require_usage_info(device)
 
     # 检查设备状态
     normalized_request_user = resolve_request_user(request.user, current_user)
@@ -1857,13 +2168,14 @@ async def unified_queue(request: DeviceUnifiedQueueRequest, current_user: User =
 @router.post("/share-requests", response_model=BaseResponse, summary="申请共用设备")
 async def create_share_request(
     share_data: DeviceShareRequestCreate,
-    current_user: User = Depends(AuthManager.get_current_user)
+    current_user: User = Depends(AuthManager.get_current_user),
+    user_context: UserContext = Depends(get_user_context)
 ):
     """申请共用已被占用的设备"""
     device = await Device.filter(id=share_data.device_id).first()
     if not device:
         raise HTTPException(status_code=404, detail="设备不存在")
-    await ensure_device_access(device, current_user)
+    ensure_device_access(device, user_context)
     await ensure_user_vpn_ip(device, current_user)
 
     usage_info = await DeviceUsage.filter(device=device).first()
@@ -2022,7 +2334,8 @@ async def decide_share_request(
 @router.post("/share-requests/{request_id:int}/revoke", response_model=BaseResponse, summary="剔除共用用户")
 async def revoke_shared_user(
     request_id: int,
-    current_user: User = Depends(AuthManager.get_current_user)
+    current_user: User = Depends(AuthManager.get_current_user),
+    user_context: UserContext = Depends(get_user_context)
 ):
     """占用人或管理员剔除已审批的共用用户"""
     share_request = await DeviceShareRequest.filter(id=request_id).prefetch_related("device").first()
@@ -2036,7 +2349,7 @@ async def revoke_shared_user(
 
     # 权限：设备当前占用人或管理员/超级管理员
     normalized_employee = normalize_employee_id(current_user.employee_id)
-    is_admin_or_super = current_user.is_superuser or (await current_user.has_role("管理员"))
+    is_admin_or_super = user_context.is_admin
     is_occupant = usage_info.current_user and normalize_employee_id(
         usage_info.current_user) == normalized_employee
     if not (is_admin_or_super or is_occupant):
@@ -2133,14 +2446,11 @@ async def get_my_usage_summary(current_user: User = Depends(AuthManager.get_curr
     """获取我当前占用和共用的设备"""
     normalized_employee = normalize_employee_id(current_user.employee_id)
     usage_infos = await DeviceUsage.filter(current_user__iexact=normalized_employee).prefetch_related("device")
+    await device_catalog.ensure_loaded()
     occupied_devices = []
     for usage in usage_infos:
         if not usage.device:
             continue
-        try:
-            await usage.device.fetch_related("usage_info", "group_links__group")
-        except Exception:
-            pass
         occupied_duration = 0
         if usage.start_time and usage.current_user:
             current_time = get_current_time()
@@ -2171,7 +2481,7 @@ async def get_my_usage_summary(current_user: User = Depends(AuthManager.get_curr
         if not device:
             continue
         try:
-            await device.fetch_related("usage_info", "group_links__group")
+            await device.fetch_related("usage_info")
         except Exception:
             pass
         current_usage = getattr(device, "usage_info", None)
@@ -2365,11 +2675,13 @@ async def batch_cancel_my_queues(current_user: User = Depends(AuthManager.get_cu
 
 
 @router.post("/admin/force-cleanup-all", summary="管理员强制清理所有设备")
-async def admin_force_cleanup_all_devices(current_user: User = Depends(AuthManager.get_current_user)):
+async def admin_force_cleanup_all_devices(
+    current_user: User = Depends(AuthManager.get_current_user),
+    user_context: UserContext = Depends(get_user_context)
+):
     """管理员强制清理所有设备的占用和排队状态"""
     # 检查管理员权限
-    is_admin = (current_user.is_superuser or
-                await current_user.has_role("管理员"))
+    is_admin = user_context.is_admin
     if not is_admin:
         raise HTTPException(status_code=403, detail="权限不足，只有管理员可以执行此操作")
 
@@ -2427,7 +2739,8 @@ async def get_device_configs(
 async def add_device_config(
     device_id: int,
     config_data: DeviceConfigCreate,
-    current_user: User = Depends(AuthManager.get_current_user)
+    current_user: User = Depends(AuthManager.get_current_user),
+    user_context: UserContext = Depends(get_user_context)
 ):
     """
     添加设备配置
@@ -2441,7 +2754,7 @@ async def add_device_config(
 
     # 权限检查：只有设备归属人或管理员可以修改
     current_user_id = current_user.employee_id or current_user.username
-    is_admin = current_user.is_superuser or current_user.role == '管理员'
+    is_admin = user_context.is_admin
     is_owner = device.owner == current_user_id
 
     if not (is_admin or is_owner):
@@ -2465,6 +2778,7 @@ async def add_device_config(
             config_param2=config_data.config_param2,
             config_value=config_data.config_value
         )
+        await device_config_index.upsert(config)
 
         # 记录操作日志
         await OperationLog.create_log(
@@ -2495,7 +2809,8 @@ async def add_device_config(
 @router.post("/{device_id:int}/configs/import-all", response_model=BaseResponse, summary="一键导入设备全部配置")
 async def import_all_device_configs(
     device_id: int,
-    current_user: User = Depends(AuthManager.get_current_user)
+    current_user: User = Depends(AuthManager.get_current_user),
+    user_context: UserContext = Depends(get_user_context)
 ):
     """
     一键导入设备所有配置（占位实现）
@@ -2507,7 +2822,7 @@ async def import_all_device_configs(
         raise HTTPException(status_code=404, detail="设备不存在")
 
     current_user_id = current_user.employee_id or current_user.username
-    is_admin = current_user.is_superuser or current_user.role == '管理员'
+    is_admin = user_context.is_admin
     is_owner = device.owner == current_user_id
 
     if not (is_admin or is_owner):
@@ -2539,7 +2854,8 @@ async def update_device_config(
     device_id: int,
     config_id: int,
     config_data: DeviceConfigUpdate,
-    current_user: User = Depends(AuthManager.get_current_user)
+    current_user: User = Depends(AuthManager.get_current_user),
+    user_context: UserContext = Depends(get_user_context)
 ):
     """
     更新设备配置
@@ -2557,7 +2873,7 @@ async def update_device_config(
 
     # 权限检查：只有设备归属人或管理员可以修改
     current_user_id = current_user.employee_id or current_user.username
-    is_admin = current_user.is_superuser or current_user.role == '管理员'
+    is_admin = user_context.is_admin
     is_owner = device.owner == current_user_id
 
     if not (is_admin or is_owner):
@@ -2582,6 +2898,7 @@ async def update_device_config(
         config.config_param2 = config_data.config_param2
         config.config_value = config_data.config_value
         await config.save()
+        await device_config_index.upsert(config)
 
         # 记录操作日志
         await OperationLog.create_log(
@@ -2613,7 +2930,8 @@ async def update_device_config(
 async def import_device_config(
     device_id: int,
     config_id: int,
-    current_user: User = Depends(AuthManager.get_current_user)
+    current_user: User = Depends(AuthManager.get_current_user),
+    user_context: UserContext = Depends(get_user_context)
 ):
     """
     一键导入设备配置
@@ -2629,7 +2947,7 @@ async def import_device_config(
         raise HTTPException(status_code=404, detail="配置不存在")
 
     current_user_id = current_user.employee_id or current_user.username
-    is_admin = current_user.is_superuser or current_user.role == '管理员'
+    is_admin = user_context.is_admin
     is_owner = device.owner == current_user_id
 
     if not (is_admin or is_owner):
@@ -2665,7 +2983,8 @@ async def import_device_config(
 async def delete_device_config(
     device_id: int,
     config_id: int,
-    current_user: User = Depends(AuthManager.get_current_user)
+    current_user: User = Depends(AuthManager.get_current_user),
+    user_context: UserContext = Depends(get_user_context)
 ):
     """
     删除设备配置
@@ -2683,7 +3002,7 @@ async def delete_device_config(
 
     # 权限检查：只有设备归属人或管理员可以修改
     current_user_id = current_user.employee_id or current_user.username
-    is_admin = current_user.is_superuser or current_user.role == '管理员'
+    is_admin = user_context.is_admin
     is_owner = device.owner == current_user_id
 
     if not (is_admin or is_owner):
@@ -2693,6 +3012,7 @@ async def delete_device_config(
     try:
         config_info = f"参数1={config.config_param1}, 参数2={config.config_param2}, 值={config.config_value}"
         await config.delete()
+        await device_config_index.remove(config_id)
 
         # 记录操作日志
         await OperationLog.create_log(
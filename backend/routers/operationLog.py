@@ -1,15 +1,79 @@
 """
 操作日志路由
 """
-from fastapi import APIRouter, Depends, Query
-from typing import Optional
+from fastapi import APIRouter, Depends, HTTPException, Query
+from typing import List, Optional
+from tortoise.expressions import Q
 from models.admin import OperationLog, LoginLog, User
 from schemas import BaseResponse
 from auth import AuthManager
+from utils.pagination import CursorParams, paginate_by_cursor
 
 router = APIRouter(prefix="/api/operation-logs", tags=["操作日志"])
 
 
+# 登出记录在登录日志中以失败原因标记
+LOGOUT_REASON = "用户主动登出"
+
+
+def _login_type_filter(operation_types: List[str]) -> Q:
+    """将login/logout操作类型转换为登录日志的查询条件"""
+    conditions = []
+    if "login" in operation_types:
+        # 登录成功，或失败原因不是登出的失败记录
+        conditions.append(Q(login_result=True))
+        conditions.append(Q(login_result=False, failure_reason__isnull=True))
+        conditions.append(Q(login_result=False) & ~Q(failure_reason=LOGOUT_REASON))
+    if "logout" in operation_types:
+        conditions.append(Q(login_result=False, failure_reason=LOGOUT_REASON))
+    return Q(*conditions, join_type="OR")
+
+
+def _serialize_login_log(log: LoginLog) -> dict:
+    """根据login_result和failure_reason还原操作类型"""
+    if log.login_result:
+        # 登录成功
+        log_operation_type = "login"
+        operation_result = "success"
+        description = "用户登录成功"
+    elif log.failure_reason == LOGOUT_REASON:
+        # 用户登出
+        log_operation_type = "logout"
+        operation_result = "success"
+        description = "用户登出"
+    else:
+        # 登录失败
+        log_operation_type = "login"
+        operation_result = "failed"
+        description = f"用户登录失败: {log.failure_reason or '未知原因'}"
+
+    return {
+        "id": log.id,
+        "employee_id": log.user.employee_id,
+        "username": log.user.username,
+        "operation_type": log_operation_type,
+        "operation_result": operation_result,
+        "device_name": None,
+        "description": description,
+        "ip_address": log.ip_address,
+        "created_at": log.login_time.isoformat() if log.login_time else None
+    }
+
+
+def _serialize_operation_log(log: OperationLog) -> dict:
+    return {
+        "id": log.id,
+        "employee_id": log.employee_id,
+        "username": log.username,
+        "operation_type": log.operation_type,
+        "operation_result": log.operation_result,
+        "device_name": log.device_name,
+        "description": log.description,
+        "ip_address": log.ip_address,
+        "created_at": log.created_at.isoformat() if log.created_at else None
+    }
+
+
 @router.get("", summary="获取操作日志列表")
 async def get_operation_logs(
     page: int = Query(1, ge=1, description="页码"),
@@ -18,9 +82,10 @@ async def get_operation_logs(
     operation_type: Optional[str] = Query(None, description="操作类型"),
     start_date: Optional[str] = Query(None, description="开始日期"),
     end_date: Optional[str] = Query(None, description="结束日期"),
+    cursor_params: CursorParams = Depends(),
     current_user: User = Depends(AuthManager.get_current_user)
 ):
-    """获取操作日志列表"""
+    """获取操作日志列表（按时间倒序，支持页码分页与游标分页）"""
     try:
         # 处理操作类型过滤
         if operation_type:
@@ -28,64 +93,31 @@ async def get_operation_logs(
             operation_types = [t.strip()
                                for t in operation_type.split(',') if t.strip()]
             if any(t in ["login", "logout"] for t in operation_types):
-                # 查询登录日志
-                login_query = LoginLog.all()
+                # 查询登录日志，操作类型在数据库中过滤
+                login_query = LoginLog.filter(_login_type_filter(operation_types))
 
                 if employee_id:
                     # 通过用户关联查询
                     login_query = login_query.filter(
                         user__employee_id__icontains=employee_id)
+                login_query = login_query.prefetch_related('user')
 
-                # 获取所有登录日志用于过滤
-                all_login_logs = await login_query.prefetch_related('user')
-
-                # 根据操作类型过滤
-                filtered_items = []
-                for log in all_login_logs:
-                    # 根据login_result和failure_reason判断操作类型
-                    if log.login_result:
-                        # 登录成功
-                        log_operation_type = "login"
-                        operation_result = "success"
-                        description = "用户登录成功"
-                    elif log.failure_reason == "用户主动登出":
-                        # 用户登出
-                        log_operation_type = "logout"
-                        operation_result = "success"
-                        description = "用户登出"
-                    else:
-                        # 登录失败
-                        log_operation_type = "login"
-                        operation_result = "failed"
-                        description = f"用户登录失败: {log.failure_reason or '未知原因'}"
-
-                    # 检查是否匹配搜索的操作类型
-                    if log_operation_type in operation_types:
-                        filtered_items.append({
-                            "id": log.id,
-                            "employee_id": log.user.employee_id,
-                            "username": log.user.username,
-                            "operation_type": log_operation_type,
-                            "operation_result": operation_result,
-                            "device_name": None,
-                            "description": description,
-                            "ip_address": log.ip_address,
-                            "created_at": log.login_time.isoformat() if log.login_time else None
-                        })
-
-                # 手动分页
-                total = len(filtered_items)
-                offset = (page - 1) * page_size
-                items = filtered_items[offset:offset + page_size]
+                if cursor_params.enabled:
+                    login_logs, page_info = await paginate_by_cursor(
+                        login_query, cursor_params, page_size, sort_field="login_time", descending=True)
+                else:
+                    total = await login_query.count()
+                    offset = (page - 1) * page_size
+                    login_logs = await login_query.offset(offset).limit(page_size).order_by('-login_time', '-id')
+                    page_info = {"total": total, "page": page}
 
                 return BaseResponse(
                     code=200,
                     message="获取登录日志成功",
                     data={
-                        "items": items,
-                        "total": total,
-                        "page": page,
-                        "page_size": page_size
+                        "items": [_serialize_login_log(log) for log in login_logs],
+                        "page_size": page_size,
+                        **page_info
                     }
                 )
 
@@ -109,36 +141,27 @@ async def get_operation_logs(
             query = query.filter(created_at__lte=end_date)
 
         # 分页
-        total = await query.count()
-        offset = (page - 1) * page_size
-        logs = await query.offset(offset).limit(page_size).order_by('-created_at')
-
-        # 转换为字典格式
-        items = []
-        for log in logs:
-            items.append({
-                "id": log.id,
-                "employee_id": log.employee_id,
-                "username": log.username,
-                "operation_type": log.operation_type,
-                "operation_result": log.operation_result,
-                "device_name": log.device_name,
-                "description": log.description,
-                "ip_address": log.ip_address,
-                "created_at": log.created_at.isoformat() if log.created_at else None
-            })
+        if cursor_params.enabled:
+            logs, page_info = await paginate_by_cursor(
+                query, cursor_params, page_size, sort_field="created_at", descending=True)
+        else:
+            total = await query.count()
+            offset = (page - 1) * page_size
+            logs = await query.offset(offset).limit(page_size).order_by('-created_at')
+            page_info = {"total": total, "page": page}
 
         return BaseResponse(
             code=200,
             message="获取操作日志成功",
             data={
-                "items": items,
-                "total": total,
-                "page": page,
-                "page_size": page_size
+                "items": [_serialize_operation_log(log) for log in logs],
+                "page_size": page_size,
+                **page_info
             }
         )
 
+    except HTTPException:
+        raise
     except Exception as e:
         print(f"获取操作日志失败: {e}")
         return BaseResponse(
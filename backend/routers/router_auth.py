@@ -3,10 +3,9 @@
 包含用户注册、登录、登出等功能
 """
 from datetime import timedelta
-from fastapi import APIRouter, Depends, HTTPException, status, Request
+from fastapi import APIRouter, Depends, HTTPException, status, Request, Response
 from fastapi.security import OAuth2PasswordRequestForm
 from tortoise import models
-from tortoise.expressions import Q
 from models.admin import User, Role
 from models.admin import Permission, RolePermission
 from models.admin import Menu, Permission
@@ -15,8 +14,10 @@ from schemas import (
     UserRegister, UserLogin, UserResponse, Token,
     BaseResponse, PasswordChange
 )
-from auth import AuthManager, LoginManager, require_active_user
+from auth import AuthManager, LoginManager, login_admission, require_active_user, user_context_cache
 from config import settings
+from utils.etag import RESOURCE_MENUS, conditional_get
+from permission_registry import permission_registry
 
 router = APIRouter(prefix="/auth", tags=["认证"])
 
@@ -60,20 +61,17 @@ async def register(user_data: UserRegister):
         )
 
     # 创建用户
-    hashed_password = AuthManager.get_password_hash(user_data.password)
+    hashed_password = await AuthManager.get_password_hash_async(user_data.password)
+    # 为新用户分配默认角色，随创建一并写入
+    default_role = await Role.filter(name="普通用户").first()
     user = await User.create(
         employee_id=user_data.employee_id,
         username=user_data.username,
         hashed_password=hashed_password,
-        is_superuser=False  # 新用户默认不是超级用户
+        is_superuser=False,  # 新用户默认不是超级用户
+        role=default_role
     )
 
-    # 为新用户分配默认角色
-    default_role = await Role.filter(name="普通用户").first()
-    if default_role:
-        user.role = default_role
-        await user.save()
-
     # 将新用户加入默认分组
     default_group = await Group.filter(name="公共组").first()
     if default_group:
@@ -86,13 +84,14 @@ async def register(user_data: UserRegister):
     )
 
 
-@router.post("/login", response_model=BaseResponse, summary="用户登录")
+@router.post("/login", response_model=BaseResponse, summary="用户登录", dependencies=[Depends(login_admission)])
 async def login(request: Request, login_data: UserLogin):
     """
     用户登录接口
     - 验证工号和密码
     - 生成JWT访问令牌
     - 记录登录日志
+    - 同时处理中的登录请求过多时返回429
     """
     # 获取客户端信息
     ip_address = LoginManager.get_client_ip(request)
@@ -209,18 +208,25 @@ async def change_password(
 ):
     """
     修改当前用户密码
+    current_user可能来自用户上下文缓存，验证旧密码前重新读取用户记录，
+    避免用缓存中过期的密码哈希校验，或整行保存时覆盖其他字段的最新修改
     """
+    user = await User.get_or_none(id=current_user.id)
+    if not user:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="用户不存在")
+
     # 验证旧密码
-    if not AuthManager.verify_password(password_data.old_password, current_user.hashed_password):
+    if not await AuthManager.verify_password_async(password_data.old_password, user.hashed_password):
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
             detail="原密码错误"
         )
 
-    # 更新密码
-    current_user.hashed_password = AuthManager.get_password_hash(
+    # 更新密码，只写密码列
+    user.hashed_password = await AuthManager.get_password_hash_async(
         password_data.new_password)
-    await current_user.save()
+    await user.save(update_fields=["hashed_password"])
+    user_context_cache.invalidate(user.employee_id)
 
     return BaseResponse(
         code=200,
@@ -231,59 +237,44 @@ async def change_password(
 @router.get("/permissions", response_model=BaseResponse, summary="获取当前用户权限")
 async def get_user_permissions(current_user: User = require_active_user):
     """
-    获取当前用户的权限列表
+    获取当前用户的权限列表（读取权限注册表）
     """
+    await permission_registry.ensure_fresh()
 
     if current_user.is_superuser:
         # 超级用户拥有所有权限
-        all_permissions = await Permission.all().values('code', 'name', 'description')
-        return BaseResponse(
-            code=200,
-            message="获取权限成功",
-            data={"permissions": list(all_permissions)}
-        )
-
-    # 普通用户通过角色获取权限
-    if current_user.role:
-        permissions = await Permission.filter(
-            permission_roles__role_id=current_user.role_id
-        ).values('code', 'name', 'description')
+        mask = permission_registry.all_mask
     else:
-        permissions = []
+        # 普通用户通过角色获取权限
+        mask = permission_registry.get_role_mask(current_user.role_id)
 
     return BaseResponse(
         code=200,
         message="获取权限成功",
-        data={"permissions": list(permissions)}
+        data={"permissions": permission_registry.get_permissions(mask)}
     )
 
 
 @router.get("/menus", response_model=BaseResponse, summary="获取用户菜单")
-async def get_user_menus(current_user: User = require_active_user):
+async def get_user_menus(request: Request, response: Response, current_user: User = require_active_user):
     """
     获取当前用户可访问的菜单列表
+    菜单只取决于是否超级用户及角色，以此作为ETag可见性键，未变化时返回304
     """
-
-    # 获取用户权限代码列表
-    if current_user.is_superuser:
-        # 超级用户看到所有菜单
-        menus = await Menu.filter(is_visible=True).order_by('sort_order')
-    else:
-        # 获取用户权限
-        if current_user.role:
-            user_permissions = await Permission.filter(
-                permission_roles__role_id=current_user.role_id
-            ).values_list('code', flat=True)
-        else:
-            user_permissions = []
-
-        # 获取有权限的菜单或无权限要求的菜单
-        menus = await Menu.filter(
-            is_visible=True
-        ).filter(
-            Q(permission_code__in=user_permissions) |
-            Q(permission_code__isnull=True)
-        ).order_by('sort_order')
+    visibility_key = "superuser" if current_user.is_superuser else f"role:{current_user.role_id}"
+    not_modified = await conditional_get(request, response, RESOURCE_MENUS, visibility_key)
+    if not_modified:
+        return not_modified
+
+    menus = await Menu.filter(is_visible=True).order_by('sort_order')
+    if not current_user.is_superuser:
+        # 超级用户看到所有菜单；其他用户只保留有权限或无权限要求的菜单（按角色权限位图判断）
+        await permission_registry.ensure_fresh()
+        menus = [
+            menu for menu in menus
+            if menu.permission_code is None
+            or permission_registry.has_permission(current_user.role_id, menu.permission_code)
+        ]
 
     # 构建菜单树
     menu_dict = {}
@@ -2,7 +2,7 @@
 用户管理相关的API路由
 包含用户列表查询、用户角色更新等功能
 """
-from fastapi import APIRouter, Depends, HTTPException, status, Query
+from fastapi import APIRouter, Depends, HTTPException, status, Query, Request, Response
 from typing import List, Optional
 from models.admin import User, Role
 from models.groupModel import Group, GroupMember
@@ -15,7 +15,10 @@ from schemas import (
     UserGroupUpdateRequest,
     GroupMembersAddRequest
 )
-from auth import AuthManager, require_active_user, PermissionChecker, Permissions
+from auth import AuthManager, require_active_user, PermissionChecker, Permissions, user_context_cache
+from device_catalog import device_catalog
+from device_visibility import device_visibility
+from utils.etag import RESOURCE_DEVICE_ACL, RESOURCE_DEVICES, RESOURCE_GROUPS, bump_resource_version, conditional_get
 
 router = APIRouter(prefix="/api/users", tags=["用户管理"])
 
@@ -126,8 +129,12 @@ async def get_available_roles(
 
 
 @router.get("/groups", response_model=BaseResponse, summary="获取所有用户分组")
-async def list_groups(current_user: User = require_active_user):
-    """获取分组及其成员列表（所有登录用户可见）"""
+async def list_groups(request: Request, response: Response, current_user: User = require_active_user):
+    """获取分组及其成员列表（所有登录用户可见），支持ETag条件请求"""
+    not_modified = await conditional_get(request, response, RESOURCE_GROUPS)
+    if not_modified:
+        return not_modified
+
     groups = await Group.all().order_by("sort_order", "id").prefetch_related("members__user", "members__user__role")
     group_list = []
     for group in groups:
@@ -170,6 +177,7 @@ async def create_group(
         raise HTTPException(status_code=400, detail="分组名称已存在")
 
     group = await Group.create(**group_data.model_dump())
+    await device_catalog.invalidate_groups()
     return BaseResponse(
         code=200,
         message="分组创建成功",
@@ -196,6 +204,7 @@ async def update_group(
 
     await group.update_from_dict(group_data.model_dump(exclude_unset=True))
     await group.save()
+    await device_catalog.invalidate_groups()
     return BaseResponse(
         code=200,
         message="分组更新成功",
@@ -216,6 +225,9 @@ async def delete_group(
 
     await GroupMember.filter(group_id=group.id).delete()
     await group.delete()
+    await device_catalog.invalidate_groups()
+    device_visibility.remove_group(group.id)
+    user_context_cache.clear()
     return BaseResponse(
         code=200,
         message="分组删除成功",
@@ -253,6 +265,8 @@ async def add_group_members(
             continue
         await GroupMember.create(group=group, user=user)
         created_count += 1
+    device_visibility.add_group_members(group.id, found_ids)
+    user_context_cache.invalidate_user_ids(found_ids)
 
     members_data = []
     members = await GroupMember.filter(group_id=group_id).prefetch_related("user__role")
@@ -296,6 +310,9 @@ async def remove_group_members(
         raise HTTPException(status_code=400, detail="用户ID列表不能为空")
 
     removed_count = await GroupMember.filter(group_id=group_id, user_id__in=user_ids).delete()
+    await bump_resource_version(RESOURCE_GROUPS, RESOURCE_DEVICES, RESOURCE_DEVICE_ACL)
+    device_visibility.remove_group_members(group.id, user_ids)
+    user_context_cache.invalidate_user_ids(user_ids)
 
     members_data = []
     members = await GroupMember.filter(group_id=group_id).prefetch_related("user__role")
@@ -387,6 +404,7 @@ async def update_user_role(
     try:
         target_user.role = new_role
         await target_user.save()
+        user_context_cache.invalidate(target_user.employee_id)
     except Exception as e:
         print(f"更新用户角色时发生错误: {e}")
         raise HTTPException(
@@ -472,8 +490,10 @@ async def delete_user(
             detail="不能删除自己"
         )
 
-    # 删除用户（角色关联会自动处理）
+    # 删除用户（角色关联会自动处理，分组成员级联删除）
     await target_user.delete()
+    device_visibility.set_user_groups(target_user.id, ())
+    user_context_cache.invalidate(target_user.employee_id)
 
     return BaseResponse(
         code=200,
@@ -514,6 +534,10 @@ async def update_user_groups(
                 await GroupMember.create(user=user, group=group)
     else:
         await GroupMember.filter(user_id=user.id).delete()
+    # 批量删除不触发模型信号，显式递增版本使分组与设备列表的ETag及其他进程的可见性索引失效
+    await bump_resource_version(RESOURCE_GROUPS, RESOURCE_DEVICES, RESOURCE_DEVICE_ACL)
+    device_visibility.set_user_groups(user.id, target_ids)
+    user_context_cache.invalidate(user.employee_id)
 
     await user.fetch_related('group_memberships__group', 'role')
     return BaseResponse(
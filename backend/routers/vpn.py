@@ -2,7 +2,7 @@
 VPN配置管理路由
 提供VPN配置的增删改查和用户VPN IP配置管理API接口
 """
-from fastapi import APIRouter, HTTPException, Depends, Query
+from fastapi import APIRouter, HTTPException, Depends, Query, Request, Response
 from typing import List, Optional
 import asyncio
 from models.admin import User
@@ -13,7 +13,13 @@ from schemas import (
     UserVPNConfigUpdate, UserVPNConfigResponse
 )
 from auth import AuthManager, require_permission
+from config import settings
+from utils.icmp_probe import ping_host
+from utils.pagination import CursorParams, paginate_by_cursor
 from routers.device import delete_device_access_ip, upsert_device_access_ip, revoke_shared_access, get_current_time
+from connectivity_manager import connectivity_manager
+from device_catalog import device_catalog
+from utils.etag import RESOURCE_DEVICES, RESOURCE_VPN_CONFIGS, bump_resource_version, conditional_get
 
 router = APIRouter(prefix="/vpn", tags=["VPN配置管理"])
 
@@ -23,13 +29,7 @@ async def _ping_ip(ip: str, timeout: int = 3) -> bool:
     if not ip:
         return False
     try:
-        process = await asyncio.create_subprocess_exec(
-            'ping', '-c', '1', '-W', str(timeout), ip,
-            stdout=asyncio.subprocess.DEVNULL,
-            stderr=asyncio.subprocess.DEVNULL
-        )
-        await asyncio.wait_for(process.wait(), timeout=timeout + 2)
-        return process.returncode == 0
+        return await ping_host(ip, timeout, settings.CONNECTIVITY_PROBE_BACKEND)
     except Exception:
         return False
 
@@ -42,9 +42,10 @@ async def get_vpn_configs(
     page_size: int = Query(10, ge=1, le=100, description="每页数量"),
     region: Optional[str] = Query(None, description="地域搜索"),
     network: Optional[str] = Query(None, description="网段搜索"),
+    cursor_params: CursorParams = Depends(),
     current_user: User = Depends(AuthManager.get_current_user)
 ):
-    """获取VPN配置列表（管理员）"""
+    """获取VPN配置列表（管理员，支持页码分页与游标分页）"""
     try:
         # 构建查询条件
         query = VPNConfig.all()
@@ -55,9 +56,13 @@ async def get_vpn_configs(
             query = query.filter(network__icontains=network)
 
         # 分页查询
-        total = await query.count()
-        offset = (page - 1) * page_size
-        configs = await query.offset(offset).limit(page_size).order_by('id')
+        if cursor_params.enabled:
+            configs, page_info = await paginate_by_cursor(query, cursor_params, page_size)
+        else:
+            total = await query.count()
+            offset = (page - 1) * page_size
+            configs = await query.offset(offset).limit(page_size).order_by('id')
+            page_info = {"total": total, "page": page}
 
         # 转换为响应格式
         items = []
@@ -71,6 +76,8 @@ async def get_vpn_configs(
                 gw=config.gw,
                 ip=config.ip,
                 mask=config.mask,
+                probe_method=config.probe_method,
+                probe_ports=config.probe_ports,
                 status=status
             ))
 
@@ -79,11 +86,12 @@ async def get_vpn_configs(
             message="获取VPN配置列表成功",
             data={
                 "items": items,
-                "total": total,
-                "page": page,
-                "page_size": page_size
+                "page_size": page_size,
+                **page_info
             }
         )
+    except HTTPException:
+        raise
     except Exception as e:
         print(f"获取VPN配置列表失败: {e}")
         return BaseResponse(
@@ -119,8 +127,11 @@ async def create_vpn_config(
             lns=config_data.lns,
             gw=config_data.gw,
             ip=config_data.ip,
-            mask=config_data.mask
+            mask=config_data.mask,
+            probe_method=config_data.probe_method,
+            probe_ports=config_data.probe_ports
         )
+        await device_catalog.invalidate_vpn_config(config.id)
 
         return BaseResponse(
             code=200,
@@ -132,7 +143,9 @@ async def create_vpn_config(
                 "lns": config.lns,
                 "gw": config.gw,
                 "ip": config.ip,
-                "mask": config.mask
+                "mask": config.mask,
+                "probe_method": config.probe_method,
+                "probe_ports": config.probe_ports
             }
         )
     except Exception as e:
@@ -192,9 +205,24 @@ async def update_vpn_config(
             update_data["ip"] = config_data.ip
         if config_data.mask is not None:
             update_data["mask"] = config_data.mask
+        # 探测方式允许显式置空以恢复全局默认
+        if "probe_method" in config_data.model_fields_set:
+            update_data["probe_method"] = config_data.probe_method
+        if "probe_ports" in config_data.model_fields_set:
+            update_data["probe_ports"] = config_data.probe_ports
 
         if update_data:
             await VPNConfig.filter(id=config_id).update(**update_data)
+            await bump_resource_version(RESOURCE_VPN_CONFIGS, RESOURCE_DEVICES)
+            await device_catalog.bump_version()
+            await device_catalog.invalidate_vpn_config(config_id)
+
+        # 探测方式变化后，该VPN下的设备下一轮按新配置重新检测
+        if "probe_method" in update_data or "probe_ports" in update_data:
+            await device_catalog.ensure_loaded()
+            for device in device_catalog.devices.values():
+                if device.vpn_config_id == config_id:
+                    connectivity_manager.invalidate_probe_target(device.id)
 
         return BaseResponse(
             code=200,
@@ -237,6 +265,7 @@ async def delete_vpn_config(
 
         # 删除VPN配置
         await config.delete()
+        await device_catalog.invalidate_vpn_config(config_id)
 
         return BaseResponse(
             code=200,
@@ -260,8 +289,9 @@ async def get_user_vpn_configs(
 ):
     """获取当前用户的VPN配置"""
     try:
-        # 获取所有VPN配置
-        vpn_configs = await VPNConfig.all().order_by('region', 'network')
+        # 获取所有VPN配置（读取设备目录）
+        await device_catalog.ensure_loaded()
+        vpn_configs = device_catalog.list_vpn_configs()
 
         # 获取用户的VPN IP配置
         user_configs = await UserVPNConfig.filter(user=current_user).prefetch_related('vpn_config')
@@ -401,11 +431,18 @@ async def update_user_vpn_config(
 
 @router.get("/configs/all", response_model=BaseResponse, summary="获取所有VPN配置")
 async def get_all_vpn_configs(
+    request: Request,
+    response: Response,
     current_user: User = Depends(AuthManager.get_current_user)
 ):
-    """获取所有VPN配置（供设备管理页面使用）"""
+    """获取所有VPN配置（供设备管理页面使用），支持ETag条件请求"""
     try:
-        configs = await VPNConfig.all().order_by('region', 'network')
+        not_modified = await conditional_get(request, response, RESOURCE_VPN_CONFIGS)
+        if not_modified:
+            return not_modified
+
+        await device_catalog.ensure_loaded()
+        configs = device_catalog.list_vpn_configs()
 
         # 转换为响应格式
         items = []
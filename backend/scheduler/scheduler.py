@@ -10,6 +10,7 @@ from models.deviceModel import Device, DeviceUsage, DeviceStatusEnum
 from models.admin import User, OperationLog
 from models.systemModel import SystemSettings
 from connectivity_manager import connectivity_manager
+from database import backfill_device_companions
 from utils.notification import send_device_notification
 import logging
 
@@ -193,6 +194,9 @@ class DeviceScheduler:
             cleanup_type = "强制清理" if force_cleanup else "定期清理"
             logger.info(f"开始执行{cleanup_type}任务...")
 
+            # 先补齐缺失的伴生记录，保证每台设备都会被清理到
+            await backfill_device_companions()
+
             # 获取所有设备使用信息
             usage_infos = await DeviceUsage.all().prefetch_related("device")
 
@@ -256,6 +256,27 @@ class LoginLogResponse(BaseModel):
 
 
 # ===== VPN配置模式 =====
+PROBE_METHODS = ["icmp", "tcp", "any"]
+
+
+def validate_probe_method(v):
+    """验证连通性探测方式"""
+    if v is not None and v not in PROBE_METHODS:
+        raise ValueError(f'探测方式必须是以下值之一: {", ".join(PROBE_METHODS)}')
+    return v
+
+
+def validate_probe_ports(v):
+    """验证TCP探测端口列表"""
+    if v is not None:
+        if not v:
+            raise ValueError('探测端口列表不能为空')
+        for port in v:
+            if port < 1 or port > 65535:
+                raise ValueError(f'无效的端口: {port}')
+    return v
+
+
 class VPNConfigBase(BaseModel):
     """VPN配置基础模式"""
     region: str = Field(..., min_length=1, max_length=50, description="地域")
@@ -264,6 +285,11 @@ class VPNConfigBase(BaseModel):
     gw: str = Field(..., min_length=1, max_length=45, description="网关地址")
     ip: str = Field(..., min_length=1, max_length=45, description="VPN IP")
     mask: str = Field(..., min_length=1, max_length=45, description="子网掩码")
+    probe_method: Optional[str] = Field(None, description="该VPN下设备的连通性探测方式 icmp/tcp/any")
+    probe_ports: Optional[List[int]] = Field(None, description="该VPN下设备的TCP探测端口列表")
+
+    _check_probe_method = validator('probe_method', allow_reuse=True)(validate_probe_method)
+    _check_probe_ports = validator('probe_ports', allow_reuse=True)(validate_probe_ports)
 
 
 class VPNConfigCreate(VPNConfigBase):
@@ -285,6 +311,11 @@ class VPNConfigUpdate(BaseModel):
         None, min_length=1, max_length=45, description="VPN IP")
     mask: Optional[str] = Field(
         None, min_length=1, max_length=45, description="子网掩码")
+    probe_method: Optional[str] = Field(None, description="连通性探测方式 icmp/tcp/any")
+    probe_ports: Optional[List[int]] = Field(None, description="TCP探测端口列表")
+
+    _check_probe_method = validator('probe_method', allow_reuse=True)(validate_probe_method)
+    _check_probe_ports = validator('probe_ports', allow_reuse=True)(validate_probe_ports)
 
 
 class VPNConfigResponse(VPNConfigBase):
@@ -332,6 +363,13 @@ class DeviceBase(BaseModel):
     remarks: Optional[str] = Field(None, description="设备备注信息")
     group_ids: Optional[List[int]] = Field(
         default=None, description="设备所属分组ID列表")
+    probe_method: Optional[str] = Field(
+        None, description="连通性探测方式 icmp/tcp/any，为空时使用VPN配置或全局默认")
+    probe_ports: Optional[List[int]] = Field(
+        None, description="TCP探测端口列表，为空时使用VPN配置或全局默认")
+
+    _check_probe_method = validator('probe_method', allow_reuse=True)(validate_probe_method)
+    _check_probe_ports = validator('probe_ports', allow_reuse=True)(validate_probe_ports)
 
     @validator('form_type')
     def validate_form_type(cls, v):
@@ -361,6 +399,11 @@ class DeviceUpdate(BaseModel):
     form_type: Optional[str] = None
     remarks: Optional[str] = None
     group_ids: Optional[List[int]] = None
+    probe_method: Optional[str] = None
+    probe_ports: Optional[List[int]] = None
+
+    _check_probe_method = validator('probe_method', allow_reuse=True)(validate_probe_method)
+    _check_probe_ports = validator('probe_ports', allow_reuse=True)(validate_probe_ports)
 
     @validator('form_type')
     def validate_form_type(cls, v):
@@ -391,6 +434,8 @@ class DeviceResponse(BaseModel):
     device_type: str
     form_type: str
     remarks: Optional[str] = None
+    probe_method: Optional[str] = None
+    probe_ports: Optional[List[int]] = None
     groups: List[GroupSummary] = []
     created_at: datetime
     updated_at: datetime
@@ -458,6 +503,8 @@ class DeviceListItem(BaseModel):
     occupied_duration: int = 0
     is_current_user_in_queue: bool = False
     connectivity_status: Optional[bool] = None
+    rtt: Optional[float] = None
+    latency_band: Optional[str] = None
     admin_username: Optional[str] = None
     project_name: Optional[str] = None
     support_queue: bool = True
@@ -468,6 +515,23 @@ class DeviceListItem(BaseModel):
     share_status: Optional[str] = None
 
 
+class DeviceListPage(BaseModel):
+    """设备列表分页数据（页码分页返回total/page，游标分页返回游标字段）"""
+    items: List[DeviceListItem]
+    page_size: int
+    total: Optional[int] = None
+    page: Optional[int] = None
+    next_cursor: Optional[str] = None
+    prev_cursor: Optional[str] = None
+    has_next: Optional[bool] = None
+    has_prev: Optional[bool] = None
+
+
+class DeviceListResponse(BaseResponse):
+    """设备列表响应模型"""
+    data: Optional[DeviceListPage] = None
+
+
 class DeviceUseRequest(BaseModel):
     """使用设备请求模型"""
     device_id: int
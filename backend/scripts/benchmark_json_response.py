@@ -0,0 +1,123 @@
+"""
+设备列表响应序列化基准
+比较两条路径在1000行时的耗时：
+- 常规路径：逐行构造DeviceListItem -> BaseResponse -> FastAPI按response_model序列化 -> 标准库json编码
+- 快速路径：dict行 -> fast_response（orjson，未安装时为标准库json回退）
+两条路径的输出解码后必须一致。
+
+用法（在backend目录下）：
+    python scripts/benchmark_json_response.py [行数] [重复次数]
+"""
+import asyncio
+import json
+import os
+import sys
+import time
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from fastapi.responses import JSONResponse  # noqa: E402
+from fastapi.routing import serialize_response  # noqa: E402
+from fastapi.utils import create_model_field  # noqa: E402
+
+from models.deviceModel import DeviceStatusEnum, DeviceTypeEnum  # noqa: E402
+from schemas import BaseResponse, DeviceListItem, DeviceListPage  # noqa: E402
+from utils import fast_json  # noqa: E402
+from utils.fast_json import fast_response  # noqa: E402
+
+
+def build_rows(count: int) -> list:
+    """构造与设备列表接口结构相同的dict行"""
+    now = datetime.now().replace(microsecond=123456)
+    rows = []
+    for i in range(count):
+        occupied = i % 3 == 0
+        rows.append({
+            "id": i + 1,
+            "name": f"环境-{i}",
+            "ip": f"10.{i // 65536}.{i // 256 % 256}.{i % 256}",
+            "device_type": DeviceTypeEnum.TEST,
+            "form_type": "框式",
+            "vpn_region": "华东" if i % 2 else None,
+            "vpn_network": "192.168.0.0/16" if i % 2 else None,
+            "vpn_display_name": "华东 - 192.168.0.0/16" if i % 2 else None,
+            "current_user": f"a{i:08d}" if occupied else None,
+            "queue_count": i % 4,
+            "status": DeviceStatusEnum.OCCUPIED if occupied else DeviceStatusEnum.AVAILABLE,
+            "start_time": now - timedelta(minutes=i) if occupied else None,
+            "occupied_duration": i if occupied else 0,
+            "is_current_user_in_queue": i % 11 == 0,
+            "connectivity_status": i % 7 != 0,
+            "rtt": None if i % 7 == 0 else round(0.3 + i % 200 * 1.7, 3),
+            "latency_band": None if i % 7 == 0 else "good",
+            "admin_username": "admin",
+            "project_name": f"项目{i % 10}",
+            "support_queue": True,
+            "groups": [{"id": i % 5 + 1, "name": f"分组{i % 5}", "description": None}],
+            "is_shared_user": False,
+            "has_pending_share_request": i % 13 == 0,
+            "share_request_id": i if i % 13 == 0 else None,
+            "share_status": "pending" if i % 13 == 0 else None,
+        })
+    return rows
+
+
+def model_path(rows: list, field) -> bytes:
+    """改造前的路径：逐行构造模型，并按response_model=BaseResponse序列化"""
+    content = BaseResponse(
+        code=200,
+        message="设备列表获取成功",
+        data={"items": [DeviceListItem(**row) for row in rows], "page_size": len(rows), "total": len(rows), "page": 1},
+    )
+    serialized = asyncio.run(serialize_response(field=field, response_content=content))
+    return JSONResponse(serialized).body
+
+
+def fast_path(rows: list) -> bytes:
+    return fast_response(
+        {"items": rows, "page_size": len(rows), "total": len(rows), "page": 1},
+        message="设备列表获取成功",
+        schema=DeviceListPage,
+    ).body
+
+
+def timeit(func, repeat: int) -> float:
+    """返回最优一次的耗时（毫秒）"""
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        best = min(best, time.perf_counter() - start)
+    return best * 1000
+
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 1000
+    repeat = int(sys.argv[2]) if len(sys.argv) > 2 else 20
+    rows = build_rows(count)
+    field = create_model_field(name="Response_get_devices", type_=BaseResponse, mode="serialization")
+
+    baseline = json.loads(model_path(rows, field))
+    fast = json.loads(fast_path(rows))
+    assert baseline == fast, "快速路径输出与常规路径不一致"
+
+    results = [("Pydantic模型 + 标准库json", timeit(lambda: model_path(rows, field), repeat))]
+    orjson_module = fast_json.orjson
+    if orjson_module is not None:
+        results.append(("dict行 + orjson", timeit(lambda: fast_path(rows), repeat)))
+    fast_json.orjson = None
+    try:
+        assert json.loads(fast_path(rows)) == baseline, "标准库回退输出与常规路径不一致"
+        results.append(("dict行 + 标准库json（回退）", timeit(lambda: fast_path(rows), repeat)))
+    finally:
+        fast_json.orjson = orjson_module
+
+    print(f"设备列表序列化基准：{count} 行，取 {repeat} 次中最优")
+    base_ms = results[0][1]
+    for name, elapsed in results:
+        print(f"  {name:<28} {elapsed:8.2f} ms  ({base_ms / elapsed:.1f}x)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,138 @@
+"""
+登录突发基准
+同时发起一批登录请求，同时每隔一小段时间探测一次健康检查接口，比较两种配置：
+- 同步计算：bcrypt在事件循环中执行，不限制登录并发（改造前的行为）
+- 线程池：bcrypt在专用线程池中执行，排队有上限，并限制同时处理的登录请求数
+关注点是登录高峰期间其他请求（健康检查）的延迟，以及被快速拒绝（429）的登录数量。
+
+用法（在backend目录下）：
+    python scripts/benchmark_login_burst.py [并发登录数] [探测间隔毫秒]
+"""
+import asyncio
+import contextlib
+import io
+import os
+import statistics
+import sys
+import tempfile
+import time
+
+DB_FILE = os.path.join(tempfile.mkdtemp(prefix="login_burst_"), "bench.sqlite3")
+os.environ["DATABASE_URL"] = f"sqlite://{DB_FILE}"
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import httpx  # noqa: E402
+from tortoise import Tortoise  # noqa: E402
+
+import auth  # noqa: E402
+from auth import AuthManager  # noqa: E402
+from config import settings  # noqa: E402
+from database import TORTOISE_ORM, init_database  # noqa: E402
+from main import app  # noqa: E402
+from models.admin import User  # noqa: E402
+
+PASSWORD = "pass1234"
+
+
+def employee_id(index: int) -> str:
+    return f"z{index:08d}"
+
+
+async def prepare(count: int):
+    await Tortoise.init(config=TORTOISE_ORM)
+    await Tortoise.generate_schemas()
+    with contextlib.redirect_stdout(io.StringIO()):
+        await init_database()
+    hashed = AuthManager.get_password_hash(PASSWORD)
+    await User.bulk_create([
+        User(employee_id=employee_id(i), username=f"压测{i}", hashed_password=hashed)
+        for i in range(count)
+    ])
+
+
+def configure(workers: int, queue_size: int, max_concurrent: int):
+    """就地调整全局实例（路由依赖持有的是同一个对象）"""
+    auth.password_hasher.shutdown()
+    auth.password_hasher.__init__(workers, queue_size)
+    auth.login_admission.__init__(max_concurrent)
+
+
+def percentile(values: list, ratio: float) -> float:
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * ratio))]
+
+
+async def run_burst(count: int, probe_interval: float) -> dict:
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+        login_latencies = []
+        statuses = {}
+        probe_latencies = []
+        done = asyncio.Event()
+
+        async def login(index: int):
+            start = time.perf_counter()
+            response = await client.post(
+                "/api/auth/login", json={"employee_id": employee_id(index), "password": PASSWORD}
+            )
+            login_latencies.append(time.perf_counter() - start)
+            statuses[response.status_code] = statuses.get(response.status_code, 0) + 1
+
+        async def probe():
+            # 从预定发出的时刻开始计时，事件循环被阻塞导致的延后也计入延迟
+            while not done.is_set():
+                due = time.perf_counter() + probe_interval
+                await asyncio.sleep(probe_interval)
+                await client.get("/api/health")
+                probe_latencies.append(time.perf_counter() - due)
+
+        probe_task = asyncio.create_task(probe())
+        start = time.perf_counter()
+        await asyncio.gather(*(login(i) for i in range(count)))
+        elapsed = time.perf_counter() - start
+        done.set()
+        await probe_task
+
+    return {
+        "elapsed": elapsed,
+        "statuses": statuses,
+        "login_latencies": login_latencies,
+        "probe_latencies": probe_latencies,
+    }
+
+
+def report(name: str, result: dict):
+    logins = result["login_latencies"]
+    probes = result["probe_latencies"]
+    statuses = ", ".join(f"{code}×{n}" for code, n in sorted(result["statuses"].items()))
+    print(f"{name}")
+    print(f"  总耗时 {result['elapsed']:.2f} s，响应状态 {statuses}")
+    print(f"  登录延迟   p50 {statistics.median(logins) * 1000:8.1f} ms  "
+          f"p95 {percentile(logins, 0.95) * 1000:8.1f} ms  max {max(logins) * 1000:8.1f} ms")
+    print(f"  健康检查   p50 {statistics.median(probes) * 1000:8.1f} ms  "
+          f"p95 {percentile(probes, 0.95) * 1000:8.1f} ms  max {max(probes) * 1000:8.1f} ms  （{len(probes)} 次）")
+
+
+async def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 40
+    probe_interval = (int(sys.argv[2]) if len(sys.argv) > 2 else 20) / 1000
+    await prepare(count)
+    try:
+        print(f"登录突发基准：{count} 个并发登录，每 {probe_interval * 1000:.0f} ms 探测一次健康检查，CPU {os.cpu_count()} 核")
+
+        configure(workers=0, queue_size=0, max_concurrent=0)
+        report("同步计算（改造前）", await run_burst(count, probe_interval))
+
+        configure(settings.PASSWORD_HASH_WORKERS, settings.PASSWORD_HASH_QUEUE_SIZE, settings.LOGIN_MAX_CONCURRENT)
+        report(
+            f"线程池（{settings.PASSWORD_HASH_WORKERS} 线程，队列 {settings.PASSWORD_HASH_QUEUE_SIZE}，"
+            f"登录并发上限 {settings.LOGIN_MAX_CONCURRENT}）",
+            await run_burst(count, probe_interval),
+        )
+    finally:
+        auth.password_hasher.shutdown()
+        await Tortoise.close_connections()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
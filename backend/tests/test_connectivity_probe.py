@@ -0,0 +1,110 @@
+"""
+连通性探测测试
+对本机监听的套接字做TCP连接探测，核对开放端口、关闭端口、超时以及组合探测的尝试顺序。
+
+用法（在backend目录下）：
+    python -m unittest discover tests
+"""
+import asyncio
+import socket
+import time
+import unittest
+from typing import List, Optional
+from unittest import mock
+
+from connectivity_manager import ConnectivityProbe, FallbackProbe, TCPConnectProbe
+from utils.tcp_probe import tcp_connect, tcp_probe_host
+
+LOCALHOST = "127.0.0.1"
+
+
+def closed_port() -> int:
+    """取一个当前没有监听的本机端口"""
+    with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as sock:
+        sock.bind((LOCALHOST, 0))
+        return sock.getsockname()[1]
+
+
+class FakeProbe(ConnectivityProbe):
+    """返回预置结果，并记录调用顺序"""
+
+    def __init__(self, name: str, rtt: Optional[float], calls: List[str]):
+        self.name = name
+        self.rtt = rtt
+        self.calls = calls
+
+    async def probe(self, ip: str, ports: Optional[List[int]] = None) -> Optional[float]:
+        self.calls.append(self.name)
+        return self.rtt
+
+
+class TCPProbeTest(unittest.IsolatedAsyncioTestCase):
+
+    async def asyncSetUp(self):
+        self.server = await asyncio.start_server(lambda reader, writer: writer.close(), LOCALHOST, 0)
+        self.open_port = self.server.sockets[0].getsockname()[1]
+
+    async def asyncTearDown(self):
+        self.server.close()
+        await self.server.wait_closed()
+
+    async def test_open_port(self):
+        rtt = await tcp_connect(LOCALHOST, self.open_port, timeout=1)
+        self.assertIsNotNone(rtt)
+        self.assertGreaterEqual(rtt, 0)
+
+    async def test_closed_port(self):
+        self.assertIsNone(await tcp_connect(LOCALHOST, closed_port(), timeout=1))
+
+    async def test_timeout(self):
+        async def never_connects(sock, address):
+            await asyncio.sleep(10)
+
+        loop = asyncio.get_running_loop()
+        start = time.perf_counter()
+        with mock.patch.object(loop, "sock_connect", never_connects):
+            self.assertIsNone(await tcp_connect(LOCALHOST, self.open_port, timeout=0.2))
+        self.assertLess(time.perf_counter() - start, 2)
+
+    async def test_any_open_port_is_enough(self):
+        self.assertIsNotNone(await tcp_probe_host(LOCALHOST, [closed_port(), self.open_port], timeout=1))
+        self.assertIsNone(await tcp_probe_host(LOCALHOST, [closed_port()], timeout=1))
+        self.assertIsNone(await tcp_probe_host(LOCALHOST, [], timeout=1))
+
+    async def test_device_ports_override_defaults(self):
+        probe = TCPConnectProbe([closed_port()], timeout=1)
+        self.assertIsNone(await probe.probe(LOCALHOST))
+        self.assertIsNotNone(await probe.probe(LOCALHOST, [self.open_port]))
+
+    async def test_fallback_to_tcp_after_icmp_failure(self):
+        calls = []
+        probe = FallbackProbe([FakeProbe("icmp", None, calls), TCPConnectProbe([self.open_port], timeout=1)])
+        self.assertIsNotNone(await probe.probe(LOCALHOST))
+        self.assertEqual(calls, ["icmp"])
+
+
+class FallbackProbeTest(unittest.IsolatedAsyncioTestCase):
+
+    async def test_stops_at_first_success(self):
+        calls = []
+        probe = FallbackProbe([
+            FakeProbe("first", None, calls),
+            FakeProbe("second", 12.5, calls),
+            FakeProbe("third", 1.0, calls),
+        ])
+        self.assertEqual(await probe.probe(LOCALHOST), 12.5)
+        self.assertEqual(calls, ["first", "second"])
+
+    async def test_all_fail(self):
+        calls = []
+        probe = FallbackProbe([FakeProbe("first", None, calls), FakeProbe("second", None, calls)])
+        self.assertIsNone(await probe.probe(LOCALHOST))
+        self.assertEqual(calls, ["first", "second"])
+
+    def test_probe_is_abstract(self):
+        with self.assertRaises(TypeError):
+            ConnectivityProbe()
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,93 @@
+"""
+配置值全文索引测试
+使用内存SQLite核对FTS5（trigram）子查询与LIKE查询结果一致、索引随配置增删同步，以及不可用时的回退。
+
+用法（在backend目录下）：
+    python -m unittest discover tests
+"""
+import unittest
+from typing import List
+
+from tortoise import Tortoise
+
+from device_config_index import DeviceConfigIndex
+from models.deviceModel import Device, DeviceConfig
+
+MODEL_MODULES = ["models.admin", "models.deviceModel", "models.systemModel", "models.vpnModel",
+                 "models.commandModel", "models.aiToolModel", "models.groupModel"]
+
+CONFIG_VALUES = [
+    ["vlan 100", "接口GE0/0/1"],
+    ["VLAN 200", "路由表 static"],
+    ["it's quoted \"x\"", "alpha"],
+    [],
+]
+
+
+class DeviceConfigIndexTest(unittest.IsolatedAsyncioTestCase):
+
+    async def asyncSetUp(self):
+        await Tortoise.init(db_url="sqlite://:memory:", modules={"models": MODEL_MODULES})
+        await Tortoise.generate_schemas()
+        self.devices = []
+        for index, values in enumerate(CONFIG_VALUES):
+            device = await Device.create(name=f"d{index}", ip=f"10.0.0.{index}", creator="t", owner="t",
+                                         admin_username="admin", admin_password="p", form_type="单板")
+            for position, value in enumerate(values, start=1):
+                await DeviceConfig.create(device=device, config_param1=1, config_param2=position, config_value=value)
+            self.devices.append(device)
+        self.index = DeviceConfigIndex()
+        await self.index.setup()
+        if not self.index.available:
+            self.skipTest("当前SQLite不支持FTS5 trigram分词")
+
+    async def asyncTearDown(self):
+        await Tortoise._drop_databases()
+
+    async def search(self, value: str) -> List[int]:
+        subquery = self.index.device_id_subquery(value)
+        self.assertIsNotNone(subquery)
+        return sorted(await Device.filter(id__in=subquery).values_list("id", flat=True))
+
+    async def like(self, value: str) -> List[int]:
+        device_ids = await DeviceConfig.filter(config_value__icontains=value).values_list("device_id", flat=True)
+        return sorted(set(device_ids))
+
+    async def test_matches_like(self):
+        for value in ("vlan", "VLAN 1", "GE0/0", "路由表", "it's", 'ed "x"', "zzz", "a'); DROP TABLE devices;--"):
+            self.assertEqual(await self.search(value), await self.like(value), value)
+        self.assertEqual(await Device.all().count(), len(CONFIG_VALUES))
+
+    async def test_short_or_unavailable_falls_back(self):
+        self.assertIsNone(self.index.device_id_subquery("vl"))
+        self.index.available = False
+        self.assertIsNone(self.index.device_id_subquery("vlan"))
+        self.assertEqual(self.index.get_stats()["fallback_searches"], 2)
+
+    async def test_follows_config_changes(self):
+        config = await DeviceConfig.create(device=self.devices[3], config_param1=2, config_param2=1, config_value="uniqueXYZ")
+        await self.index.upsert(config)
+        self.assertEqual(await self.search("uniquexyz"), [self.devices[3].id])
+
+        config.config_value = "otherQQQ"
+        await config.save()
+        await self.index.upsert(config)
+        self.assertEqual(await self.search("uniquexyz"), [])
+        self.assertEqual(await self.search("otherqqq"), [self.devices[3].id])
+
+        await self.index.remove(config.id)
+        self.assertEqual(await self.search("otherqqq"), [])
+
+        await self.index.remove_device(self.devices[0].id)
+        self.assertEqual(await self.search("GE0/0"), [])
+
+    async def test_setup_rebuilds_when_out_of_sync(self):
+        await DeviceConfig.create(device=self.devices[3], config_param1=2, config_param2=1, config_value="missedValue")
+        rebuilds = self.index.rebuilds
+        await self.index.setup()
+        self.assertEqual(self.index.rebuilds, rebuilds + 1)
+        self.assertEqual(await self.search("missedvalue"), [self.devices[3].id])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,39 @@
+"""
+设备列表字段选择测试
+核对fields参数的解析：按DeviceListItem顺序返回、始终包含id、忽略空白与重复，未知字段返回400。
+
+用法（在backend目录下）：
+    python -m unittest discover tests
+"""
+import unittest
+
+from fastapi import HTTPException
+
+from routers.device import DEVICE_LIST_FIELDS, parse_device_list_fields
+
+
+class DeviceListFieldsTest(unittest.TestCase):
+
+    def test_all_fields_when_absent(self):
+        self.assertIsNone(parse_device_list_fields(None))
+        self.assertIsNone(parse_device_list_fields(""))
+
+    def test_model_order_and_id(self):
+        selected = parse_device_list_fields(" status , name,name,,")
+        self.assertEqual(selected, tuple(field for field in DEVICE_LIST_FIELDS if field in {"id", "name", "status"}))
+        self.assertEqual(selected[0], "id")
+
+    def test_only_id(self):
+        self.assertEqual(parse_device_list_fields("id"), ("id",))
+        self.assertEqual(parse_device_list_fields(" , "), ("id",))
+
+    def test_unknown_fields_rejected(self):
+        with self.assertRaises(HTTPException) as caught:
+            parse_device_list_fields("name,password,admin_password")
+        self.assertEqual(caught.exception.status_code, 400)
+        self.assertIn("admin_password", caught.exception.detail)
+        self.assertIn("password", caught.exception.detail)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,127 @@
+"""
+设备列表查询测试
+使用内存SQLite直接调用设备列表接口，核对下推到SQL的状态过滤（无使用记录按可用处理）、分组权限、
+配置值搜索、时延分档过滤、时延排序（无时延排在最后）以及分页总数。
+
+用法（在backend目录下）：
+    python -m unittest discover tests
+"""
+import json
+import unittest
+from typing import List, Optional
+
+from fastapi import HTTPException, Request, Response
+from tortoise import Tortoise
+
+from device_visibility import device_visibility
+from models.admin import User
+from models.deviceModel import Device, DeviceConfig, DeviceStatusEnum, DeviceUsage
+from models.groupModel import DeviceGroup, Group, GroupMember
+from routers.device import get_devices
+from utils.etag import ensure_resource_versions
+from utils.pagination import CursorParams
+
+MODEL_MODULES = ["models.admin", "models.deviceModel", "models.systemModel", "models.vpnModel",
+                 "models.commandModel", "models.aiToolModel", "models.groupModel"]
+
+# (使用状态，None表示没有使用记录；时延；是否绑定分组)
+DEVICES = [
+    (DeviceStatusEnum.AVAILABLE, 10.0, False),
+    (DeviceStatusEnum.OCCUPIED, 80.0, False),
+    (None, None, False),
+    (DeviceStatusEnum.AVAILABLE, 200.0, True),
+    (DeviceStatusEnum.MAINTENANCE, 49.9, False),
+    (None, 150.0, True),
+]
+
+
+class DeviceListQueryTest(unittest.IsolatedAsyncioTestCase):
+
+    async def asyncSetUp(self):
+        await Tortoise.init(db_url="sqlite://:memory:", modules={"models": MODEL_MODULES})
+        await Tortoise.generate_schemas()
+        await ensure_resource_versions()
+
+        self.superuser = await User.create(employee_id="s1", username="超管", hashed_password="x", is_superuser=True)
+        self.member = await User.create(employee_id="m1", username="成员", hashed_password="x")
+        self.outsider = await User.create(employee_id="o1", username="外人", hashed_password="x")
+        group = await Group.create(name="g1")
+        await GroupMember.create(group=group, user=self.member)
+
+        self.ids = []
+        for index, (status, rtt, grouped) in enumerate(DEVICES):
+            device = await Device.create(name=f"d{index}", ip=f"10.0.0.{index}", creator="t", owner="t",
+                                         admin_username="admin", admin_password="p", form_type="单板", last_rtt=rtt)
+            if status is not None:
+                await DeviceUsage.create(device=device, status=status)
+            if grouped:
+                await DeviceGroup.create(device=device, group=group)
+            self.ids.append(device.id)
+        await DeviceConfig.create(device_id=self.ids[1], config_param1=1, config_param2=1, config_value="vlan 100")
+        await DeviceConfig.create(device_id=self.ids[3], config_param1=1, config_param2=1, config_value="VLAN 200")
+
+        # 全局实例在用例之间共用，每个用例从头加载
+        device_visibility.acl_version = None
+        device_visibility.checked_at = None
+
+    async def asyncTearDown(self):
+        await Tortoise._drop_databases()
+
+    async def list_devices(self, user: Optional[User] = None, page: int = 1, page_size: int = 100,
+                           name: Optional[str] = None, status: Optional[str] = None,
+                           config_value: Optional[str] = None, latency_band: Optional[str] = None,
+                           sort_by: Optional[str] = None, sort_order: str = "asc") -> dict:
+        request = Request({"type": "http", "method": "GET", "path": "/api/devices/", "query_string": b"", "headers": []})
+        response = await get_devices(
+            request, Response(), page=page, page_size=page_size, name=name, ip=None, status=status,
+            config_value=config_value, latency_band=latency_band, sort_by=sort_by, sort_order=sort_order,
+            fields="id,status,rtt", cursor_params=CursorParams(cursor=None), current_user=user or self.superuser)
+        return json.loads(response.body)["data"]
+
+    def positions(self, data: dict) -> List[int]:
+        return [self.ids.index(item["id"]) for item in data["items"]]
+
+    async def test_status_filter(self):
+        self.assertEqual(self.positions(await self.list_devices(status="available")), [0, 2, 3, 5])
+        self.assertEqual(self.positions(await self.list_devices(status="occupied")), [1])
+        self.assertEqual(self.positions(await self.list_devices(status="offline")), [])
+        with self.assertRaises(HTTPException) as caught:
+            await self.list_devices(status="busy")
+        self.assertEqual(caught.exception.status_code, 400)
+
+    async def test_group_visibility(self):
+        self.assertEqual(self.positions(await self.list_devices(self.member)), [0, 1, 2, 3, 4, 5])
+        self.assertEqual(self.positions(await self.list_devices(self.outsider)), [0, 1, 2, 4])
+        data = await self.list_devices(self.outsider, status="available")
+        self.assertEqual((self.positions(data), data["total"]), ([0, 2], 2))
+
+    async def test_config_value_and_name(self):
+        self.assertEqual(self.positions(await self.list_devices(config_value="vlan")), [1, 3])
+        self.assertEqual(self.positions(await self.list_devices(self.outsider, config_value="vlan")), [1])
+        self.assertEqual(self.positions(await self.list_devices(config_value="none")), [])
+        self.assertEqual(self.positions(await self.list_devices(name="d5")), [5])
+
+    async def test_latency_band_filter(self):
+        self.assertEqual(self.positions(await self.list_devices(latency_band="good")), [0, 4])
+        self.assertEqual(self.positions(await self.list_devices(latency_band="fair")), [1])
+        self.assertEqual(self.positions(await self.list_devices(latency_band="poor,unknown")), [2, 3, 5])
+        with self.assertRaises(HTTPException):
+            await self.list_devices(latency_band="fast")
+
+    async def test_latency_sort_keeps_missing_last(self):
+        self.assertEqual(self.positions(await self.list_devices(sort_by="latency")), [0, 4, 1, 5, 3, 2])
+        self.assertEqual(self.positions(await self.list_devices(sort_by="latency", sort_order="desc")),
+                         [3, 5, 1, 4, 0, 2])
+
+    async def test_paging(self):
+        data = await self.list_devices(page=2, page_size=4, sort_order="desc")
+        self.assertEqual(data["total"], len(DEVICES))
+        self.assertEqual(data["page"], 2)
+        self.assertEqual(self.positions(data), [1, 0])
+        # 没有使用记录的设备按可用返回
+        data = await self.list_devices(name="d2")
+        self.assertEqual(data["items"][0]["status"], "available")
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,141 @@
+"""
+设备可见性索引测试
+使用内存SQLite核对可见性判断、设备列表过滤条件的各个分支、增量更新，以及版本号变化后的重新加载。
+每一步都与按数据库逐台计算的结果比对。
+
+用法（在backend目录下）：
+    python -m unittest discover tests
+"""
+import unittest
+from typing import List
+
+from tortoise import Tortoise
+
+from device_visibility import DeviceVisibilityIndex
+from models.admin import User
+from models.deviceModel import Device
+from models.groupModel import DeviceGroup, Group, GroupMember
+from utils.etag import ensure_resource_versions
+
+MODEL_MODULES = ["models.admin", "models.deviceModel", "models.systemModel", "models.vpnModel",
+                 "models.commandModel", "models.aiToolModel", "models.groupModel"]
+
+
+class DeviceVisibilityIndexTest(unittest.IsolatedAsyncioTestCase):
+
+    async def asyncSetUp(self):
+        await Tortoise.init(db_url="sqlite://:memory:", modules={"models": MODEL_MODULES})
+        await Tortoise.generate_schemas()
+        await ensure_resource_versions()
+
+        self.g1 = await Group.create(name="g1")
+        self.g2 = await Group.create(name="g2")
+        self.member = await User.create(employee_id="u1", username="甲", hashed_password="x")
+        self.outsider = await User.create(employee_id="u2", username="乙", hashed_password="x")
+        await GroupMember.create(group=self.g1, user=self.member)
+
+        # d0: g1, d1: g2, d2: g1+g2, d3: 未分组
+        self.devices = []
+        for index, groups in enumerate(([self.g1], [self.g2], [self.g1, self.g2], [])):
+            device = await Device.create(name=f"d{index}", ip=f"10.0.0.{index}", creator="t", owner="t",
+                                         admin_username="admin", admin_password="p", form_type="单板")
+            for group in groups:
+                await DeviceGroup.create(device=device, group=group)
+            self.devices.append(device)
+
+        self.index = DeviceVisibilityIndex(check_interval=3600)
+        await self.index.ensure_fresh()
+
+    async def asyncTearDown(self):
+        await Tortoise._drop_databases()
+
+    async def truth(self, user: User) -> List[int]:
+        """按数据库计算：未绑定分组，或属于用户任一分组"""
+        user_groups = set(await GroupMember.filter(user=user).values_list("group_id", flat=True))
+        visible = []
+        for device in await Device.all().order_by("id"):
+            groups = set(await DeviceGroup.filter(device=device).values_list("group_id", flat=True))
+            if not groups or groups & user_groups:
+                visible.append(device.id)
+        return visible
+
+    async def listed(self, user: User) -> List[int]:
+        condition = self.index.list_filter(user.id)
+        query = Device.all() if condition is None else Device.filter(condition)
+        return await query.order_by("id").values_list("id", flat=True)
+
+    async def assert_consistent(self):
+        all_ids = [device.id for device in self.devices if await Device.exists(id=device.id)]
+        for user in (self.member, self.outsider):
+            expected = await self.truth(user)
+            self.assertEqual([d for d in all_ids if self.index.can_view(user.id, d)], expected)
+            self.assertEqual(self.index.filter_visible(user.id, reversed(all_ids)), expected[::-1])
+            # 内联NOT IN与子查询两个分支结果一致
+            for limit in (500, 0):
+                self.index.inline_id_limit = limit
+                self.assertEqual(await self.listed(user), expected, (user.employee_id, limit))
+
+    async def test_initial_load(self):
+        await self.assert_consistent()
+        self.assertEqual(self.index.full_loads, 1)
+
+    async def test_list_filter_branches(self):
+        self.index.inline_id_limit = 500
+        self.assertIsNotNone(self.index.list_filter(self.member.id))
+        # 属于全部分组时没有隐藏的设备，不加过滤条件
+        await GroupMember.create(group=self.g2, user=self.member)
+        self.index.add_group_members(self.g2.id, [self.member.id])
+        self.assertIsNone(self.index.list_filter(self.member.id))
+        await self.assert_consistent()
+
+    async def test_incremental_updates(self):
+        d0, d1, d2, d3 = self.devices
+
+        await DeviceGroup.filter(device=d3).delete()
+        await DeviceGroup.create(device=d3, group=self.g2)
+        self.index.set_device_groups(d3.id, [self.g2.id])
+        await self.assert_consistent()
+
+        await DeviceGroup.filter(device=d1).delete()
+        self.index.set_device_groups(d1.id, [])
+        await self.assert_consistent()
+
+        await GroupMember.create(group=self.g2, user=self.outsider)
+        self.index.add_group_members(self.g2.id, [self.outsider.id])
+        await self.assert_consistent()
+
+        await GroupMember.filter(group=self.g1, user=self.member).delete()
+        self.index.remove_group_members(self.g1.id, [self.member.id])
+        await self.assert_consistent()
+
+        await GroupMember.create(group=self.g1, user=self.member)
+        await GroupMember.filter(user=self.outsider).delete()
+        await GroupMember.create(group=self.g1, user=self.outsider)
+        self.index.set_user_groups(self.member.id, [self.g1.id])
+        self.index.set_user_groups(self.outsider.id, [self.g1.id])
+        await self.assert_consistent()
+
+        await self.g2.delete()
+        self.index.remove_group(self.g2.id)
+        await self.assert_consistent()
+        self.assertEqual(self.index.full_loads, 1)
+
+    async def test_reload_after_version_change(self):
+        # 绕过本进程的增量更新（模拟其他worker），保存信号递增device_acl版本
+        await DeviceGroup.create(device=self.devices[3], group=self.g2)
+        await self.index.ensure_fresh()
+        self.assertTrue(self.index.can_view(self.outsider.id, self.devices[3].id), "检查间隔内不重新加载")
+
+        self.index.checked_at = None
+        await self.index.ensure_fresh()
+        self.assertEqual(self.index.full_loads, 2)
+        await self.assert_consistent()
+
+        # 版本号未变化时不重新加载
+        self.index.checked_at = None
+        await self.index.ensure_fresh()
+        self.assertEqual(self.index.full_loads, 2)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,93 @@
+"""
+条件GET测试
+核对If-None-Match的弱比较、ETag随版本号/查询参数/可见性键变化，以及conditional_get的304短路。
+
+用法（在backend目录下）：
+    python -m unittest discover tests
+"""
+import unittest
+from typing import Optional
+
+from fastapi import Request, Response
+from tortoise import Tortoise
+
+from utils.etag import (
+    CACHE_CONTROL, RESOURCE_GROUPS, RESOURCE_MENUS, build_etag, bump_resource_version, conditional_get,
+    ensure_resource_versions, etag_matches,
+)
+
+MODEL_MODULES = ["models.admin", "models.deviceModel", "models.systemModel", "models.vpnModel",
+                 "models.commandModel", "models.aiToolModel", "models.groupModel"]
+
+
+def make_request(path: str = "/api/users/groups", query: str = "", if_none_match: Optional[str] = None) -> Request:
+    headers = [(b"if-none-match", if_none_match.encode())] if if_none_match is not None else []
+    return Request({"type": "http", "method": "GET", "path": path, "query_string": query.encode(), "headers": headers})
+
+
+class ETagMatchTest(unittest.TestCase):
+
+    def test_weak_comparison(self):
+        etag = 'W/"groups-3-abc"'
+        self.assertTrue(etag_matches(etag, etag))
+        self.assertTrue(etag_matches('"groups-3-abc"', etag))
+        self.assertTrue(etag_matches('"other", W/"groups-3-abc"', etag))
+        self.assertTrue(etag_matches("*", etag))
+        self.assertFalse(etag_matches('W/"groups-4-abc"', etag))
+        self.assertFalse(etag_matches("", etag))
+        self.assertFalse(etag_matches(None, etag))
+
+    def test_etag_inputs(self):
+        base = build_etag(make_request(query="a=1&b=2"), RESOURCE_GROUPS, 1)
+        # 查询参数顺序不影响ETag
+        self.assertEqual(build_etag(make_request(query="b=2&a=1"), RESOURCE_GROUPS, 1), base)
+        self.assertNotEqual(build_etag(make_request(query="a=1&b=3"), RESOURCE_GROUPS, 1), base)
+        self.assertNotEqual(build_etag(make_request(query="a=1&b=2"), RESOURCE_GROUPS, 2), base)
+        self.assertNotEqual(build_etag(make_request(query="a=1&b=2"), RESOURCE_GROUPS, 1, visibility_key=5), base)
+        self.assertNotEqual(build_etag(make_request("/api/other", "a=1&b=2"), RESOURCE_GROUPS, 1), base)
+
+
+class ConditionalGetTest(unittest.IsolatedAsyncioTestCase):
+
+    async def asyncSetUp(self):
+        await Tortoise.init(db_url="sqlite://:memory:", modules={"models": MODEL_MODULES})
+        await Tortoise.generate_schemas()
+        await ensure_resource_versions()
+
+    async def asyncTearDown(self):
+        await Tortoise._drop_databases()
+
+    async def test_miss_sets_headers(self):
+        response = Response()
+        self.assertIsNone(await conditional_get(make_request(), response, RESOURCE_GROUPS))
+        self.assertTrue(response.headers["ETag"].startswith('W/"groups-0-'))
+        self.assertEqual(response.headers["Cache-Control"], CACHE_CONTROL)
+
+    async def test_match_returns_304_until_version_changes(self):
+        response = Response()
+        await conditional_get(make_request(), response, RESOURCE_GROUPS)
+        etag = response.headers["ETag"]
+
+        not_modified = await conditional_get(make_request(if_none_match=etag), Response(), RESOURCE_GROUPS)
+        self.assertEqual(not_modified.status_code, 304)
+        self.assertEqual(not_modified.headers["ETag"], etag)
+
+        # 其他资源族的修改不影响
+        await bump_resource_version(RESOURCE_MENUS)
+        self.assertIsNotNone(await conditional_get(make_request(if_none_match=etag), Response(), RESOURCE_GROUPS))
+
+        await bump_resource_version(RESOURCE_GROUPS)
+        response = Response()
+        self.assertIsNone(await conditional_get(make_request(if_none_match=etag), response, RESOURCE_GROUPS))
+        self.assertNotEqual(response.headers["ETag"], etag)
+
+    async def test_visibility_key_separates_users(self):
+        response = Response()
+        await conditional_get(make_request(), response, RESOURCE_GROUPS, visibility_key=1)
+        etag = response.headers["ETag"]
+        self.assertIsNone(
+            await conditional_get(make_request(if_none_match=etag), Response(), RESOURCE_GROUPS, visibility_key=2))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,107 @@
+"""
+无效IP清理流程测试
+使用内存SQLite和假的登录IP采集器，核对无效IP的集合差、批量清理调用与每轮统计。
+
+用法（在backend目录下）：
+    python -m unittest discover tests
+"""
+import unittest
+from typing import Dict, List, Optional, Set, Tuple
+
+from tortoise import Tortoise
+
+from connectivity_manager import InvalidIPReconciler, LoginIPCollector, load_ip_collector
+from models.deviceModel import Device, DeviceAccessIP
+
+MODEL_MODULES = ["models.admin", "models.deviceModel", "models.systemModel", "models.vpnModel",
+                 "models.commandModel", "models.aiToolModel", "models.groupModel"]
+
+
+class FakeLoginIPCollector(LoginIPCollector):
+    """按设备IP返回预置的登录IP，并记录清理调用"""
+
+    def __init__(self, logged_in: Dict[str, Optional[Set[str]]], failing: Set[str] = frozenset()):
+        self.logged_in = logged_in
+        self.failing = failing
+        self.remove_calls: List[List[Tuple[Dict, Set[str]]]] = []
+
+    async def collect(self, device: Dict) -> Optional[Set[str]]:
+        if device["ip"] in self.failing:
+            raise ConnectionError("登录失败")
+        return self.logged_in.get(device["ip"])
+
+    async def remove(self, targets: List[Tuple[Dict, Set[str]]]) -> Dict[int, int]:
+        self.remove_calls.append(targets)
+        return {device["id"]: len(ips) for device, ips in targets}
+
+
+async def create_device(ip: str, connected: bool = True) -> Device:
+    return await Device.create(
+        name=ip, ip=ip, creator="t", owner="t", admin_username="admin", admin_password="p",
+        form_type="单板", connectivity_status=connected)
+
+
+class InvalidIPReconcilerTest(unittest.IsolatedAsyncioTestCase):
+
+    async def asyncSetUp(self):
+        await Tortoise.init(db_url="sqlite://:memory:", modules={"models": MODEL_MODULES})
+        await Tortoise.generate_schemas()
+
+    async def asyncTearDown(self):
+        await Tortoise._drop_databases()
+
+    async def test_disabled_without_collector(self):
+        await create_device("10.0.0.1")
+        reconciler = InvalidIPReconciler()
+        self.assertFalse(reconciler.enabled)
+        self.assertIsNone(await reconciler.run())
+        self.assertEqual(reconciler.get_stats()["runs"], 0)
+        self.assertIsNone(load_ip_collector(""))
+
+    async def test_stale_ips_are_removed_in_one_bulk_call(self):
+        first = await create_device("10.0.0.1")
+        second = await create_device("10.0.0.2")
+        await create_device("10.0.0.3")  # 不支持采集
+        await create_device("10.0.0.4")  # 采集失败
+        await create_device("10.0.0.5", connected=False)  # 不连通，不扫描
+        await DeviceAccessIP.create(device=first, employee_id="a1", username="甲", role="occupant", vpn_ip="192.168.1.1")
+        await DeviceAccessIP.create(device=second, employee_id="a2", username="乙", role="shared", vpn_ip="192.168.1.2")
+
+        collector = FakeLoginIPCollector(
+            {
+                "10.0.0.1": {"192.168.1.1", "192.168.1.9", "172.16.0.1"},
+                "10.0.0.2": {"192.168.1.2"},
+                "10.0.0.3": None,
+                "10.0.0.5": {"192.168.1.7"},
+            },
+            failing={"10.0.0.4"},
+        )
+        reconciler = InvalidIPReconciler(collector, concurrency=2, whitelist=["172.16.0.1"])
+        stats = await reconciler.run()
+
+        # 访问记录中的IP和白名单保留，只清理其余IP；没有无效IP的设备不出现在清理列表中
+        self.assertEqual(len(collector.remove_calls), 1)
+        targets = {device["id"]: ips for device, ips in collector.remove_calls[0]}
+        self.assertEqual(targets, {first.id: {"192.168.1.9"}})
+
+        self.assertEqual(stats["devices_scanned"], 4)
+        self.assertEqual(stats["devices_collected"], 2)
+        self.assertEqual(stats["devices_skipped"], 1)
+        self.assertEqual(stats["collect_failures"], 1)
+        self.assertEqual(stats["stale_ips_found"], 1)
+        self.assertEqual(stats["stale_ips_removed"], 1)
+        self.assertFalse(stats["remove_failed"])
+        self.assertGreaterEqual(stats["duration"], 0)
+        self.assertEqual(reconciler.get_stats()["last_run"], stats)
+
+    async def test_no_remove_call_without_stale_ips(self):
+        device = await create_device("10.0.0.1")
+        await DeviceAccessIP.create(device=device, employee_id="a1", username="甲", role="occupant", vpn_ip="192.168.1.1")
+        collector = FakeLoginIPCollector({"10.0.0.1": {"192.168.1.1"}})
+        stats = await InvalidIPReconciler(collector).run()
+        self.assertEqual(collector.remove_calls, [])
+        self.assertEqual(stats["stale_ips_found"], 0)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,101 @@
+"""
+游标分页测试
+使用内存SQLite核对游标的编解码、按 (排序字段, id) 的前后翻页，以及排序字段同值时的稳定性。
+
+用法（在backend目录下）：
+    python -m unittest discover tests
+"""
+import unittest
+from datetime import datetime
+
+from fastapi import HTTPException
+from tortoise import Tortoise
+
+from models.deviceModel import Device
+from utils.pagination import CursorParams, decode_cursor, encode_cursor, paginate_by_cursor
+
+MODEL_MODULES = ["models.admin", "models.deviceModel", "models.systemModel", "models.vpnModel",
+                 "models.commandModel", "models.aiToolModel", "models.groupModel"]
+
+# 排序字段有重复值，翻页必须依靠id区分同值的行
+NAMES = ["b", "a", "b", "c", "a", "b", "d", "c"]
+
+
+def params(cursor: str = "", direction: str = "next", with_total: bool = False) -> CursorParams:
+    return CursorParams(cursor=cursor, direction=direction, with_total=with_total)
+
+
+class CursorCodecTest(unittest.TestCase):
+
+    def test_round_trip(self):
+        moment = datetime(2024, 5, 1, 8, 30, 15, 123456)
+        for value in (moment, "名称", 42, None):
+            self.assertEqual(decode_cursor(encode_cursor(value, 7)), (value, 7))
+
+    def test_invalid_cursor(self):
+        for cursor in ("not-a-cursor", encode_cursor("x", 1)[:-3], "WyJ4IiwiMSJd"):  # 最后一个的id是字符串
+            with self.assertRaises(HTTPException) as caught:
+                decode_cursor(cursor)
+            self.assertEqual(caught.exception.status_code, 400)
+
+
+class CursorPaginationTest(unittest.IsolatedAsyncioTestCase):
+
+    async def asyncSetUp(self):
+        await Tortoise.init(db_url="sqlite://:memory:", modules={"models": MODEL_MODULES})
+        await Tortoise.generate_schemas()
+        for index, name in enumerate(NAMES):
+            await Device.create(name=name, ip=f"10.0.0.{index}", creator="t", owner="t",
+                                admin_username="admin", admin_password="p", form_type="单板")
+
+    async def asyncTearDown(self):
+        await Tortoise._drop_databases()
+
+    async def walk_forward(self, sort_field: str, descending: bool, page_size: int = 3):
+        pages = []
+        cursor = ""
+        while cursor is not None:
+            rows, info = await paginate_by_cursor(Device.all(), params(cursor), page_size, sort_field, descending)
+            pages.append(([row.id for row in rows], info))
+            cursor = info["next_cursor"]
+        return pages
+
+    async def expected_ids(self, sort_field: str, descending: bool):
+        ordering = [f"-{sort_field}", "-id"] if descending else [sort_field, "id"]
+        return await Device.all().order_by(*ordering).values_list("id", flat=True)
+
+    async def test_forward_covers_every_row_once(self):
+        for sort_field, descending in (("name", False), ("name", True), ("id", False), ("id", True)):
+            pages = await self.walk_forward(sort_field, descending)
+            ids = [row_id for page, _ in pages for row_id in page]
+            self.assertEqual(ids, await self.expected_ids(sort_field, descending), (sort_field, descending))
+            self.assertFalse(pages[0][1]["has_prev"])
+            self.assertIsNone(pages[0][1]["prev_cursor"])
+            self.assertFalse(pages[-1][1]["has_next"])
+
+    async def test_backward_returns_previous_pages(self):
+        pages = await self.walk_forward("name", descending=True)
+        # 从最后一页逐页向前翻，每页内容与向后翻页时一致
+        cursor = pages[-1][1]["prev_cursor"]
+        for page_ids, _ in reversed(pages[:-1]):
+            rows, info = await paginate_by_cursor(
+                Device.all(), params(cursor, "prev"), 3, "name", descending=True)
+            self.assertEqual([row.id for row in rows], page_ids)
+            self.assertTrue(info["has_next"])
+            cursor = info["prev_cursor"]
+        self.assertIsNone(cursor)
+
+    async def test_total_and_filters(self):
+        rows, info = await paginate_by_cursor(
+            Device.filter(name="b"), params(with_total=True), 2, "name")
+        self.assertEqual(info["total"], 3)
+        self.assertEqual(len(rows), 2)
+        self.assertTrue(info["has_next"])
+        rows, info = await paginate_by_cursor(Device.filter(name="b"), params(info["next_cursor"]), 2, "name")
+        self.assertEqual([row.name for row in rows], ["b"])
+        self.assertFalse(info["has_next"])
+        self.assertNotIn("total", info)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,101 @@
+"""
+角色权限位图测试
+使用内存SQLite核对权限位序号分配、角色位掩码的权限判断与展开，以及角色权限修改后的重新加载。
+
+用法（在backend目录下）：
+    python -m unittest discover tests
+"""
+import unittest
+
+from tortoise import Tortoise
+
+from models.admin import Permission, Role, RolePermission
+from permission_registry import permission_registry
+from utils.etag import RESOURCE_PERMISSIONS, bump_resource_version, ensure_resource_versions
+
+MODEL_MODULES = ["models.admin", "models.deviceModel", "models.systemModel", "models.vpnModel",
+                 "models.commandModel", "models.aiToolModel", "models.groupModel"]
+
+
+class PermissionRegistryTest(unittest.IsolatedAsyncioTestCase):
+
+    async def asyncSetUp(self):
+        await Tortoise.init(db_url="sqlite://:memory:", modules={"models": MODEL_MODULES})
+        await Tortoise.generate_schemas()
+        await ensure_resource_versions()
+
+        self.permissions = {}
+        for code in ("device:view", "device:use", "device:delete", "user:update"):
+            self.permissions[code] = await Permission.create(
+                name=code, code=code, resource=code.split(":")[0], action=code.split(":")[1])
+        self.viewer = await Role.create(name="查看者")
+        self.operator = await Role.create(name="操作员")
+        self.empty = await Role.create(name="无权限")
+        for role, codes in ((self.viewer, ["device:view"]), (self.operator, ["device:view", "device:use", "user:update"])):
+            for code in codes:
+                await RolePermission.create(role=role, permission=self.permissions[code])
+
+        # 全局实例在用例之间共用，每个用例从头加载
+        permission_registry.invalidate()
+        await permission_registry.ensure_fresh()
+
+    async def asyncTearDown(self):
+        await Tortoise._drop_databases()
+
+    async def test_bits_and_masks(self):
+        registry = permission_registry
+        self.assertEqual(list(registry.bits), ["device:view", "device:use", "device:delete", "user:update"])
+        self.assertEqual(registry.all_mask, 0b1111)
+        self.assertEqual(registry.get_role_mask(self.viewer.id), 0b0001)
+        self.assertEqual(registry.get_role_mask(self.operator.id), 0b1011)
+        self.assertEqual(registry.get_role_mask(self.empty.id), 0)
+        self.assertEqual(registry.get_role_mask(None), 0)
+        self.assertEqual(registry.get_role_mask(999), 0)
+        self.assertEqual(registry.get_role_name(self.operator.id), "操作员")
+        self.assertIsNone(registry.get_role_name(None))
+
+    async def test_has_permission(self):
+        registry = permission_registry
+        self.assertTrue(registry.has_permission(self.operator.id, "device:use"))
+        self.assertFalse(registry.has_permission(self.viewer.id, "device:use"))
+        self.assertFalse(registry.has_permission(self.operator.id, "device:delete"))
+        self.assertFalse(registry.has_permission(self.operator.id, "unknown:code"))
+        self.assertFalse(registry.has_permission(None, "device:view"))
+
+    async def test_expand_mask(self):
+        registry = permission_registry
+        mask = registry.get_role_mask(self.operator.id)
+        self.assertEqual(registry.get_codes(mask), ["device:view", "device:use", "user:update"])
+        self.assertEqual([item["name"] for item in registry.get_permissions(mask)],
+                         ["device:view", "device:use", "user:update"])
+        self.assertEqual(registry.get_codes(0), [])
+
+    async def test_local_change_reloads_immediately(self):
+        # 本进程的保存通过模型信号立即失效
+        await RolePermission.create(role=self.viewer, permission=self.permissions["device:delete"])
+        await permission_registry.ensure_fresh()
+        self.assertTrue(permission_registry.has_permission(self.viewer.id, "device:delete"))
+
+        link = await RolePermission.get(role=self.viewer, permission=self.permissions["device:delete"])
+        await link.delete()
+        await permission_registry.ensure_fresh()
+        self.assertFalse(permission_registry.has_permission(self.viewer.id, "device:delete"))
+
+    async def test_other_worker_change_needs_version_bump(self):
+        loads = permission_registry.full_loads
+        # 批量修改不触发信号，模拟其他worker：检查间隔过后按版本号发现
+        await RolePermission.filter(role=self.operator, permission=self.permissions["user:update"]).delete()
+        permission_registry.checked_at = None
+        await permission_registry.ensure_fresh()
+        self.assertEqual(permission_registry.full_loads, loads)
+        self.assertTrue(permission_registry.has_permission(self.operator.id, "user:update"))
+
+        await bump_resource_version(RESOURCE_PERMISSIONS)
+        permission_registry.checked_at = None
+        await permission_registry.ensure_fresh()
+        self.assertEqual(permission_registry.full_loads, loads + 1)
+        self.assertFalse(permission_registry.has_permission(self.operator.id, "user:update"))
+
+
+if __name__ == "__main__":
+    unittest.main()
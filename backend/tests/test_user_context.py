@@ -0,0 +1,112 @@
+"""
+请求级用户上下文测试
+使用内存SQLite核对角色判断（超级用户/管理员/高级用户/普通用户）、权限位判断、分组与设备可见性，
+以及同一请求内只解析一次。
+
+用法（在backend目录下）：
+    python -m unittest discover tests
+"""
+import unittest
+
+from fastapi import Request
+from tortoise import Tortoise
+
+from device_visibility import device_visibility
+from models.admin import Permission, Role, RolePermission, User
+from models.deviceModel import Device
+from models.groupModel import DeviceGroup, Group, GroupMember
+from permission_registry import permission_registry
+from user_context import ROLE_ADMIN, ROLE_ADVANCED, get_user_context
+from utils.etag import ensure_resource_versions
+
+MODEL_MODULES = ["models.admin", "models.deviceModel", "models.systemModel", "models.vpnModel",
+                 "models.commandModel", "models.aiToolModel", "models.groupModel"]
+
+
+def make_request() -> Request:
+    return Request({"type": "http", "method": "GET", "path": "/", "query_string": b"", "headers": []})
+
+
+class UserContextTest(unittest.IsolatedAsyncioTestCase):
+
+    async def asyncSetUp(self):
+        await Tortoise.init(db_url="sqlite://:memory:", modules={"models": MODEL_MODULES})
+        await Tortoise.generate_schemas()
+        await ensure_resource_versions()
+
+        view = await Permission.create(name="查看", code="device:view", resource="device", action="view")
+        await Permission.create(name="删除", code="device:delete", resource="device", action="delete")
+        admin_role = await Role.create(name=ROLE_ADMIN)
+        advanced_role = await Role.create(name=ROLE_ADVANCED)
+        await RolePermission.create(role=advanced_role, permission=view)
+
+        self.superuser = await User.create(employee_id="s1", username="超管", hashed_password="x", is_superuser=True)
+        self.admin = await User.create(employee_id="a1", username="管理", hashed_password="x", role=admin_role)
+        self.advanced = await User.create(employee_id="v1", username="高级", hashed_password="x", role=advanced_role)
+        self.plain = await User.create(employee_id="p1", username="普通", hashed_password="x")
+
+        group = await Group.create(name="g1")
+        await GroupMember.create(group=group, user=self.advanced)
+        self.grouped = await Device.create(name="d0", ip="10.0.0.1", creator="t", owner="t",
+                                           admin_username="admin", admin_password="p", form_type="单板")
+        self.ungrouped = await Device.create(name="d1", ip="10.0.0.2", creator="t", owner="t",
+                                             admin_username="admin", admin_password="p", form_type="单板")
+        await DeviceGroup.create(device=self.grouped, group=group)
+        self.group_id = group.id
+
+        # 全局实例在用例之间共用，每个用例从头加载
+        permission_registry.invalidate()
+        device_visibility.acl_version = None
+        device_visibility.checked_at = None
+
+    async def asyncTearDown(self):
+        await Tortoise._drop_databases()
+
+    async def test_roles(self):
+        superuser = await get_user_context(make_request(), self.superuser)
+        admin = await get_user_context(make_request(), self.admin)
+        advanced = await get_user_context(make_request(), self.advanced)
+        plain = await get_user_context(make_request(), self.plain)
+
+        self.assertEqual([c.is_admin for c in (superuser, admin, advanced, plain)], [True, True, False, False])
+        self.assertEqual([c.is_advanced for c in (superuser, admin, advanced, plain)], [True, True, True, False])
+        self.assertEqual([c.display_role_name for c in (superuser, admin, advanced, plain)],
+                         ["超级管理员", ROLE_ADMIN, ROLE_ADVANCED, "普通用户"])
+        self.assertIsNone(superuser.role_name)
+        self.assertTrue(superuser.has_role(ROLE_ADVANCED))
+        self.assertFalse(admin.has_role(ROLE_ADVANCED))
+
+    async def test_permissions(self):
+        superuser = await get_user_context(make_request(), self.superuser)
+        advanced = await get_user_context(make_request(), self.advanced)
+        plain = await get_user_context(make_request(), self.plain)
+
+        self.assertTrue(superuser.has_permission("device:delete"))
+        self.assertEqual(superuser.permission_mask, permission_registry.all_mask)
+        self.assertTrue(advanced.has_permission("device:view"))
+        self.assertFalse(advanced.has_permission("device:delete"))
+        self.assertFalse(advanced.has_permission("unknown:code"))
+        self.assertFalse(plain.has_permission("device:view"))
+
+    async def test_groups_and_device_visibility(self):
+        superuser = await get_user_context(make_request(), self.superuser)
+        advanced = await get_user_context(make_request(), self.advanced)
+        plain = await get_user_context(make_request(), self.plain)
+
+        self.assertEqual(advanced.group_ids, frozenset({self.group_id}))
+        self.assertEqual(plain.group_ids, frozenset())
+        self.assertTrue(advanced.can_view_device(self.grouped.id))
+        self.assertFalse(plain.can_view_device(self.grouped.id))
+        self.assertTrue(plain.can_view_device(self.ungrouped.id))
+        self.assertTrue(superuser.can_view_device(self.grouped.id))
+
+    async def test_resolved_once_per_request(self):
+        request = make_request()
+        context = await get_user_context(request, self.advanced)
+        self.assertIs(await get_user_context(request, self.advanced), context)
+        # 同一请求对象换成其他用户时重新解析
+        self.assertIsNot(await get_user_context(request, self.plain), context)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,80 @@
+"""
+用户上下文缓存测试
+核对按工号缓存的用户快照：取出时构造新实例、TTL过期、LRU淘汰，以及按工号/用户ID失效。
+
+用法（在backend目录下）：
+    python -m unittest discover tests
+"""
+import asyncio
+import unittest
+
+from tortoise import Tortoise
+
+from auth import UserContextCache
+from models.admin import User
+
+MODEL_MODULES = ["models.admin", "models.deviceModel", "models.systemModel", "models.vpnModel",
+                 "models.commandModel", "models.aiToolModel", "models.groupModel"]
+
+
+class UserContextCacheTest(unittest.IsolatedAsyncioTestCase):
+
+    async def asyncSetUp(self):
+        await Tortoise.init(db_url="sqlite://:memory:", modules={"models": MODEL_MODULES})
+        await Tortoise.generate_schemas()
+        self.users = [
+            await User.create(employee_id=f"u{index}", username=f"用户{index}", hashed_password="x")
+            for index in range(3)
+        ]
+
+    async def asyncTearDown(self):
+        await Tortoise._drop_databases()
+
+    async def test_returns_independent_copies(self):
+        cache = UserContextCache(ttl=60, max_size=10)
+        cache.put(self.users[0])
+        first = cache.get("u0")
+        first.username = "改过"
+        second = cache.get("u0")
+        self.assertIsNot(first, second)
+        self.assertEqual(second.username, "用户0")
+        self.assertEqual(second.id, self.users[0].id)
+        self.assertEqual(cache.get_stats()["hits"], 2)
+
+    async def test_ttl(self):
+        cache = UserContextCache(ttl=0.2, max_size=10)
+        cache.put(self.users[0])
+        self.assertIsNotNone(cache.get("u0"))
+        await asyncio.sleep(0.25)
+        self.assertIsNone(cache.get("u0"))
+        self.assertEqual(cache.get_stats()["size"], 0)
+        self.assertEqual(cache.get_stats()["misses"], 1)
+
+    async def test_lru_eviction(self):
+        cache = UserContextCache(ttl=60, max_size=2)
+        cache.put(self.users[0])
+        cache.put(self.users[1])
+        cache.get("u0")  # u0变为最近使用，u1最久未用
+        cache.put(self.users[2])
+        self.assertIsNone(cache.get("u1"))
+        self.assertIsNotNone(cache.get("u0"))
+        self.assertIsNotNone(cache.get("u2"))
+        self.assertEqual(cache.get_stats()["size"], 2)
+
+    async def test_invalidation(self):
+        cache = UserContextCache(ttl=60, max_size=10)
+        for user in self.users:
+            cache.put(user)
+        cache.invalidate("u0")
+        cache.invalidate("missing")
+        self.assertIsNone(cache.get("u0"))
+        cache.invalidate_user_ids([self.users[1].id])
+        self.assertIsNone(cache.get("u1"))
+        self.assertIsNotNone(cache.get("u2"))
+        self.assertEqual(cache.get_stats()["invalidations"], 2)
+        cache.clear()
+        self.assertIsNone(cache.get("u2"))
+
+
+if __name__ == "__main__":
+    unittest.main()
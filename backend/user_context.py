@@ -0,0 +1,94 @@
+"""
+请求级用户上下文
+原先处理函数里每次has_role都要fetch_related('role')查询一次角色（抢占、优先排队等接口一次请求要查两三次），
+设备访问检查再单独处理分组。这里提供一个FastAPI依赖，每个请求只解析一次角色名称、权限位掩码、
+所属分组以及管理员/高级用户标记，之后的判断都是内存计算。
+角色与权限来自权限注册表，分组来自设备可见性索引，两者都按版本号保持新鲜，解析时通常不访问数据库。
+"""
+from typing import FrozenSet, Optional
+
+from fastapi import Depends, Request
+
+from auth import AuthManager
+from device_visibility import device_visibility
+from models.admin import User
+from permission_registry import permission_registry
+
+ROLE_ADMIN = "管理员"
+ROLE_ADVANCED = "高级用户"
+
+
+class UserContext:
+    """
+    当前请求的用户上下文
+    - role_name：角色名称，超级用户为None
+    - permission_mask：角色权限位掩码，超级用户为全部权限
+    - group_ids：所属分组ID
+    """
+
+    __slots__ = ("user", "role_name", "permission_mask", "group_ids")
+
+    def __init__(self, user: User, role_name: Optional[str], permission_mask: int, group_ids: FrozenSet[int]):
+        self.user = user
+        self.role_name = role_name
+        self.permission_mask = permission_mask
+        self.group_ids = group_ids
+
+    @property
+    def is_superuser(self) -> bool:
+        return self.user.is_superuser
+
+    @property
+    def is_admin(self) -> bool:
+        """超级用户或管理员"""
+        return self.has_role(ROLE_ADMIN)
+
+    @property
+    def is_advanced(self) -> bool:
+        """超级用户、管理员或高级用户"""
+        return self.is_admin or self.has_role(ROLE_ADVANCED)
+
+    @property
+    def display_role_name(self) -> str:
+        """与User.get_role_name一致的展示名称"""
+        if self.is_superuser:
+            return "超级管理员"
+        return self.role_name or "普通用户"
+
+    def has_role(self, role_name: str) -> bool:
+        """与User.has_role一致：超级用户拥有所有角色"""
+        return self.is_superuser or self.role_name == role_name
+
+    def has_permission(self, code: str) -> bool:
+        if self.is_superuser:
+            return True
+        bit = permission_registry.bits.get(code)
+        return bit is not None and bool(self.permission_mask & (1 << bit))
+
+    def can_view_device(self, device_id: int) -> bool:
+        """未绑定分组的设备对所有人可见，否则需属于用户任一分组"""
+        return self.is_superuser or device_visibility.can_view(self.user.id, device_id)
+
+
+async def get_user_context(
+    request: Request,
+    current_user: User = Depends(AuthManager.get_current_user),
+) -> UserContext:
+    """解析当前请求的用户上下文，结果保存在request.state上，同一请求内只解析一次"""
+    context = getattr(request.state, "user_context", None)
+    if context is not None and context.user.id == current_user.id:
+        return context
+
+    await permission_registry.ensure_fresh()
+    await device_visibility.ensure_fresh()
+    if current_user.is_superuser:
+        role_name = None
+        permission_mask = permission_registry.all_mask
+    else:
+        role_name = permission_registry.get_role_name(current_user.role_id)
+        permission_mask = permission_registry.get_role_mask(current_user.role_id)
+    group_ids = frozenset(device_visibility.user_group_ids.get(current_user.id, ()))
+
+    context = UserContext(current_user, role_name, permission_mask, group_ids)
+    request.state.user_context = context
+    return context
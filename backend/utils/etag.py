@@ -0,0 +1,142 @@
+"""
+条件GET（ETag / If-None-Match）
+每个资源族在数据库中维护一个单调递增的版本号，相关数据修改时递增：
+- 模型实例的保存/删除通过Tortoise信号自动递增
+- 绕过信号的批量UPDATE/DELETE在调用处显式调用bump_resource_version
+ETag由资源族版本、用户可见性键和查询参数推导，If-None-Match命中时直接返回304，不执行列表查询也不做序列化。
+版本号存在数据库中，多worker部署时任一进程的修改对所有进程立即可见，进程内缓存也据此发现其他worker的修改。
+"""
+import hashlib
+from typing import Any, Optional
+
+from fastapi import Request, Response
+from tortoise.expressions import F
+from tortoise.signals import post_delete, post_save
+
+from models.admin import Menu, Permission, Role, RolePermission, User
+from models.deviceModel import Device, DeviceConfig, DeviceShareRequest, DeviceUsage
+from models.groupModel import DeviceGroup, Group, GroupMember
+from models.systemModel import ResourceVersion
+from models.vpnModel import VPNConfig
+
+# 资源族
+RESOURCE_DEVICES = "devices"
+RESOURCE_MENUS = "menus"
+RESOURCE_VPN_CONFIGS = "vpn_configs"
+RESOURCE_GROUPS = "groups"
+# 设备分组关联与分组成员（设备可见性）
+RESOURCE_DEVICE_ACL = "device_acl"
+# 角色与权限
+RESOURCE_PERMISSIONS = "permissions"
+# 设备目录缓存的内容（设备基本信息、VPN配置、分组与设备分组关联），由device_catalog自行递增
+RESOURCE_DEVICE_CATALOG = "device_catalog"
+RESOURCE_FAMILIES = (
+    RESOURCE_DEVICES, RESOURCE_MENUS, RESOURCE_VPN_CONFIGS, RESOURCE_GROUPS, RESOURCE_DEVICE_ACL, RESOURCE_PERMISSIONS,
+    RESOURCE_DEVICE_CATALOG)
+
+# 模型修改时需要递增的资源族
+MODEL_RESOURCES = {
+    Device: (RESOURCE_DEVICES,),
+    DeviceUsage: (RESOURCE_DEVICES,),
+    DeviceGroup: (RESOURCE_DEVICES, RESOURCE_DEVICE_ACL),
+    DeviceShareRequest: (RESOURCE_DEVICES,),
+    DeviceConfig: (RESOURCE_DEVICES,),
+    VPNConfig: (RESOURCE_VPN_CONFIGS, RESOURCE_DEVICES),
+    Group: (RESOURCE_GROUPS, RESOURCE_DEVICES, RESOURCE_DEVICE_ACL),
+    GroupMember: (RESOURCE_GROUPS, RESOURCE_DEVICES, RESOURCE_DEVICE_ACL),
+    Role: (RESOURCE_GROUPS, RESOURCE_MENUS, RESOURCE_PERMISSIONS),
+    Permission: (RESOURCE_MENUS, RESOURCE_PERMISSIONS),
+    RolePermission: (RESOURCE_MENUS, RESOURCE_PERMISSIONS),
+    Menu: (RESOURCE_MENUS,),
+}
+
+# 分组列表中展示的成员字段，用户的其他字段（密码等）变化不影响分组列表
+USER_GROUP_LIST_FIELDS = {"employee_id", "username", "is_superuser", "role", "role_id"}
+
+# 浏览器每次都带If-None-Match回源校验，304时复用本地副本
+CACHE_CONTROL = "private, no-cache"
+
+
+async def ensure_resource_versions():
+    """创建各资源族的版本记录（启动时调用）"""
+    for name in RESOURCE_FAMILIES:
+        await ResourceVersion.get_or_create(name=name)
+
+
+async def bump_resource_version(*names: str):
+    """递增资源族版本号（原子UPDATE，多worker安全）"""
+    if names:
+        await ResourceVersion.filter(name__in=names).update(version=F("version") + 1)
+
+
+async def get_resource_version(name: str) -> int:
+    versions = await ResourceVersion.filter(name=name).values_list("version", flat=True)
+    return versions[0] if versions else 0
+
+
+@post_save(*MODEL_RESOURCES)
+async def _bump_on_save(sender, instance, created, using_db, update_fields):
+    await bump_resource_version(*MODEL_RESOURCES[sender])
+
+
+@post_delete(*MODEL_RESOURCES)
+async def _bump_on_delete(sender, instance, using_db):
+    await bump_resource_version(*MODEL_RESOURCES[sender])
+
+
+@post_save(User)
+async def _bump_on_user_save(sender, instance, created, using_db, update_fields):
+    # 新用户尚未加入分组（加入时由分组成员递增）；只有分组列表展示的字段变化才递增
+    if created or (update_fields and not set(update_fields) & USER_GROUP_LIST_FIELDS):
+        return
+    await bump_resource_version(RESOURCE_GROUPS)
+
+
+@post_delete(User)
+async def _bump_on_user_delete(sender, instance, using_db):
+    # 分组成员随用户级联删除，不触发成员信号，按成员变化递增
+    await bump_resource_version(*MODEL_RESOURCES[GroupMember])
+
+
+def build_etag(request: Request, name: str, version: int, visibility_key: Any = "") -> str:
+    """由资源族版本、可见性键与请求路径及参数生成弱ETag"""
+    query = "&".join(f"{key}={value}" for key, value in sorted(request.query_params.multi_items()))
+    digest = hashlib.blake2s(
+        f"{request.url.path}?{query}|{visibility_key}".encode(), digest_size=8).hexdigest()
+    return f'W/"{name}-{version}-{digest}"'
+
+
+def etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    """按弱比较判断If-None-Match是否命中"""
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == "*":
+        return True
+    target = etag.removeprefix("W/")
+    return any(candidate.strip().removeprefix("W/") == target for candidate in if_none_match.split(","))
+
+
+async def conditional_get(
+    request: Request,
+    response: Response,
+    name: str,
+    visibility_key: Any = "",
+) -> Optional[Response]:
+    """
+    处理条件GET
+
+    Args:
+        request: 当前请求
+        response: 当前响应（未命中时写入ETag头）
+        name: 资源族名称
+        visibility_key: 用户可见性键，内容因人而异时传入（如用户ID、角色ID）
+
+    Returns:
+        命中时返回304响应，调用方直接返回；未命中返回None，继续正常处理
+    """
+    etag = build_etag(request, name, await get_resource_version(name), visibility_key)
+    if etag_matches(request.headers.get("if-none-match"), etag):
+        return Response(status_code=304, headers={"ETag": etag, "Cache-Control": CACHE_CONTROL})
+    response.headers["ETag"] = etag
+    response.headers["Cache-Control"] = CACHE_CONTROL
+    return None
@@ -0,0 +1,100 @@
+"""
+大列表响应的快速序列化
+常规路径为每行构造一个Pydantic模型，再经BaseResponse校验与标准库json编码，page_size较大时这两步占据接口的大部分CPU。
+快速路径下热点接口直接组装dict行，由orjson一次编码（未安装orjson时回退到标准库json），
+文档中的响应结构仍由路由的response_model声明；开启FAST_JSON_VALIDATE时用预构建的TypeAdapter校验数据，便于开发期核对。
+"""
+import json
+from datetime import date, datetime, time
+from decimal import Decimal
+from enum import Enum
+from functools import lru_cache
+from typing import Any, Optional
+
+from fastapi import Response
+from fastapi.responses import JSONResponse
+from pydantic import BaseModel, TypeAdapter
+
+from config import settings
+
+try:
+    import orjson
+except ImportError:  # 可选依赖
+    orjson = None
+
+
+def _json_default(value: Any) -> Any:
+    """标准库json的回退编码，输出格式与Pydantic的JSON序列化一致"""
+    if isinstance(value, datetime):
+        text = value.isoformat()
+        return text[:-6] + "Z" if text.endswith("+00:00") else text
+    if isinstance(value, (date, time)):
+        return value.isoformat()
+    if isinstance(value, Enum):
+        return value.value
+    if isinstance(value, Decimal):
+        return str(value)
+    if isinstance(value, BaseModel):
+        return value.model_dump(mode="json")
+    if isinstance(value, (set, frozenset)):
+        return list(value)
+    raise TypeError(f"无法序列化的类型: {type(value).__name__}")
+
+
+def _orjson_default(value: Any) -> Any:
+    if isinstance(value, BaseModel):
+        return value.model_dump(mode="json")
+    return _json_default(value)
+
+
+def dumps(content: Any) -> bytes:
+    """将响应内容编码为JSON字节串"""
+    if orjson is not None:
+        return orjson.dumps(content, default=_orjson_default, option=orjson.OPT_UTC_Z | orjson.OPT_NON_STR_KEYS)
+    return json.dumps(
+        content, default=_json_default, ensure_ascii=False, allow_nan=False, separators=(",", ":")
+    ).encode("utf-8")
+
+
+class FastJSONResponse(JSONResponse):
+    """使用orjson（或回退的标准库json）编码的JSON响应"""
+
+    def render(self, content: Any) -> bytes:
+        return dumps(content)
+
+
+@lru_cache(maxsize=None)
+def get_type_adapter(schema: Any) -> TypeAdapter:
+    """按类型缓存TypeAdapter，避免每次请求重新构建校验器"""
+    return TypeAdapter(schema)
+
+
+def fast_response(
+    data: Any,
+    message: str = "success",
+    code: int = 200,
+    schema: Any = None,
+    response: Optional[Response] = None,
+) -> FastJSONResponse:
+    """
+    以BaseResponse的结构直接返回已组装好的数据
+
+    Args:
+        data: 响应数据（dict/list等可直接编码的对象）
+        message: 响应消息
+        code: 业务状态码
+        schema: data对应的类型，开启FAST_JSON_VALIDATE时据此校验
+        response: 路由注入的Response，其上设置的响应头（如ETag）会带到返回的响应上
+
+    Returns:
+        FastJSONResponse
+    """
+    if schema is not None and settings.FAST_JSON_VALIDATE:
+        get_type_adapter(schema).validate_python(data)
+    result = FastJSONResponse({"code": code, "message": message, "data": data})
+    if response is not None:
+        result.raw_headers.extend(
+            (key, value) for key, value in response.raw_headers
+            if key not in (b"content-length", b"content-type")
+        )
+    return result
@@ -0,0 +1,242 @@
+"""
+ICMP回显探测引擎
+基于asyncio与Linux非特权ICMP数据报套接字（SOCK_DGRAM + IPPROTO_ICMP），
+所有探测共享同一个套接字，按标识符+序列号匹配回包，避免每次探测fork一个ping子进程。
+当前环境不支持时（非Linux、net.ipv4.ping_group_range未放开等）回退到ping子进程。
+"""
+import asyncio
+import ipaddress
+import logging
+import re
+import socket
+import struct
+import sys
+import time
+from typing import Dict, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+ICMP_ECHO_REPLY = 0
+ICMP_ECHO_REQUEST = 8
+
+# 探测后端
+BACKEND_ICMP = "icmp"
+BACKEND_SUBPROCESS = "subprocess"
+
+
+def _checksum(data: bytes) -> int:
+    """计算ICMP校验和（非特权套接字下内核会重写，这里保持报文完整）"""
+    if len(data) % 2:
+        data += b"\x00"
+    total = sum(struct.unpack(f"!{len(data) // 2}H", data))
+    total = (total >> 16) + (total & 0xFFFF)
+    total += total >> 16
+    return ~total & 0xFFFF
+
+
+def _is_ipv4(ip: str) -> bool:
+    try:
+        ipaddress.IPv4Address(ip)
+        return True
+    except ValueError:
+        return False
+
+
+class ICMPProbeEngine:
+    """共享套接字的ICMP回显探测引擎"""
+
+    def __init__(self):
+        self._sock: Optional[socket.socket] = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        # 非特权ICMP套接字的标识符由内核设置为本地"端口"
+        self._identifier = 0
+        self._sequence = 0
+        # 进行中的探测 {sequence: (ip, future, send_time)}
+        self._pending: Dict[int, Tuple[str, asyncio.Future, float]] = {}
+        # 套接字创建失败后不再重试，直接走回退路径
+        self._unsupported = False
+
+    def is_available(self) -> bool:
+        """当前环境是否可以使用ICMP引擎（首次调用时尝试创建套接字）"""
+        return self._ensure_socket()
+
+    def _ensure_socket(self) -> bool:
+        if self._unsupported:
+            return False
+        loop = asyncio.get_running_loop()
+        if self._sock is not None and self._loop is loop:
+            return True
+        # 事件循环变化（如热重载）时重建套接字
+        self.close()
+
+        if not sys.platform.startswith("linux"):
+            logger.info("非Linux平台，ICMP探测引擎不可用，使用ping子进程")
+            self._unsupported = True
+            return False
+        try:
+            sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM, socket.IPPROTO_ICMP)
+            sock.setblocking(False)
+            sock.bind(("0.0.0.0", 0))
+        except OSError as e:
+            logger.warning(f"无法创建非特权ICMP套接字（请检查net.ipv4.ping_group_range）: {e}，使用ping子进程")
+            self._unsupported = True
+            return False
+
+        self._sock = sock
+        self._loop = loop
+        self._identifier = sock.getsockname()[1]
+        loop.add_reader(sock.fileno(), self._on_readable)
+        logger.info(f"ICMP探测引擎已启动，标识符: {self._identifier}")
+        return True
+
+    def _next_sequence(self) -> int:
+        for _ in range(0x10000):
+            self._sequence = (self._sequence + 1) & 0xFFFF
+            if self._sequence not in self._pending:
+                return self._sequence
+        raise RuntimeError("ICMP探测序列号耗尽")
+
+    async def ping(self, ip: str, timeout: float) -> Optional[float]:
+        """
+        发送一次ICMP回显请求
+
+        Args:
+            ip: IPv4地址
+            timeout: 超时时间（秒）
+
+        Returns:
+            往返时延（毫秒），超时或不可达时返回None
+        """
+        if not self._ensure_socket():
+            raise RuntimeError("ICMP探测引擎不可用")
+
+        sequence = self._next_sequence()
+        payload = struct.pack("!d", time.time())
+        header = struct.pack("!BBHHH", ICMP_ECHO_REQUEST, 0, 0, self._identifier, sequence)
+        checksum = _checksum(header + payload)
+        packet = struct.pack("!BBHHH", ICMP_ECHO_REQUEST, 0, checksum, self._identifier, sequence) + payload
+
+        future = self._loop.create_future()
+        send_time = time.perf_counter()
+        self._pending[sequence] = (ip, future, send_time)
+        try:
+            try:
+                self._sock.sendto(packet, (ip, 0))
+            except OSError as e:
+                # 网络不可达等错误直接视为不通
+                logger.debug(f"ICMP发送失败 {ip}: {e}")
+                return None
+            try:
+                return await asyncio.wait_for(future, timeout=timeout)
+            except asyncio.TimeoutError:
+                return None
+        finally:
+            entry = self._pending.get(sequence)
+            if entry is not None and entry[1] is future:
+                del self._pending[sequence]
+
+    def _on_readable(self):
+        """读取所有就绪的回包并唤醒对应的探测"""
+        while True:
+            try:
+                data, addr = self._sock.recvfrom(1024)
+            except (BlockingIOError, InterruptedError):
+                return
+            except OSError as e:
+                logger.debug(f"ICMP接收出错: {e}")
+                return
+
+            # 数据报ICMP套接字收到的报文不含IP头
+            if len(data) < 8:
+                continue
+            icmp_type, _, _, identifier, sequence = struct.unpack("!BBHHH", data[:8])
+            if icmp_type != ICMP_ECHO_REPLY or identifier != self._identifier:
+                continue
+            entry = self._pending.get(sequence)
+            if entry is None:
+                continue
+            ip, future, send_time = entry
+            if addr[0] != ip or future.done():
+                continue
+            future.set_result((time.perf_counter() - send_time) * 1000)
+
+    def close(self):
+        """关闭套接字并取消所有进行中的探测"""
+        if self._sock is not None:
+            try:
+                if self._loop is not None and not self._loop.is_closed():
+                    self._loop.remove_reader(self._sock.fileno())
+            except Exception:
+                pass
+            self._sock.close()
+        self._sock = None
+        self._loop = None
+        for _, future, _ in self._pending.values():
+            if not future.done():
+                future.cancel()
+        self._pending.clear()
+
+
+# 全局ICMP探测引擎实例
+icmp_engine = ICMPProbeEngine()
+
+
+_RTT_PATTERN = re.compile(rb"time[=<]\s*([\d.]+)\s*ms")
+
+
+async def subprocess_ping(ip: str, timeout: int) -> Optional[float]:
+    """
+    通过ping子进程检测（回退路径）
+
+    Returns:
+        往返时延（毫秒），不通时返回None；无法解析输出时以进程耗时近似
+    """
+    start = time.perf_counter()
+    process = await asyncio.create_subprocess_exec(
+        'ping', '-c', '1', '-W', str(timeout), ip,
+        stdout=asyncio.subprocess.PIPE,
+        stderr=asyncio.subprocess.DEVNULL
+    )
+    try:
+        stdout, _ = await asyncio.wait_for(process.communicate(), timeout=timeout + 2)
+    except asyncio.TimeoutError:
+        process.kill()
+        raise
+    if process.returncode != 0:
+        return None
+    match = _RTT_PATTERN.search(stdout or b"")
+    if match:
+        return float(match.group(1))
+    return (time.perf_counter() - start) * 1000
+
+
+async def ping_host_rtt(ip: str, timeout: int, backend: str = BACKEND_ICMP) -> Optional[float]:
+    """
+    检测主机是否可以ping通，并返回往返时延
+
+    Args:
+        ip: 目标IP地址
+        timeout: 超时时间（秒）
+        backend: 探测后端，icmp（共享套接字引擎）或 subprocess（ping子进程）
+
+    Returns:
+        往返时延（毫秒），不通时返回None
+    """
+    if backend == BACKEND_ICMP and _is_ipv4(ip) and icmp_engine.is_available():
+        return await icmp_engine.ping(ip, timeout)
+    return await subprocess_ping(ip, timeout)
+
+
+async def ping_host(ip: str, timeout: int, backend: str = BACKEND_ICMP) -> bool:
+    """
+    检测主机是否可以ping通
+
+    Args:
+        ip: 目标IP地址
+        timeout: 超时时间（秒）
+        backend: 探测后端，icmp（共享套接字引擎）或 subprocess（ping子进程）
+
+    Returns:
+        是否连通
+    """
+    return await ping_host_rtt(ip, timeout, backend) is not None
@@ -0,0 +1,135 @@
+"""
+游标（keyset）分页
+以 (排序字段, id) 作为游标位置，翻页时按条件 WHERE (sort, id) < (v, i) 直接定位，
+不再使用OFFSET扫描跳过前面的行，深翻页耗时与页码无关。
+游标对客户端不透明，编码为base64url的JSON。
+"""
+import base64
+import json
+from datetime import datetime
+from typing import Any, List, Optional, Tuple
+
+from fastapi import HTTPException, Query
+from tortoise.expressions import Q
+from tortoise.queryset import QuerySet
+
+CURSOR_DIRECTION_NEXT = "next"
+CURSOR_DIRECTION_PREV = "prev"
+
+
+class CursorParams:
+    """
+    游标分页参数（作为依赖注入到列表接口）
+    传入cursor即启用游标分页，cursor为空字符串表示请求第一页；不传则沿用页码分页
+    """
+
+    def __init__(
+        self,
+        cursor: Optional[str] = Query(None, description="分页游标，传空字符串获取第一页；不传则使用页码分页"),
+        direction: str = Query(CURSOR_DIRECTION_NEXT, pattern="^(next|prev)$", description="翻页方向：next 下一页 / prev 上一页"),
+        with_total: bool = Query(False, description="游标分页时是否同时返回总数"),
+    ):
+        self.cursor = cursor
+        self.direction = direction
+        self.with_total = with_total
+
+    @property
+    def enabled(self) -> bool:
+        return self.cursor is not None
+
+
+def _encode_value(value: Any) -> Any:
+    if isinstance(value, datetime):
+        return {"dt": value.isoformat()}
+    return value
+
+
+def _decode_value(value: Any) -> Any:
+    if isinstance(value, dict) and "dt" in value:
+        return datetime.fromisoformat(value["dt"])
+    return value
+
+
+def encode_cursor(sort_value: Any, row_id: int) -> str:
+    """将 (排序值, id) 编码为不透明游标"""
+    raw = json.dumps([_encode_value(sort_value), row_id], separators=(",", ":"))
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str) -> Tuple[Any, int]:
+    """解析游标，格式错误时返回400"""
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        sort_value, row_id = json.loads(base64.urlsafe_b64decode(padded.encode()))
+        if not isinstance(row_id, int):
+            raise ValueError("id必须为整数")
+        return _decode_value(sort_value), row_id
+    except (ValueError, TypeError) as e:
+        raise HTTPException(status_code=400, detail=f"无效的分页游标: {e}")
+
+
+def _keyset_filter(sort_field: str, sort_value: Any, row_id: int, ascending: bool) -> Q:
+    """构造 (sort_field, id) 越过游标位置的条件，ascending为真取更大的一侧，否则取更小的一侧"""
+    op = "gt" if ascending else "lt"
+    if sort_field == "id":
+        return Q(**{f"id__{op}": row_id})
+    return Q(**{f"{sort_field}__{op}": sort_value}) | Q(**{sort_field: sort_value, f"id__{op}": row_id})
+
+
+async def paginate_by_cursor(
+    query: QuerySet,
+    params: CursorParams,
+    page_size: int,
+    sort_field: str = "id",
+    descending: bool = False,
+) -> Tuple[List[Any], dict]:
+    """
+    按 (sort_field, id) 做游标分页
+
+    Args:
+        query: 已应用过滤条件的查询集（可带prefetch_related）
+        params: 游标分页参数
+        page_size: 每页数量
+        sort_field: 排序字段，id作为同值时的次级排序
+        descending: 是否倒序
+
+    Returns:
+        (当前页记录, 分页信息)，分页信息包含 next_cursor/prev_cursor/has_next/has_prev，
+        with_total为真时附带total
+    """
+    total = await query.count() if params.with_total else None
+
+    backward = params.cursor and params.direction == CURSOR_DIRECTION_PREV
+    # 向前翻页时反转排序取游标之前的行，取回后再恢复顺序
+    scan_descending = descending != bool(backward)
+    if params.cursor:
+        sort_value, row_id = decode_cursor(params.cursor)
+        query = query.filter(_keyset_filter(sort_field, sort_value, row_id, ascending=not scan_descending))
+
+    if sort_field == "id":
+        ordering = ["-id" if scan_descending else "id"]
+    else:
+        ordering = [f"-{sort_field}", "-id"] if scan_descending else [sort_field, "id"]
+
+    # 多取一条判断是否还有更多
+    rows = list(await query.order_by(*ordering).limit(page_size + 1))
+    has_more = len(rows) > page_size
+    rows = rows[:page_size]
+    if backward:
+        rows.reverse()
+        has_next, has_prev = True, has_more
+    else:
+        has_next, has_prev = has_more, bool(params.cursor)
+
+    def cursor_of(row) -> str:
+        return encode_cursor(getattr(row, sort_field), row.id)
+
+    page_info = {
+        "next_cursor": cursor_of(rows[-1]) if rows and has_next else None,
+        "prev_cursor": cursor_of(rows[0]) if rows and has_prev else None,
+        "has_next": has_next,
+        "has_prev": has_prev,
+    }
+    if total is not None:
+        page_info["total"] = total
+    return rows, page_info
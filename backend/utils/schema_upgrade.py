@@ -0,0 +1,100 @@
+"""
+已有数据库的结构补齐
+generate_schemas只创建缺失的表，不会给已有的表增加列。
+这里在启动时按模型定义补齐后续新增的列（均可为空，无需回填）和索引，幂等，可重复执行。
+"""
+import logging
+from typing import List, Set, Tuple, Type
+
+from tortoise import connections
+from tortoise.models import Model
+
+from models.admin import LoginLog, OperationLog
+from models.aiToolModel import AIDiagnosisLog
+from models.commandModel import Command
+from models.deviceModel import Device
+from models.vpnModel import VPNConfig
+
+logger = logging.getLogger(__name__)
+
+# 后续版本新增的列：(模型, 字段名)
+ADDED_COLUMNS: List[Tuple[Type[Model], str]] = [
+    (Device, "last_rtt"),
+    (Device, "probe_method"),
+    (Device, "probe_ports"),
+    (VPNConfig, "probe_method"),
+    (VPNConfig, "probe_ports"),
+]
+
+# 后续版本新增的单列索引（字段上的db_index=True）：(模型, 字段名)，游标分页按(字段, id)定位依赖这些索引
+ADDED_INDEXES: List[Tuple[Type[Model], str]] = [
+    (OperationLog, "created_at"),
+    (LoginLog, "login_time"),
+    (Command, "updated_at"),
+    (AIDiagnosisLog, "created_at"),
+]
+
+
+def _quote(dialect: str, name: str) -> str:
+    return f"`{name}`" if dialect == "mysql" else f'"{name}"'
+
+
+async def _existing_columns(conn, table: str) -> Set[str]:
+    dialect = conn.capabilities.dialect
+    if dialect == "sqlite":
+        _, rows = await conn.execute_query(f"PRAGMA table_info({_quote(dialect, table)})")
+        return {row[1] for row in rows}
+    _, rows = await conn.execute_query(
+        "SELECT column_name FROM information_schema.columns WHERE table_name = %s" if dialect == "mysql"
+        else "SELECT column_name FROM information_schema.columns WHERE table_name = $1",
+        [table]
+    )
+    return {row[0] for row in rows}
+
+
+async def add_missing_columns(model: Type[Model], field_names: List[str]) -> List[str]:
+    """为已有的表补齐缺失的列，返回新增的列名"""
+    conn = connections.get(model._meta.default_connection)
+    dialect = conn.capabilities.dialect
+    table = model._meta.db_table
+    existing = await _existing_columns(conn, table)
+    added = []
+    for field_name in field_names:
+        field = model._meta.fields_map[field_name]
+        column = model._meta.fields_db_projection[field_name]
+        if column in existing:
+            continue
+        if not field.null:
+            raise ValueError(f"{table}.{column} 不可为空，需要编写迁移")
+        sql_type = field.get_for_dialect(dialect, "SQL_TYPE")
+        await conn.execute_script(
+            f"ALTER TABLE {_quote(dialect, table)} ADD COLUMN {_quote(dialect, column)} {sql_type} NULL"
+        )
+        added.append(column)
+    return added
+
+
+async def ensure_index(model: Type[Model], field_name: str):
+    """
+    创建单列索引（CREATE INDEX IF NOT EXISTS，SQLite/PostgreSQL）
+    索引名与generate_schemas为db_index字段生成的名称一致，新库上不会重复建索引
+    """
+    conn = connections.get(model._meta.default_connection)
+    column = model._meta.fields_db_projection[field_name]
+    generator = conn.schema_generator(conn)
+    sql = generator._get_index_sql(model, [column], safe=True).strip()
+    await conn.execute_script(sql)
+
+
+async def upgrade_schema():
+    """补齐新增列与索引，在generate_schemas之后、读取这些列之前执行"""
+    by_model = {}
+    for model, field_name in ADDED_COLUMNS:
+        by_model.setdefault(model, []).append(field_name)
+    for model, field_names in by_model.items():
+        added = await add_missing_columns(model, field_names)
+        if added:
+            logger.info(f"已为 {model._meta.db_table} 补齐列: {', '.join(added)}")
+            print(f"✅ 补齐数据库列: {model._meta.db_table}.{', '.join(added)}")
+    for model, field_name in ADDED_INDEXES:
+        await ensure_index(model, field_name)
@@ -0,0 +1,75 @@
+"""
+TCP连接探测
+对ICMP被过滤的网段，通过向管理端口（SSH/Telnet/NETCONF等）发起非阻塞connect判断设备是否可达。
+只完成三次握手即关闭，不读写任何数据，单个探测只占用一个套接字描述符，可大量并发。
+"""
+import asyncio
+import ipaddress
+import logging
+import socket
+import time
+from typing import Iterable, Optional
+
+logger = logging.getLogger(__name__)
+
+
+def _address_family(ip: str) -> int:
+    try:
+        return socket.AF_INET6 if ipaddress.ip_address(ip).version == 6 else socket.AF_INET
+    except ValueError:
+        return socket.AF_INET
+
+
+async def tcp_connect(ip: str, port: int, timeout: float) -> Optional[float]:
+    """
+    对指定端口发起一次TCP连接
+
+    Args:
+        ip: 目标IP地址
+        port: 目标端口
+        timeout: 超时时间（秒）
+
+    Returns:
+        建连耗时（毫秒），连接失败或超时返回None
+    """
+    loop = asyncio.get_running_loop()
+    sock = socket.socket(_address_family(ip), socket.SOCK_STREAM)
+    try:
+        sock.setblocking(False)
+        start = time.perf_counter()
+        try:
+            await asyncio.wait_for(loop.sock_connect(sock, (ip, port)), timeout=timeout)
+        except (asyncio.TimeoutError, OSError) as e:
+            logger.debug(f"TCP连接失败 {ip}:{port}: {e!r}")
+            return None
+        return (time.perf_counter() - start) * 1000
+    finally:
+        sock.close()
+
+
+async def tcp_probe_host(ip: str, ports: Iterable[int], timeout: float) -> Optional[float]:
+    """
+    并发探测多个端口，任一端口建连成功即认为主机可达
+
+    Args:
+        ip: 目标IP地址
+        ports: 端口列表
+        timeout: 超时时间（秒）
+
+    Returns:
+        最先建连成功的端口的建连耗时（毫秒），全部失败返回None
+    """
+    tasks = [asyncio.ensure_future(tcp_connect(ip, port, timeout)) for port in ports]
+    if not tasks:
+        return None
+    try:
+        for finished in asyncio.as_completed(tasks):
+            rtt = await finished
+            if rtt is not None:
+                return rtt
+        return None
+    finally:
+        # 已有端口连通后取消其余连接
+        for task in tasks:
+            if not task.done():
+                task.cancel()
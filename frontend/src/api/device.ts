@@ -184,6 +184,7 @@ export interface DeviceSearchParams {
   ip?: string;
   status?: string;
   config_value?: string;
+  fields?: string; // 返回字段，逗号分隔；不传返回全部字段
 }
 
 export interface DeviceListResponse {